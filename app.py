@@ -1,42 +1,17 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS, cross_origin
 from flasgger import Swagger, swag_from
-from omr.service import process_request
-from audio_converter.audio_service import analyze_audio_request
-import re
-import json
+from audio_converter.usage import usage_requested, usage_stats
+from cors import allowed_origins, origin_check, CORS_ALLOW_METHODS, CORS_ALLOW_HEADERS
+from internal import internal_enabled, internal_token_ok, INTERNAL_TOKEN_HEADER
+from log_config import get_logger, new_request_id, current_request_id
+from profiling import call_with_profile
+from startup import WARMUP_ENABLED, readiness, warmup
+from streaming import STREAM_HEADERS, STREAM_MIMETYPES, requested_stream, stream_lines
 
-app = Flask(__name__)
+logger = get_logger("app")
 
-# Lista de origens permitidas
-allowed_origins = [
-    'https://app.florescer.tec.br',
-    'https://www.florescer.tec.br',
-    'https://api.florescer.tec.br',
-    'https://ia.florescer.tec.br',
-]
-
-# Função para validar origens permitidas (usada pelo flask-cors)
-def origin_check(origin):
-    """Verifica se a origem é permitida"""
-    if not origin:
-        return True  # Permite requisições sem origin (mobile apps, curl, etc)
-    
-    # Verifica lista fixa de produção
-    if origin in allowed_origins:
-        return True
-    
-    # Permite localhost em qualquer porta (desenvolvimento)
-    if re.match(r'^http://localhost:\d+$', origin) or re.match(r'^http://127\.0\.0\.1:\d+$', origin):
-        return True
-    
-    # Permite IPs de rede local
-    if re.match(r'^http://192\.168\.\d+\.\d+:\d+$', origin) or \
-       re.match(r'^http://10\.\d+\.\d+\.\d+:\d+$', origin) or \
-       re.match(r'^http://172\.(1[6-9]|2[0-9]|3[0-1])\.\d+\.\d+:\d+$', origin):
-        return True
-    
-    return False
+app = Flask(__name__)
 
 # Configurar CORS para permitir requisições do frontend
 # Usando função para validar origens dinamicamente via after_request
@@ -79,17 +54,26 @@ def handle_exception(e):
 
 swagger = Swagger(app)
 
+# Id de correlação dos logs: o recebido em X-Request-ID ou um novo
+@app.before_request
+def before_request():
+    new_request_id(request.headers.get('X-Request-ID'))
+
 # Hook after_request para garantir headers CORS em todas as respostas
 @app.after_request
 def after_request(response):
     """Adiciona headers CORS em todas as respostas"""
+    request_id = current_request_id()
+    if request_id:
+        response.headers['X-Request-ID'] = request_id
+
     origin = request.headers.get('Origin')
     
     if origin and origin_check(origin):
         response.headers['Access-Control-Allow-Origin'] = origin
         response.headers['Access-Control-Allow-Credentials'] = 'true'
-        response.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, DELETE, PATCH, OPTIONS'
-        response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization, X-Requested-With, Origin, Accept'
+        response.headers['Access-Control-Allow-Methods'] = CORS_ALLOW_METHODS
+        response.headers['Access-Control-Allow-Headers'] = CORS_ALLOW_HEADERS
         response.headers['Access-Control-Expose-Headers'] = 'Authorization'
     
     # Para requisições OPTIONS (preflight), retornar 200
@@ -105,13 +89,92 @@ def upload_file():
     """Processar imagem OMR"""
     if request.method == 'OPTIONS':
         return '', 200
-    
-    result, status = process_request(
+
+    # Subsistemas carregados na primeira chamada da rota (ver startup.py)
+    from omr.service import process_request
+    result, status = call_with_profile(
+        request.headers, 'processar-omr', process_request,
         file_storage=request.files.get('file'),
-        gabarito_json_str=request.form.get('gabarito')
+        gabarito_json_str=request.form.get('gabarito'),
+        gabarito_id=request.form.get('gabarito_id'),
+        prova_id=request.form.get('prova_id'),
+        aluno_id=request.form.get('aluno_id'),
+        layout_json_str=request.form.get('layout'),
+        formato_resposta=request.form.get('formato_resposta'),
+        modo_captura=request.form.get('modo_captura')
     )
     return jsonify(result), status
 
+def batch_response(result, status, mode):
+    """Resposta de um endpoint em lote: JSON único ou, com ``mode``, em fluxo (streaming.py)."""
+    if mode is None or isinstance(result, dict):
+        return jsonify(result), status
+    return Response(stream_with_context(stream_lines(result, mode)), status=status,
+                    mimetype=STREAM_MIMETYPES[mode], headers=STREAM_HEADERS)
+
+@app.route('/api/processar-omr-lote', methods=['POST', 'OPTIONS'])
+@cross_origin(origins=allowed_origins, supports_credentials=True)
+@swag_from('omr/docs/omr_batch.yml')
+def upload_batch():
+    """Processar várias folhas (turma) com o mesmo gabarito"""
+    if request.method == 'OPTIONS':
+        return '', 200
+
+    mode, error = requested_stream(request.form.get('stream'), request.headers.get('Accept'))
+    if error:
+        return jsonify({"status": "bad_request", "message": error}), 400
+
+    from omr.batch_service import process_batch_request
+    kwargs = dict(
+        file_storages=request.files.getlist('files'),
+        gabarito_json_str=request.form.get('gabarito'),
+        gabarito_id=request.form.get('gabarito_id'),
+        prova_id=request.form.get('prova_id'),
+        alunos_json=request.form.get('alunos'),
+        layout_json_str=request.form.get('layout'),
+        formato_resposta=request.form.get('formato_resposta'),
+        modo_captura=request.form.get('modo_captura')
+    )
+    if mode:
+        # Em fluxo a correção acontece enquanto a resposta é enviada (sem perfil)
+        result, status = process_batch_request(stream=True, **kwargs)
+    else:
+        result, status = call_with_profile(request.headers, 'processar-omr-lote', process_batch_request, **kwargs)
+    return batch_response(result, status, mode)
+
+@app.route('/api/gabaritos', methods=['POST', 'OPTIONS'])
+@cross_origin(origins=allowed_origins, supports_credentials=True)
+@swag_from('omr/docs/answer_key_register.yml')
+def register_answer_key():
+    """Registrar um gabarito para correções por id"""
+    if request.method == 'OPTIONS':
+        return '', 200
+
+    from omr.answer_keys import registrar_gabarito
+    result, status = registrar_gabarito(request.form.get('gabarito'), request.form.get('layout'))
+    return jsonify(result), status
+
+@app.route('/api/gabaritos/<gabarito_id>', methods=['GET'])
+@cross_origin(origins=allowed_origins, supports_credentials=True)
+@swag_from('omr/docs/answer_key_get.yml')
+def get_answer_key(gabarito_id):
+    """Consultar um gabarito registrado"""
+    from omr.answer_keys import consultar_gabarito
+    result, status = consultar_gabarito(gabarito_id)
+    return jsonify(result), status
+
+@app.route('/api/analise-itens', methods=['POST', 'OPTIONS'])
+@cross_origin(origins=allowed_origins, supports_credentials=True)
+@swag_from('omr/docs/item_analysis.yml')
+def item_analysis():
+    """Análise de itens de folhas já corrigidas (enviadas no corpo)"""
+    if request.method == 'OPTIONS':
+        return '', 200
+
+    from omr.item_analysis import analisar_folhas_request
+    result, status = analisar_folhas_request(request.get_json(silent=True))
+    return jsonify(result), status
+
 @app.route('/api/analisar-audio', methods=['POST', 'OPTIONS'])
 @cross_origin(origins=allowed_origins, supports_credentials=True)
 @swag_from('omr/docs/audio_analyze.yml')
@@ -120,42 +183,134 @@ def analyze_audio():
     if request.method == 'OPTIONS':
         return '', 200
 
-    # Logs de depuração na rota
-    from datetime import datetime
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
-    print(f"[{timestamp}] [ROUTE_DEBUG] Recebida requisição POST /api/analisar-audio")
-    print(f"[{timestamp}] [ROUTE_DEBUG] Content-Type: {request.content_type}")
-    print(f"[{timestamp}] [ROUTE_DEBUG] FILES keys: {list(request.files.keys())}")
-    print(f"[{timestamp}] [ROUTE_DEBUG] FORM keys: {list(request.form.keys())}")
-    
+    from audio_converter.audio_service import analyze_audio_request
     audio_file = request.files.get('audio')
     texto = request.form.get('texto')
-    
-    if audio_file:
-        print(f"[{timestamp}] [ROUTE_DEBUG] Arquivo recebido: {audio_file.filename}, tamanho: {audio_file.content_length if hasattr(audio_file, 'content_length') else 'N/A'}")
-    else:
-        print(f"[{timestamp}] [ROUTE_DEBUG] Nenhum arquivo de áudio encontrado")
-    
-    if texto:
-        print(f"[{timestamp}] [ROUTE_DEBUG] Texto de referência recebido, tamanho: {len(texto)} caracteres")
-        print(f"[{timestamp}] [ROUTE_DEBUG] Texto preview: {texto[:100]}..." if len(texto) > 100 else f"[{timestamp}] [ROUTE_DEBUG] Texto: {texto}")
-    else:
-        print(f"[{timestamp}] [ROUTE_DEBUG] Nenhum texto de referência fornecido")
-    
-    result, status = analyze_audio_request(
+
+    # Logs de depuração na rota (formatados só com LOG_LEVEL=DEBUG)
+    logger.debug(
+        "Recebida requisição POST /api/analisar-audio",
+        extra={"data": {
+            "content_type": request.content_type,
+            "files": list(request.files.keys()),
+            "form": list(request.form.keys()),
+            "filename": audio_file.filename if audio_file else None,
+            "reference_text_length": len(texto) if texto else 0,
+        }},
+    )
+
+    result, status = call_with_profile(
+        request.headers, 'analisar-audio', analyze_audio_request,
         file_storage=audio_file,
-        reference_text=texto
+        reference_text=texto,
+        include_usage=usage_requested(request.form.get('incluir_uso'))
     )
-    
-    print(f"[{timestamp}] [ROUTE_DEBUG] Resultado retornado, status: {status}")
-    print(f"[{timestamp}] [ROUTE_DEBUG] Resultado: {json.dumps(result, ensure_ascii=False, default=str)[:500]}...")
-    
+
+    logger.debug("POST /api/analisar-audio -> %s (%s)", status, result.get("status"))
     return jsonify(result), status
 
+@app.route('/api/analisar-audio-lote', methods=['POST', 'OPTIONS'])
+@cross_origin(origins=allowed_origins, supports_credentials=True)
+@swag_from('omr/docs/audio_batch.yml')
+def analyze_audio_batch():
+    """Analisar a leitura de vários alunos (turma) em paralelo"""
+    if request.method == 'OPTIONS':
+        return '', 200
+
+    mode, error = requested_stream(request.form.get('stream'), request.headers.get('Accept'))
+    if error:
+        return jsonify({"status": "bad_request", "message": error}), 400
+
+    from audio_converter.batch_service import analyze_audio_batch_request
+    result, status = analyze_audio_batch_request(
+        file_storages=request.files.getlist('audios'),
+        reference_text=request.form.get('texto'),
+        reference_texts_json=request.form.get('textos'),
+        concurrency=request.form.get('concorrencia'),
+        include_usage=usage_requested(request.form.get('incluir_uso')),
+        stream=mode is not None
+    )
+    return batch_response(result, status, mode)
+
+def internal_denied():
+    """Resposta de erro se o endpoint interno estiver desabilitado ou o token for inválido."""
+    if not internal_enabled():
+        return jsonify({"error": "Not Found", "message": "Endpoint interno desabilitado", "code": 404}), 404
+    if not internal_token_ok(request.headers.get(INTERNAL_TOKEN_HEADER)):
+        return jsonify({"status": "unauthorized", "message": "Token interno inválido"}), 401
+    return None
+
+@app.route('/api/interno/uso-openai', methods=['GET'])
+@swag_from('omr/docs/openai_usage.yml')
+def openai_usage():
+    """Estatísticas internas de tempo, tokens e custo das chamadas à OpenAI"""
+    denied = internal_denied()
+    if denied:
+        return denied
+
+    try:
+        window = int(request.args.get('janela', 300))
+        since = int(request.args.get('desde', 3600))
+    except ValueError:
+        return jsonify({"status": "bad_request", "message": "Os parâmetros 'janela' e 'desde' devem ser inteiros (segundos)."}), 400
+    if window <= 0 or since <= 0:
+        return jsonify({"status": "bad_request", "message": "Os parâmetros 'janela' e 'desde' devem ser positivos."}), 400
+
+    return jsonify({"status": "success", **usage_stats(window_seconds=window, since_seconds=since)}), 200
+
+@app.route('/api/interno/resultados', methods=['GET'])
+@swag_from('omr/docs/results_list.yml')
+def omr_results():
+    """Folhas corrigidas gravadas, por prova e/ou aluno"""
+    denied = internal_denied()
+    if denied:
+        return denied
+
+    from omr.results_store import listar_resultados_request
+    result, status = listar_resultados_request(request.args)
+    return jsonify(result), status
+
+@app.route('/api/interno/resultados/analise', methods=['GET'])
+@swag_from('omr/docs/results_analysis.yml')
+def omr_results_analysis():
+    """Análise de itens das folhas gravadas de uma prova"""
+    denied = internal_denied()
+    if denied:
+        return denied
+
+    from omr.item_analysis import analisar_prova_request
+    result, status = analisar_prova_request(request.args)
+    return jsonify(result), status
+
+@app.route('/api/interno/resultados/exportar', methods=['GET'])
+@swag_from('omr/docs/results_export.yml')
+def export_omr_results():
+    """Exportar as folhas gravadas em CSV ou colunar (.npz)"""
+    denied = internal_denied()
+    if denied:
+        return denied
+
+    from omr.results_store import exportar_resultados_request
+    result, status = exportar_resultados_request(request.args)
+    if status != 200:
+        return jsonify(result), status
+    content, mimetype, filename = result
+    return Response(content, mimetype=mimetype,
+                    headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
 @app.route('/')
 @swag_from('omr/docs/health.yml')
 def index():
     return "API de Processamento OMR - Envie uma imagem para /api/processar-omr (docs em /apidocs)"
 
+@app.route('/pronto')
+@swag_from('omr/docs/ready.yml')
+def ready():
+    """Prontidão do worker (aquecimento concluído)"""
+    state = readiness()
+    return jsonify(state), 200 if state["status"] == "ready" else 503
+
 if __name__ == '__main__':
+    if WARMUP_ENABLED:
+        warmup()
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,160 @@
+"""
+Servidor ASGI para a análise de áudio, ao lado do app Flask.
+
+A rota ``/api/analisar-audio`` daqui usa o cliente assíncrono da OpenAI: um
+processo do uvicorn atende centenas de análises em andamento, já que quase
+todo o tempo é espera de rede. O OMR (CPU) continua no Flask/gunicorn.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5001
+
+Campos do formulário, respostas e códigos HTTP são os mesmos do Flask.
+"""
+import asyncio
+import io
+import json
+import os
+
+from werkzeug.formparser import FormDataParser
+from werkzeug.http import parse_options_header
+
+from audio_converter.async_audio_service import analyze_audio_request_async
+from audio_converter.usage import usage_requested
+from cors import origin_check, CORS_ALLOW_METHODS, CORS_ALLOW_HEADERS
+from log_config import new_request_id, current_request_id
+
+# Tamanho máximo do corpo da requisição (o upload inteiro fica em memória)
+MAX_UPLOAD_BYTES = int(float(os.getenv("ASGI_MAX_UPLOAD_MB", "50")) * 1024 * 1024)
+
+HEALTH_MESSAGE = "API de Processamento OMR - Envie uma imagem para /api/processar-omr (docs em /apidocs)"
+
+
+def _json_body(data) -> bytes:
+    # Mesma serialização do jsonify do Flask (chaves ordenadas, ASCII, compacto)
+    return (json.dumps(data, ensure_ascii=True, sort_keys=True, separators=(",", ":")) + "\n").encode("ascii")
+
+
+def _cors_headers(origin):
+    """Cabeçalhos CORS equivalentes ao after_request do app Flask."""
+    if not origin or not origin_check(origin):
+        return []
+    return [
+        (b"access-control-allow-origin", origin.encode("latin-1")),
+        (b"access-control-allow-credentials", b"true"),
+        (b"access-control-allow-methods", CORS_ALLOW_METHODS.encode("latin-1")),
+        (b"access-control-allow-headers", CORS_ALLOW_HEADERS.encode("latin-1")),
+        (b"access-control-expose-headers", b"Authorization"),
+    ]
+
+
+async def _send(send, status, body: bytes, content_type: bytes, origin) -> None:
+    headers = [
+        (b"content-type", content_type),
+        (b"content-length", str(len(body)).encode("latin-1")),
+    ] + _cors_headers(origin)
+    request_id = current_request_id()
+    if request_id:
+        headers.append((b"x-request-id", request_id.encode("latin-1")))
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _send_json(send, data, status, origin) -> None:
+    await _send(send, status, _json_body(data), b"application/json", origin)
+
+
+async def _send_error(send, status, name, message, origin) -> None:
+    # Mesmo formato do handler global de erros do Flask
+    await _send_json(send, {"error": name, "message": message, "code": status}, status, origin)
+
+
+async def _read_body(receive, limit: int):
+    """Lê o corpo inteiro; None se passar de ``limit`` bytes."""
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            raise ConnectionError("Cliente desconectou durante o upload")
+        body = message.get("body", b"")
+        size += len(body)
+        if size > limit:
+            return None
+        chunks.append(body)
+        if not message.get("more_body", False):
+            return b"".join(chunks)
+
+
+def _parse_form(body: bytes, content_type: str):
+    """Lê um ``multipart/form-data`` (ou urlencoded) com o parser do werkzeug."""
+    mimetype, options = parse_options_header(content_type)
+    _, form, files = FormDataParser().parse(io.BytesIO(body), mimetype, len(body), options)
+    return form, files
+
+
+async def _analyze_audio(receive, send, headers, origin) -> None:
+    content_length = headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > MAX_UPLOAD_BYTES:
+        await _send_error(send, 413, "Request Entity Too Large",
+                          "The data value transmitted exceeds the capacity limit.", origin)
+        return
+
+    body = await _read_body(receive, MAX_UPLOAD_BYTES)
+    if body is None:
+        await _send_error(send, 413, "Request Entity Too Large",
+                          "The data value transmitted exceeds the capacity limit.", origin)
+        return
+
+    form, files = await asyncio.to_thread(_parse_form, body, headers.get("content-type", ""))
+    result, status = await analyze_audio_request_async(
+        file_storage=files.get("audio"),
+        reference_text=form.get("texto"),
+        include_usage=usage_requested(form.get("incluir_uso")),
+    )
+    await _send_json(send, result, status, origin)
+
+
+async def _lifespan(receive, send) -> None:
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    """Aplicação ASGI (``uvicorn asgi:app``)."""
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope["headers"]}
+    origin = headers.get("origin")
+    new_request_id(headers.get("x-request-id"))
+    path = scope["path"].rstrip("/") or "/"
+    method = scope["method"]
+
+    try:
+        if path == "/api/analisar-audio":
+            if method == "OPTIONS":
+                await _send(send, 200, b"", b"text/html; charset=utf-8", origin)
+            elif method == "POST":
+                await _analyze_audio(receive, send, headers, origin)
+            else:
+                await _send_error(send, 405, "Method Not Allowed",
+                                  "The method is not allowed for the requested URL.", origin)
+        elif path == "/" and method == "GET":
+            await _send(send, 200, HEALTH_MESSAGE.encode("utf-8"), b"text/html; charset=utf-8", origin)
+        else:
+            await _send_error(send, 404, "Not Found",
+                              "The requested URL was not found on the server. "
+                              "If you entered the URL manually please check your spelling and try again.",
+                              origin)
+    except ConnectionError:
+        # Cliente foi embora: não há a quem responder
+        return
+    except Exception:
+        await _send_error(send, 500, "Internal Server Error", "An internal error occurred", origin)
@@ -0,0 +1,354 @@
+"""
+Alinhamento local e determinístico entre a transcrição e o texto de referência.
+
+Substitui a comparação palavra a palavra que antes era pedida ao GPT: os dois
+textos são normalizados (minúsculas, sem acentos, sem pontuação, números por
+extenso) e alinhados por distância de edição em nível de palavra. O resultado
+preenche o bloco ``alignment`` da avaliação:
+
+    words_total, words_read, words_missing, words_inserted,
+    words_substituted, accuracy_percent
+
+A programação dinâmica é vetorizada com NumPy linha a linha e restrita a uma
+faixa em torno da diagonal, então passagens longas custam O(n * faixa) em vez
+de O(n * m).
+"""
+import re
+import unicodedata
+from typing import Optional, Dict, Any, List, Tuple
+
+import numpy as np
+
+# Largura mínima da faixa da programação dinâmica (em palavras) além da
+# diferença de tamanho entre os textos. Para textos curtos a faixa cobre a
+# matriz inteira e o alinhamento é exato.
+MIN_BAND = 64
+BAND_RATIO = 0.15
+
+_INF = np.iinfo(np.int32).max // 2
+
+_UNIDADES = [
+    "zero", "um", "dois", "três", "quatro", "cinco", "seis", "sete", "oito",
+    "nove", "dez", "onze", "doze", "treze", "quatorze", "quinze", "dezesseis",
+    "dezessete", "dezoito", "dezenove",
+]
+_DEZENAS = [
+    "", "", "vinte", "trinta", "quarenta", "cinquenta", "sessenta", "setenta",
+    "oitenta", "noventa",
+]
+_CENTENAS = [
+    "", "cento", "duzentos", "trezentos", "quatrocentos", "quinhentos",
+    "seiscentos", "setecentos", "oitocentos", "novecentos",
+]
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def _ate_mil(n: int) -> str:
+    """Escreve por extenso um número entre 0 e 999."""
+    if n < 20:
+        return _UNIDADES[n]
+    if n < 100:
+        dezena, unidade = divmod(n, 10)
+        return _DEZENAS[dezena] + (f" e {_UNIDADES[unidade]}" if unidade else "")
+    if n == 100:
+        return "cem"
+    centena, resto = divmod(n, 100)
+    return _CENTENAS[centena] + (f" e {_ate_mil(resto)}" if resto else "")
+
+
+def numero_por_extenso(n: int) -> str:
+    """
+    Escreve um inteiro não negativo por extenso em português (até 999.999.999).
+
+    Ex.: 24 -> "vinte e quatro", 1500 -> "mil e quinhentos".
+    Números maiores são devolvidos como dígitos.
+    """
+    if n < 1000:
+        return _ate_mil(n)
+    if n >= 1_000_000_000:
+        return str(n)
+
+    partes = []
+    milhoes, resto = divmod(n, 1_000_000)
+    milhares, unidades = divmod(resto, 1000)
+    if milhoes:
+        partes.append("um milhão" if milhoes == 1 else f"{_ate_mil(milhoes)} milhões")
+    if milhares:
+        partes.append("mil" if milhares == 1 else f"{_ate_mil(milhares)} mil")
+    if unidades:
+        # "mil e quinhentos", "mil e vinte", mas "mil duzentos e dez"
+        conector = " e " if unidades < 100 or unidades % 100 == 0 else " "
+        return " ".join(partes) + conector + _ate_mil(unidades)
+    return " ".join(partes)
+
+
+def _remover_acentos(texto: str) -> str:
+    decomposto = unicodedata.normalize("NFD", texto)
+    return "".join(c for c in decomposto if unicodedata.category(c) != "Mn")
+
+
+def normalize_word(word: str) -> List[str]:
+    """
+    Normaliza uma palavra "de superfície" em zero ou mais tokens comparáveis.
+
+    Números viram palavras por extenso (podendo gerar vários tokens) e
+    pontuação separa tokens, como em "guarda-chuva" -> ["guarda", "chuva"].
+    """
+    tokens = []
+    for parte in _WORD_RE.findall(word.lower()):
+        parte = parte.replace("_", "")
+        if not parte:
+            continue
+        if parte.isdigit():
+            tokens.extend(numero_por_extenso(int(parte)).split())
+        else:
+            tokens.append(parte)
+    return [_remover_acentos(t) for t in tokens]
+
+
+def tokenize(text: Optional[str]) -> Tuple[List[str], List[int], List[str]]:
+    """
+    Quebra o texto em tokens normalizados.
+
+    Returns:
+        (tokens, índice da palavra original de cada token, palavras originais)
+    """
+    tokens: List[str] = []
+    owners: List[int] = []
+    surface: List[str] = []
+    for raw in (text or "").split():
+        normalizados = normalize_word(raw)
+        if not normalizados:
+            continue
+        idx = len(surface)
+        surface.append(raw.strip(".,;:!?\"'()[]{}«»“”‘’…-–—"))
+        tokens.extend(normalizados)
+        owners.extend([idx] * len(normalizados))
+    return tokens, owners, surface
+
+
+def _banded_edit_distance(ref_ids: np.ndarray, hyp_ids: np.ndarray, band: int):
+    """
+    Calcula a matriz de distância de edição restrita a uma faixa diagonal.
+
+    Cada linha i guarda apenas as colunas [lo_i, hi_i]. A inserção (vizinho à
+    esquerda na mesma linha) é resolvida sem laço com o truque
+    D[j] = j + min_{k<=j}(T[k] - k), via ``np.minimum.accumulate``.
+    """
+    n, m = len(ref_ids), len(hyp_ids)
+    rows: List[np.ndarray] = []
+    los: List[int] = []
+
+    hi0 = min(m, band)
+    rows.append(np.arange(0, hi0 + 1, dtype=np.int64))
+    los.append(0)
+
+    for i in range(1, n + 1):
+        centro = (i * m) // n if n else 0
+        lo = max(0, centro - band)
+        hi = min(m, centro + band)
+        cols = np.arange(lo, hi + 1)
+
+        prev, plo = rows[-1], los[-1]
+        up = _row_values(prev, plo, cols) + 1
+        diag = _row_values(prev, plo, cols - 1)
+        valid = cols >= 1
+        cost = np.ones(cols.shape, dtype=np.int64)
+        cost[valid] = hyp_ids[cols[valid] - 1] != ref_ids[i - 1]
+        diag = np.where(valid, diag + cost, _INF)
+
+        tmp = np.minimum(up, diag)
+        row = np.minimum.accumulate(tmp - cols) + cols
+        rows.append(np.minimum(row, _INF))
+        los.append(lo)
+
+    return rows, los
+
+
+def _row_values(row: np.ndarray, lo: int, cols: np.ndarray) -> np.ndarray:
+    """Lê valores de uma linha da faixa; fora dela devolve "infinito"."""
+    idx = cols - lo
+    out = np.full(cols.shape, _INF, dtype=np.int64)
+    ok = (idx >= 0) & (idx < len(row))
+    out[ok] = row[idx[ok]]
+    return out
+
+
+def _value(rows, los, i: int, j: int) -> int:
+    if j < 0:
+        return _INF
+    idx = j - los[i]
+    if 0 <= idx < len(rows[i]):
+        return int(rows[i][idx])
+    return _INF
+
+
+def _backtrace(rows, los, ref_ids, hyp_ids) -> List[Tuple[str, Optional[int], Optional[int]]]:
+    """Reconstrói as operações (match, sub, del, ins) do fim para o início."""
+    i, j = len(ref_ids), len(hyp_ids)
+    ops = []
+    while i > 0 or j > 0:
+        atual = _value(rows, los, i, j)
+        if i > 0 and j > 0:
+            igual = ref_ids[i - 1] == hyp_ids[j - 1]
+            if _value(rows, los, i - 1, j - 1) + (0 if igual else 1) == atual:
+                ops.append(("match" if igual else "sub", i - 1, j - 1))
+                i, j = i - 1, j - 1
+                continue
+        if i > 0 and _value(rows, los, i - 1, j) + 1 == atual:
+            ops.append(("del", i - 1, None))
+            i -= 1
+            continue
+        ops.append(("ins", None, j - 1))
+        j -= 1
+    ops.reverse()
+    return ops
+
+
+def align_words(reference_text: Optional[str], transcribed_text: Optional[str]) -> Dict[str, Any]:
+    """
+    Alinha a transcrição com o texto de referência.
+
+    Sem texto de referência, o bloco é preenchido apenas com a contagem de
+    palavras da transcrição (como o GPT fazia antes).
+
+    Returns:
+        Dicionário no formato do campo ``alignment`` da avaliação.
+    """
+    hyp_tokens, hyp_owner, hyp_surface = tokenize(transcribed_text)
+
+    if not reference_text or not reference_text.strip():
+        total = len(hyp_surface)
+        return {
+            "words_total": total,
+            "words_read": total,
+            "words_missing": [],
+            "words_inserted": [],
+            "words_substituted": [],
+            "accuracy_percent": 100.0 if total else 0.0,
+        }
+
+    ref_tokens, ref_owner, ref_surface = tokenize(reference_text)
+
+    # Vocabulário comum -> inteiros, para comparar com NumPy
+    vocab: Dict[str, int] = {}
+    ref_ids = np.array([vocab.setdefault(t, len(vocab)) for t in ref_tokens], dtype=np.int64)
+    hyp_ids = np.array([vocab.setdefault(t, len(vocab)) for t in hyp_tokens], dtype=np.int64)
+
+    n, m = len(ref_ids), len(hyp_ids)
+    band = max(abs(n - m) + MIN_BAND, int(BAND_RATIO * max(n, m)))
+    rows, los = _banded_edit_distance(ref_ids, hyp_ids, band)
+    ops = _backtrace(rows, los, ref_ids, hyp_ids)
+
+    # Uma palavra da referência é "lida" se todos os seus tokens casaram
+    ref_errors = [False] * len(ref_surface)
+    missing, inserted, substituted = [], [], []
+    vistos = set()
+    for op, ri, hi in ops:
+        if op == "match":
+            continue
+        if ri is not None:
+            ref_errors[ref_owner[ri]] = True
+        if op == "del":
+            chave = ("del", ref_owner[ri])
+            if chave not in vistos:
+                missing.append(ref_surface[ref_owner[ri]])
+        elif op == "ins":
+            chave = ("ins", hyp_owner[hi])
+            if chave not in vistos:
+                inserted.append(hyp_surface[hyp_owner[hi]])
+        else:
+            chave = ("sub", ref_owner[ri], hyp_owner[hi])
+            if chave not in vistos:
+                substituted.append({
+                    "expected": ref_surface[ref_owner[ri]],
+                    "read": hyp_surface[hyp_owner[hi]],
+                })
+        vistos.add(chave)
+
+    total = len(ref_surface)
+    read = total - sum(ref_errors)
+    return {
+        "words_total": total,
+        "words_read": read,
+        "words_missing": missing,
+        "words_inserted": inserted,
+        "words_substituted": substituted,
+        "accuracy_percent": round(read / total * 100, 1) if total else 0.0,
+    }
+
+
+def alignment_progress(reference_text: Optional[str], transcribed_text: Optional[str]) -> Dict[str, Any]:
+    """
+    Progresso parcial da leitura, para transcrições ainda incompletas.
+
+    A transcrição é alinhada apenas com o início da referência (um pouco
+    mais longo que ela), e as palavras depois do último acerto não contam
+    como omitidas: o aluno ainda não chegou lá.
+
+    Returns:
+        ``words_total``, ``reference_position`` (palavras da referência já
+        alcançadas), ``progress_percent``, ``words_read`` (corretas até a
+        posição) e ``accuracy_percent`` (sobre as palavras já alcançadas).
+    """
+    ref_tokens, ref_owner, ref_surface = tokenize(reference_text)
+    hyp_tokens, _, _ = tokenize(transcribed_text)
+    total = len(ref_surface)
+    if not ref_tokens or not hyp_tokens:
+        return {"words_total": total, "reference_position": 0, "progress_percent": 0.0,
+                "words_read": 0, "accuracy_percent": 0.0}
+
+    m = len(hyp_tokens)
+    prefix = ref_tokens[:m + max(5, m // 10)]
+    vocab: Dict[str, int] = {}
+    ref_ids = np.array([vocab.setdefault(t, len(vocab)) for t in prefix], dtype=np.int64)
+    hyp_ids = np.array([vocab.setdefault(t, len(vocab)) for t in hyp_tokens], dtype=np.int64)
+
+    band = max(abs(len(ref_ids) - m) + MIN_BAND, int(BAND_RATIO * max(len(ref_ids), m)))
+    rows, los = _banded_edit_distance(ref_ids, hyp_ids, band)
+    # O fim da leitura é o prefixo da referência mais próximo da transcrição
+    # inteira (o restante ainda não foi lido e não custa nada)
+    costs = [_value(rows, los, i, m) for i in range(len(ref_ids) + 1)]
+    end = int(np.argmin(costs))
+    if end < len(ref_ids):
+        ref_ids = ref_ids[:end]
+        rows, los = _banded_edit_distance(ref_ids, hyp_ids, band)
+    ops = _backtrace(rows, los, ref_ids, hyp_ids)
+
+    matched = [ri for op, ri, _ in ops if op == "match"]
+    if not matched:
+        return {"words_total": total, "reference_position": 0, "progress_percent": 0.0,
+                "words_read": 0, "accuracy_percent": 0.0}
+    position = ref_owner[matched[-1]] + 1
+
+    ref_errors = [False] * position
+    for op, ri, _ in ops:
+        if op != "match" and ri is not None and ref_owner[ri] < position:
+            ref_errors[ref_owner[ri]] = True
+    read = position - sum(ref_errors)
+    return {
+        "words_total": total,
+        "reference_position": position,
+        "progress_percent": round(position / total * 100, 1),
+        "words_read": read,
+        "accuracy_percent": round(read / position * 100, 1),
+    }
+
+
+def alignment_summary(alignment: Dict[str, Any], max_examples: int = 10) -> str:
+    """Resumo compacto do alinhamento para o prompt do GPT."""
+    linhas = [
+        f"Precisão da leitura: {alignment['accuracy_percent']:.1f}% "
+        f"({alignment['words_read']} de {alignment['words_total']} palavras corretas)",
+        f"Palavras omitidas: {len(alignment['words_missing'])}",
+        f"Palavras inseridas: {len(alignment['words_inserted'])}",
+        f"Palavras trocadas: {len(alignment['words_substituted'])}",
+    ]
+    if alignment["words_missing"]:
+        linhas.append("Exemplos de omissões: " + ", ".join(alignment["words_missing"][:max_examples]))
+    if alignment["words_substituted"]:
+        linhas.append("Exemplos de trocas: " + ", ".join(
+            f"{s['expected']} -> {s['read']}" for s in alignment["words_substituted"][:max_examples]
+        ))
+    return "\n".join(linhas)
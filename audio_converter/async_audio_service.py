@@ -0,0 +1,237 @@
+"""
+Versão assíncrona da análise de leitura, servida pelo ASGI (``asgi.py``).
+
+A análise de áudio é quase só espera de rede (Whisper + GPT); com o
+``AsyncOpenAI`` um único processo mantém centenas de análises em andamento,
+em vez de ocupar um worker síncrono do gunicorn por análise. As etapas de
+CPU (VAD, divisão em trechos, alinhamento, métricas de ritmo) rodam em
+threads para não travar o event loop.
+
+Validações, cache, limites de taxa, prompt e formato da resposta são os
+mesmos de ``audio_service.analyze_audio_request``.
+"""
+import asyncio
+import os
+from typing import Optional, Tuple, Dict, Any, List
+
+from openai import AsyncOpenAI
+
+from .audio_service import (
+    CHUNK_CONCURRENCY,
+    EVALUATION_MODEL,
+    WHISPER_MODEL,
+    _build_success_response,
+    _check_audio_filename,
+    _error_response,
+    _estimate_tokens,
+    _evaluation_cache_key,
+    _evaluation_params,
+    _finish_transcription,
+    _get_api_key,
+    _get_cached_evaluation,
+    _local_analysis,
+    _log_debug,
+    _log_retry,
+    _parse_evaluation,
+    _preflight,
+    _prepare_audio,
+    _scheduler,
+    _split_audio,
+    _store_evaluation,
+    _transcription_cache,
+    _transcription_cache_key,
+    _transcription_params,
+)
+from .chunking import stitch_transcriptions
+from .usage import track_call, usage_request
+
+# Um cliente por chave: o pool de conexões HTTP é reaproveitado entre as análises
+_clients: Dict[str, AsyncOpenAI] = {}
+
+
+def _get_client(api_key: str) -> AsyncOpenAI:
+    client = _clients.get(api_key)
+    if client is None:
+        client = AsyncOpenAI(api_key=api_key, max_retries=0)
+        _clients[api_key] = client
+    return client
+
+
+async def _transcribe_audio_async(client: AsyncOpenAI, file_data: bytes, filename: str) -> Dict[str, Any]:
+    """Envia o áudio ao Whisper; a extensão de ``filename`` indica o formato."""
+    _log_debug("Iniciando transcrição com Whisper (async)", {"filename": filename})
+    with track_call(WHISPER_MODEL, "transcription") as call:
+        transcription = await _scheduler.call_async(
+            WHISPER_MODEL,
+            lambda: client.audio.transcriptions.create(
+                file=(filename, file_data), **_transcription_params()
+            ),
+            on_retry=call.retry_hook(_log_retry),
+        )
+        call.audio_seconds = getattr(transcription, "duration", None) or 0.0
+    return transcription.model_dump(exclude_none=True)
+
+
+async def _transcribe_chunks_async(client: AsyncOpenAI, chunks: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Equivalente assíncrono de ``chunking.transcribe_chunks``."""
+    semaphore = asyncio.Semaphore(max(1, CHUNK_CONCURRENCY))
+
+    async def transcribe(chunk: Dict[str, Any]) -> Dict[str, Any]:
+        # Sem novas tentativas aqui: o agendador já repete os erros transitórios
+        async with semaphore:
+            return await _transcribe_audio_async(client, chunk["audio"], "trecho.wav")
+
+    # gather propaga a primeira falha definitiva (sem ExceptionGroup), para
+    # que o erro vire a mesma resposta da versão síncrona
+    results = await asyncio.gather(*(transcribe(chunk) for chunk in chunks))
+    return stitch_transcriptions(results, [chunk["offset"] for chunk in chunks],
+                                 chunks[-1]["offset"] + chunks[-1]["duration"])
+
+
+async def _preprocess_and_transcribe_async(
+    client: AsyncOpenAI, file_data: bytes, filename: str
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    audio_data, trim, preprocessing = await asyncio.to_thread(_prepare_audio, file_data)
+    chunks = await asyncio.to_thread(_split_audio, audio_data)
+
+    if chunks:
+        _log_debug(
+            "Transcrevendo áudio em trechos",
+            {"chunks": len(chunks), "concurrency": CHUNK_CONCURRENCY},
+        )
+        transcription = await _transcribe_chunks_async(client, chunks)
+        chunk_count = len(chunks)
+    else:
+        transcription = await _transcribe_audio_async(client, audio_data, filename)
+        chunk_count = 1
+
+    transcription = _finish_transcription(transcription, trim, chunk_count, preprocessing)
+    return transcription, preprocessing
+
+
+async def _transcribe_with_cache_async(
+    client: AsyncOpenAI, file_data: bytes, filename: str
+) -> Tuple[Dict[str, Any], str, Dict[str, Any]]:
+    """Mesmo contrato de ``audio_service._transcribe_with_cache``."""
+    if _transcription_cache is None:
+        transcription, preprocessing = await _preprocess_and_transcribe_async(client, file_data, filename)
+        return transcription, "disabled", preprocessing
+
+    key = _transcription_cache_key(file_data)
+    # O backend em disco faz I/O de arquivo: fora do event loop
+    cached = await asyncio.to_thread(_transcription_cache.get, key)
+    if cached is not None:
+        _log_debug("Transcrição encontrada no cache", {"key": key})
+        return cached["transcription"], "hit", cached["preprocessing"]
+
+    transcription, preprocessing = await _preprocess_and_transcribe_async(client, file_data, filename)
+    await asyncio.to_thread(
+        _transcription_cache.set,
+        key, {"transcription": transcription, "preprocessing": preprocessing},
+    )
+    return transcription, "miss", preprocessing
+
+
+async def analyze_audio_request_async(
+    file_storage,
+    reference_text: Optional[str],
+    include_usage: bool = False,
+    endpoint: str = "analisar-audio-asgi",
+) -> Tuple[Dict[str, Any], int]:
+    """
+    Analisa áudio de leitura sem bloquear o event loop.
+
+    Recebe os mesmos argumentos e devolve a mesma resposta (corpo, status
+    HTTP) de ``analyze_audio_request``.
+    """
+    with usage_request(endpoint) as usage:
+        result, status = await _analyze_audio_async(file_storage, reference_text)
+    if include_usage:
+        result["usage"] = usage.summary()
+    return result, status
+
+
+async def _analyze_audio_async(
+    file_storage, reference_text: Optional[str]
+) -> Tuple[Dict[str, Any], int]:
+    """Corpo de ``analyze_audio_request_async``."""
+    _log_debug(
+        "Iniciando análise de áudio (async)",
+        {
+            "has_file_storage": bool(file_storage),
+            "filename": file_storage.filename if file_storage else None,
+            "has_reference_text": bool(reference_text),
+            "reference_text_length": len(reference_text) if reference_text else 0,
+        },
+    )
+
+    if not file_storage:
+        _log_debug("Arquivo não fornecido")
+        return {"status": "no_file", "message": "Nenhum arquivo de áudio enviado"}, 200
+
+    invalid = _check_audio_filename(file_storage.filename)
+    if invalid:
+        return invalid
+
+    api_key, config_error = _get_api_key()
+    if config_error:
+        return config_error
+
+    try:
+        client = _get_client(api_key)
+        filename = os.path.basename(file_storage.filename)
+
+        # Uploads grandes ficam num arquivo temporário do werkzeug
+        file_storage.seek(0)
+        file_data = await asyncio.to_thread(file_storage.read)
+        _log_debug(
+            "Arquivo de áudio lido",
+            {"filename": filename, "file_size": len(file_data)},
+        )
+
+        rejected = _preflight(file_data, filename)
+        if rejected:
+            return rejected
+
+        transcription, transcription_cache_status, preprocessing = await _transcribe_with_cache_async(
+            client, file_data, filename
+        )
+        analysis = await asyncio.to_thread(_local_analysis, transcription, reference_text)
+
+        _log_debug(
+            "Transcrição concluída",
+            {
+                "cache": transcription_cache_status,
+                "transcribed_text_length": len(analysis["transcribed_text"]),
+                "audio_duration": analysis["audio_duration"],
+            },
+        )
+
+        evaluation_key = _evaluation_cache_key(analysis["transcribed_text"], reference_text)
+        evaluation, evaluation_cache_status = await asyncio.to_thread(
+            _get_cached_evaluation, evaluation_key
+        )
+        if evaluation is None:
+            messages = analysis["messages"]
+            with track_call(EVALUATION_MODEL, "chat") as call:
+                response = await _scheduler.call_async(
+                    EVALUATION_MODEL,
+                    lambda: client.chat.completions.create(**_evaluation_params(messages)),
+                    tokens=_estimate_tokens(messages),
+                    on_retry=call.retry_hook(_log_retry),
+                )
+                call.set_token_usage(response.usage)
+            evaluation = _parse_evaluation(response.choices[0].message.content)
+            await asyncio.to_thread(_store_evaluation, evaluation_key, evaluation)
+
+        result = _build_success_response(
+            evaluation,
+            analysis,
+            reference_text,
+            preprocessing,
+            {"transcription": transcription_cache_status, "evaluation": evaluation_cache_status},
+        )
+        return result, 200
+
+    except Exception as e:
+        return _error_response(e)
@@ -1,25 +1,85 @@
 import os
 import tempfile
 import json
-from typing import Optional, Tuple, Dict, Any
-from datetime import datetime
+from typing import Optional, Tuple, Dict, Any, List
 from dotenv import load_dotenv
 from openai import OpenAI
 from openai import APIError, RateLimitError, APIConnectionError
 
+from log_config import get_logger
+from .alignment import align_words, alignment_summary, tokenize
+from .cache import cache_from_env, make_cache_key
+from .chunking import split_at_silence, transcribe_chunks
+from .preflight import check_audio
+from .prosody import compute_prosody_metrics, prosody_summary
+from .resample import normalize_wav
+from .rate_limiter import RateLimitTimeout, scheduler_from_env
+from .usage import track_call, usage_request
+from .vad import trim_silence, restore_timestamps
+
 # Carregar variáveis de ambiente do arquivo .env
 load_dotenv()
 
 ALLOWED_AUDIO_EXTENSIONS = {"mp3", "wav", "m4a", "ogg", "webm"}
 
+WHISPER_MODEL = "whisper-1"
+EVALUATION_MODEL = "gpt-4o-mini"
+TRANSCRIPTION_LANGUAGE = "pt"
+# Timestamps por palavra alimentam as métricas de ritmo e pausas (prosody.py)
+TIMESTAMP_GRANULARITIES = ["word", "segment"]
+
+
+def _env_flag(name: str, default: str = "0") -> bool:
+    return os.getenv(name, default).strip().lower() in ("1", "true", "yes", "on")
+
+
+# Verificação local do cabeçalho do áudio (tamanho/duração) antes do upload
+PREFLIGHT_ENABLED = _env_flag("AUDIO_PREFLIGHT", "1")
+MAX_AUDIO_FILE_BYTES = int(float(os.getenv("AUDIO_MAX_FILE_MB", "25")) * 1024 * 1024)
+MIN_AUDIO_SECONDS = float(os.getenv("AUDIO_MIN_DURATION_SECONDS", "0.5"))
+MAX_AUDIO_SECONDS = float(os.getenv("AUDIO_MAX_DURATION_SECONDS", "600"))
+
+# WAV convertido para mono/16 kHz/16 bits antes do upload (menos bytes a enviar)
+NORMALIZE_ENABLED = _env_flag("AUDIO_NORMALIZE")
+NORMALIZE_SAMPLE_RATE = int(os.getenv("AUDIO_NORMALIZE_SAMPLE_RATE", "16000"))
+
+# Remoção de silêncio (VAD por energia) antes do Whisper; só para WAV PCM
+SILENCE_TRIM_ENABLED = _env_flag("AUDIO_SILENCE_TRIM")
+
+# Gravações WAV longas são divididas em silêncios e transcritas em paralelo
+CHUNKING_ENABLED = _env_flag("AUDIO_CHUNKING", "1")
+CHUNK_SECONDS = float(os.getenv("AUDIO_CHUNK_SECONDS", "60"))
+CHUNK_CONCURRENCY = int(os.getenv("AUDIO_CHUNK_CONCURRENCY", "4"))
+
+# Ritmo das chamadas à OpenAI compartilhado entre os workers (RPM/TPM) e
+# novas tentativas com backoff; o cliente da OpenAI não repete sozinho.
+_scheduler = scheduler_from_env({
+    WHISPER_MODEL: ("OPENAI_WHISPER_RPM", None),
+    EVALUATION_MODEL: ("OPENAI_CHAT_RPM", "OPENAI_CHAT_TPM"),
+})
+# Tokens de resposta reservados no balde de TPM para cada avaliação
+EVALUATION_COMPLETION_TOKENS = 700
+
+# Versão do prompt de avaliação: mudar o prompt invalida o cache de avaliações
+EVALUATION_PROMPT_VERSION = "1"
+
+# Cache da transcrição verbose, indexado pelo SHA-256 do áudio + modelo/idioma.
+# Reanálises do mesmo áudio (novo texto de referência, retry do cliente)
+# pagam apenas a etapa de avaliação.
+_transcription_cache = cache_from_env("TRANSCRIPTION_CACHE")
+
+# Cache da avaliação do GPT (scores e feedback), indexado pela transcrição
+# normalizada + texto de referência + modelo + versão do prompt. Reenvios e
+# relatórios reabertos não repetem a chamada paga ao chat.
+_evaluation_cache = cache_from_env("EVALUATION_CACHE")
+
+
+logger = get_logger("audio")
+
 
 def _log_debug(message: str, data: Optional[Dict[str, Any]] = None):
-    """Função auxiliar para logs de depuração"""
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
-    log_msg = f"[{timestamp}] [AUDIO_DEBUG] {message}"
-    if data:
-        log_msg += f" | Dados: {json.dumps(data, ensure_ascii=False, default=str)}"
-    print(log_msg)
+    """Log de depuração; ``data`` só é serializado se o nível DEBUG estiver ligado."""
+    logger.debug(message, extra={"data": data})
 
 
 def _allowed_audio(filename: str) -> bool:
@@ -29,245 +89,479 @@ def _allowed_audio(filename: str) -> bool:
     )
 
 
-def analyze_audio_request(
-    file_storage, reference_text: Optional[str]
-) -> Tuple[Dict[str, Any], int]:
-    """
-    Analisa áudio de leitura usando OpenAI (Whisper + GPT-4o).
-
-    Fluxo:
-    1. Transcreve o áudio usando Whisper API
-    2. Analisa a transcrição usando GPT-4o com JSON mode
-    3. Retorna avaliação estruturada compatível com o frontend
-    """
-    _log_debug(
-        "Iniciando análise de áudio",
-        {
-            "has_file_storage": bool(file_storage),
-            "filename": file_storage.filename if file_storage else None,
-            "has_reference_text": bool(reference_text),
-            "reference_text_length": len(reference_text) if reference_text else 0,
-        },
-    )
-
-    if not file_storage:
-        _log_debug("Arquivo não fornecido")
-        return {"status": "no_file", "message": "Nenhum arquivo de áudio enviado"}, 200
-
-    if file_storage.filename == "":
+def _check_audio_filename(filename: str) -> Optional[Tuple[Dict[str, Any], int]]:
+    """Valida o nome do arquivo enviado; devolve a resposta de erro ou None."""
+    if filename == "":
         _log_debug("Nome do arquivo vazio")
         return {
             "status": "no_file",
             "message": "Nenhum arquivo de áudio selecionado",
         }, 200
 
-    if not _allowed_audio(file_storage.filename):
-        _log_debug("Tipo de arquivo não permitido", {"filename": file_storage.filename})
+    if not _allowed_audio(filename):
+        _log_debug("Tipo de arquivo não permitido", {"filename": filename})
         return {
             "status": "invalid_file_type",
             "message": f"Tipo de arquivo não permitido. Use: {', '.join(sorted(ALLOWED_AUDIO_EXTENSIONS))}",
         }, 200
+    return None
+
+
+def _get_api_key() -> Tuple[Optional[str], Optional[Tuple[Dict[str, Any], int]]]:
+    """
+    Lê a OPENAI_API_KEY do ambiente.
 
+    Returns:
+        (chave, None) ou (None, resposta de erro de configuração)
+    """
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         _log_debug("OPENAI_API_KEY não configurada")
-        return {
+        return None, ({
             "status": "config_error",
             "message": "OPENAI_API_KEY não configurada no ambiente.",
-        }, 500
+        }, 500)
 
     _log_debug("API Key encontrada", {"key_length": len(api_key) if api_key else 0})
+    return api_key, None
+
+
+def _preflight(file_data: bytes, filename: str) -> Optional[Tuple[Dict[str, Any], int]]:
+    """Recusa arquivos vazios, corrompidos, grandes ou longos demais antes do Whisper."""
+    if not PREFLIGHT_ENABLED:
+        return None
+    info, error = check_audio(
+        file_data,
+        max_bytes=MAX_AUDIO_FILE_BYTES,
+        min_duration=MIN_AUDIO_SECONDS,
+        max_duration=MAX_AUDIO_SECONDS,
+    )
+    if error:
+        _log_debug("Áudio recusado na verificação prévia", {"filename": filename, "info": info, **error})
+        return error, 200
+    _log_debug("Verificação prévia do áudio", {"filename": filename, **info})
+    return None
 
-    try:
-        _log_debug("Criando cliente OpenAI")
-        client = OpenAI(api_key=api_key)
 
-        suffix = os.path.splitext(file_storage.filename)[1] or ".m4a"
-        _log_debug(
-            "Salvando arquivo temporário",
-            {"filename": file_storage.filename, "suffix": suffix},
-        )
+def _log_retry(attempt: int, error: Exception, delay: float) -> None:
+    _log_debug(
+        "Erro transitório da OpenAI, tentando novamente",
+        {"attempt": attempt, "error_type": type(error).__name__, "delay_seconds": round(delay, 2)},
+    )
 
-        # Ler o arquivo para obter o tamanho
-        file_storage.seek(0)  # Resetar posição do arquivo
-        file_data = file_storage.read()
-        file_size = len(file_data)
 
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-            tmp.write(file_data)
-            temp_audio_path = tmp.name
+def _estimate_tokens(messages: List[Dict[str, str]]) -> int:
+    """Estimativa grosseira (~3 caracteres por token em PT) do custo da avaliação."""
+    prompt_chars = sum(len(m["content"]) for m in messages)
+    return prompt_chars // 3 + EVALUATION_COMPLETION_TOKENS
 
-        _log_debug(
-            "Arquivo temporário criado",
-            {
-                "temp_path": temp_audio_path,
-                "file_size": file_size,
-                "file_size_mb": round(file_size / (1024 * 1024), 2),
-            },
-        )
 
-        try:
-            # ============================================================
-            # PASSO 1: Transcrição com Whisper API
-            # ============================================================
-            _log_debug("Iniciando transcrição com Whisper")
-
-            with open(temp_audio_path, "rb") as audio_file:
-                transcription = client.audio.transcriptions.create(
-                    model="whisper-1",
-                    file=audio_file,
-                    language="pt",
-                    response_format="verbose_json",
-                )
+def _transcription_params() -> Dict[str, Any]:
+    """Parâmetros da chamada ao Whisper (exceto o arquivo), comuns às versões sync e async."""
+    return {
+        "model": WHISPER_MODEL,
+        "language": TRANSCRIPTION_LANGUAGE,
+        "response_format": "verbose_json",
+        "timestamp_granularities": TIMESTAMP_GRANULARITIES,
+    }
 
-            transcribed_text = transcription.text
-            audio_duration = getattr(transcription, "duration", 0.0) or 0.0
 
-            _log_debug(
-                "Transcrição concluída",
-                {
-                    "transcribed_text_length": len(transcribed_text),
-                    "transcribed_text_preview": (
-                        transcribed_text[:200] + "..."
-                        if len(transcribed_text) > 200
-                        else transcribed_text
-                    ),
-                    "audio_duration": audio_duration,
-                },
+def _transcribe_audio(client: OpenAI, file_data: bytes, suffix: str) -> Dict[str, Any]:
+    """Envia o áudio ao Whisper e retorna a transcrição verbose como dicionário."""
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+        tmp.write(file_data)
+        temp_audio_path = tmp.name
+
+    def create_transcription():
+        # O arquivo é reaberto a cada tentativa
+        with open(temp_audio_path, "rb") as audio_file:
+            return client.audio.transcriptions.create(
+                file=audio_file, **_transcription_params()
             )
 
-            # Calcular palavras por minuto
-            word_count = len(transcribed_text.split()) if transcribed_text else 0
-            words_per_minute = (
-                (word_count / audio_duration * 60) if audio_duration > 0 else 0.0
+    try:
+        _log_debug("Iniciando transcrição com Whisper", {"temp_path": temp_audio_path})
+        with track_call(WHISPER_MODEL, "transcription") as call:
+            transcription = _scheduler.call(
+                WHISPER_MODEL, create_transcription, on_retry=call.retry_hook(_log_retry)
+            )
+            call.audio_seconds = getattr(transcription, "duration", None) or 0.0
+    finally:
+        try:
+            os.unlink(temp_audio_path)
+        except Exception as cleanup_error:
+            _log_debug(
+                "Erro ao remover arquivo temporário", {"error": str(cleanup_error)}
             )
 
-            # ============================================================
-            # PASSO 2: Análise com GPT-4o
-            # ============================================================
-            _log_debug("Iniciando análise com GPT-4o")
+    return transcription.model_dump(exclude_none=True)
+
+
+def _split_audio(audio_data: bytes) -> Optional[List[Dict[str, Any]]]:
+    """Trechos para transcrição paralela, ou None se o áudio não deve ser dividido."""
+    if not CHUNKING_ENABLED:
+        return None
+    return split_at_silence(
+        audio_data,
+        chunk_seconds=CHUNK_SECONDS,
+        max_chunk_seconds=CHUNK_SECONDS * 1.5,
+        min_duration=CHUNK_SECONDS * 2,
+    )
+
+
+def _transcribe_long_audio(client: OpenAI, audio_data: bytes, suffix: str) -> Tuple[Dict[str, Any], int]:
+    """
+    Transcreve o áudio, dividindo-o em trechos paralelos quando for longo.
+
+    Returns:
+        (transcrição verbose, quantidade de trechos; 1 se não foi dividido)
+    """
+    chunks = _split_audio(audio_data)
+    if not chunks:
+        return _transcribe_audio(client, audio_data, suffix), 1
+
+    _log_debug(
+        "Transcrevendo áudio em trechos",
+        {"chunks": len(chunks), "concurrency": CHUNK_CONCURRENCY},
+    )
+    transcription = transcribe_chunks(
+        chunks,
+        lambda data: _transcribe_audio(client, data, ".wav"),
+        max_workers=CHUNK_CONCURRENCY,
+        # Cada chamada já passa pelo agendador, que repete os erros transitórios
+        retries=0,
+        is_retryable=None,
+    )
+    return transcription, len(chunks)
+
 
-            system_prompt = """Você é um avaliador especializado em leitura em voz alta para estudantes brasileiros. 
+def _prepare_audio(file_data: bytes) -> Tuple[bytes, Optional[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Aplica o pré-processamento habilitado antes da transcrição.
+
+    Returns:
+        (áudio a transcrever, resultado de ``trim_silence`` ou None,
+        relatório do pré-processamento)
+    """
+    preprocessing: Dict[str, Any] = {}
+    audio_data = file_data
+    trim = None
+
+    if NORMALIZE_ENABLED:
+        normalized = normalize_wav(file_data, NORMALIZE_SAMPLE_RATE)
+        if normalized is not None:
+            audio_data = normalized.pop("audio")
+            preprocessing["normalization"] = normalized
+            _log_debug("Áudio convertido para mono/16 kHz", normalized)
+
+    if SILENCE_TRIM_ENABLED:
+        trim = trim_silence(audio_data)
+        if trim is not None:
+            audio_data = trim["audio"]
+            preprocessing["silence_trim"] = {
+                "original_duration_seconds": round(trim["original_duration"], 2),
+                "trimmed_duration_seconds": round(trim["trimmed_duration"], 2),
+                "seconds_saved": trim["seconds_saved"],
+                "removed_spans": len(trim["removed_spans"]),
+            }
+            _log_debug("Silêncio removido antes da transcrição", preprocessing["silence_trim"])
+    return audio_data, trim, preprocessing
+
+
+def _finish_transcription(
+    transcription: Dict[str, Any],
+    trim: Optional[Dict[str, Any]],
+    chunk_count: int,
+    preprocessing: Dict[str, Any],
+) -> Dict[str, Any]:
+    """Completa o relatório e devolve os tempos à linha do tempo do áudio original."""
+    if chunk_count > 1:
+        preprocessing["chunking"] = {
+            "chunks": chunk_count,
+            "concurrency": min(CHUNK_CONCURRENCY, chunk_count),
+        }
+
+    if trim is not None and trim["removed_spans"]:
+        transcription = restore_timestamps(
+            transcription, trim["removed_spans"], trim["original_duration"]
+        )
+    return transcription
+
+
+def _preprocess_and_transcribe(
+    client: OpenAI, file_data: bytes, suffix: str
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Aplica o pré-processamento habilitado e transcreve o áudio.
+
+    Os tempos da transcrição são sempre devolvidos na linha do tempo do
+    áudio original, mesmo quando trechos de silêncio foram removidos.
+
+    Returns:
+        (transcrição verbose, relatório do pré-processamento)
+    """
+    audio_data, trim, preprocessing = _prepare_audio(file_data)
+    transcription, chunk_count = _transcribe_long_audio(client, audio_data, suffix)
+    transcription = _finish_transcription(transcription, trim, chunk_count, preprocessing)
+    return transcription, preprocessing
+
+
+def _transcription_cache_key(file_data: bytes) -> str:
+    return make_cache_key(
+        file_data,
+        WHISPER_MODEL,
+        TRANSCRIPTION_LANGUAGE,
+        ",".join(TIMESTAMP_GRANULARITIES),
+        f"norm={NORMALIZE_SAMPLE_RATE if NORMALIZE_ENABLED else 0}",
+        f"trim={int(SILENCE_TRIM_ENABLED)}",
+        f"chunk={CHUNK_SECONDS if CHUNKING_ENABLED else 0}",
+    )
+
+
+def _transcribe_with_cache(
+    client: OpenAI, file_data: bytes, suffix: str
+) -> Tuple[Dict[str, Any], str, Dict[str, Any]]:
+    """
+    Transcreve o áudio consultando antes o cache de transcrições.
+
+    Returns:
+        (transcrição verbose, status do cache: "hit", "miss" ou "disabled",
+        relatório do pré-processamento)
+    """
+    if _transcription_cache is None:
+        transcription, preprocessing = _preprocess_and_transcribe(client, file_data, suffix)
+        return transcription, "disabled", preprocessing
+
+    key = _transcription_cache_key(file_data)
+    cached = _transcription_cache.get(key)
+    if cached is not None:
+        _log_debug("Transcrição encontrada no cache", {"key": key})
+        return cached["transcription"], "hit", cached["preprocessing"]
+
+    transcription, preprocessing = _preprocess_and_transcribe(client, file_data, suffix)
+    _transcription_cache.set(
+        key, {"transcription": transcription, "preprocessing": preprocessing}
+    )
+    return transcription, "miss", preprocessing
+
+
+def _build_evaluation_messages(
+    transcribed_text: str,
+    audio_duration: float,
+    word_count: int,
+    words_per_minute: float,
+    alignment: Optional[Dict[str, Any]],
+    prosody: Optional[Dict[str, Any]] = None,
+) -> List[Dict[str, str]]:
+    """
+    Monta as mensagens do GPT.
+
+    Duração, velocidade, pausas e alinhamento são calculados localmente e
+    entram no prompt apenas como números compactos; o modelo devolve somente os scores
+    e o feedback qualitativo.
+    """
+    system_prompt = """Você é um avaliador especializado em leitura em voz alta para estudantes brasileiros. 
 Analise a transcrição da leitura e avalie os seguintes critérios: fluência, pronúncia, entonação, ritmo, pausas e clareza.
-Se um texto de referência for fornecido, compare o que foi lido com o texto esperado, identificando palavras faltantes, inseridas ou trocadas.
+As métricas de ritmo e pausas foram medidas a partir dos tempos de cada palavra no áudio; baseie nelas a avaliação de ritmo, pausas e fluência.
+Quando houver um resumo da comparação com o texto de referência, use-o para orientar o feedback.
 Responda ESTRITAMENTE em JSON válido no formato especificado. Cada score deve ser de 0 a 10."""
 
-            # Construir o prompt do usuário
-            user_content = f"""Transcrição da leitura do aluno:
+    # Construir o prompt do usuário
+    user_content = f"""Transcrição da leitura do aluno:
 {transcribed_text}
 
 Duração do áudio: {audio_duration:.1f} segundos
 Palavras lidas: {word_count}
 Velocidade calculada: {words_per_minute:.1f} palavras por minuto
 
-"""
-            if reference_text:
-                user_content += f"""Texto de referência (PT-BR):
-{reference_text}
+Ritmo e pausas medidos no áudio:
+{prosody_summary(prosody)}
 
-Compare a transcrição com o texto de referência para identificar palavras faltantes, inseridas ou substituídas.
 """
-            else:
-                user_content += "Nenhum texto de referência fornecido. Avalie apenas a qualidade geral da leitura.\n"
+    if alignment:
+        user_content += f"""Comparação com o texto de referência (calculada automaticamente):
+{alignment_summary(alignment)}
+"""
+    else:
+        user_content += "Nenhum texto de referência fornecido. Avalie apenas a qualidade geral da leitura.\n"
 
-            user_content += f"""
+    user_content += """
 Retorne um JSON no seguinte formato exato:
-{{
+{
     "overall_score": <número de 0 a 10>,
-    "fluency": {{"score": <0-10>, "feedback": "<feedback sobre fluência>"}},
-    "pronunciation": {{"score": <0-10>, "feedback": "<feedback sobre pronúncia>"}},
-    "intonation": {{"score": <0-10>, "feedback": "<feedback sobre entonação>"}},
-    "rhythm": {{"score": <0-10>, "feedback": "<feedback sobre ritmo>"}},
-    "pauses": {{"score": <0-10>, "feedback": "<feedback sobre pausas>"}},
-    "clarity": {{"score": <0-10>, "feedback": "<feedback sobre clareza>"}},
-    "duration_seconds": {audio_duration:.1f},
-    "words_per_minute": {words_per_minute:.1f},
-    "reference_used": {str(bool(reference_text)).lower()},
-    "alignment": {{
-        "words_total": <número total de palavras no texto de referência ou na transcrição>,
-        "words_read": <número de palavras lidas corretamente>,
-        "words_missing": [<lista de palavras que deveriam ter sido lidas mas não foram>],
-        "words_inserted": [<lista de palavras lidas que não estavam no texto de referência>],
-        "words_substituted": [<lista de objetos {{"expected": "palavra_esperada", "read": "palavra_lida"}}>],
-        "accuracy_percent": <porcentagem de precisão 0-100>
-    }},
+    "fluency": {"score": <0-10>, "feedback": "<feedback sobre fluência>"},
+    "pronunciation": {"score": <0-10>, "feedback": "<feedback sobre pronúncia>"},
+    "intonation": {"score": <0-10>, "feedback": "<feedback sobre entonação>"},
+    "rhythm": {"score": <0-10>, "feedback": "<feedback sobre ritmo>"},
+    "pauses": {"score": <0-10>, "feedback": "<feedback sobre pausas>"},
+    "clarity": {"score": <0-10>, "feedback": "<feedback sobre clareza>"},
     "suggestions": [<lista de sugestões de melhoria>]
-}}
+}
 
 Importante:
 - O overall_score deve ser a média ponderada dos outros scores
-- Se não houver texto de referência, calcule o alignment baseado apenas na transcrição
 - Forneça feedback construtivo e específico em português brasileiro
 - As sugestões devem ser práticas e encorajadoras"""
 
-            _log_debug(
-                "Enviando requisição para GPT-4o",
-                {
-                    "model": "gpt-4o-mini",
-                    "has_reference_text": bool(reference_text),
-                    "transcription_length": len(transcribed_text),
-                },
-            )
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_content},
+    ]
+
+
+def _apply_local_metrics(
+    evaluation: Dict[str, Any],
+    audio_duration: float,
+    words_per_minute: float,
+    reference_used: bool,
+    alignment: Dict[str, Any],
+    prosody: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """Preenche na avaliação os campos calculados localmente (não pelo GPT)."""
+    evaluation["duration_seconds"] = round(audio_duration, 1)
+    evaluation["words_per_minute"] = round(words_per_minute, 1)
+    evaluation["reference_used"] = reference_used
+    evaluation["alignment"] = alignment
+    if prosody is not None:
+        evaluation["prosody"] = prosody
+    return evaluation
+
+
+def _local_analysis(transcription: Dict[str, Any], reference_text: Optional[str]) -> Dict[str, Any]:
+    """
+    Métricas calculadas localmente a partir da transcrição e as mensagens do GPT.
 
-            response = client.chat.completions.create(
-                model="gpt-4o-mini",
-                response_format={"type": "json_object"},
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_content},
-                ],
-                temperature=0.3,
-            )
+    Returns:
+        Dicionário com ``transcribed_text``, ``audio_duration``, ``word_count``,
+        ``words_per_minute``, ``alignment``, ``prosody`` e ``messages``.
+    """
+    transcribed_text = transcription.get("text") or ""
+    audio_duration = transcription.get("duration") or 0.0
 
-            response_content = response.choices[0].message.content
-            _log_debug(
-                "Resposta recebida do GPT-4o",
-                {
-                    "response_length": len(response_content) if response_content else 0,
-                    "response_preview": (
-                        (response_content[:200] + "...")
-                        if response_content and len(response_content) > 200
-                        else response_content
-                    ),
-                },
-            )
+    # Calcular palavras por minuto
+    word_count = len(transcribed_text.split()) if transcribed_text else 0
+    words_per_minute = (
+        (word_count / audio_duration * 60) if audio_duration > 0 else 0.0
+    )
 
-            # Parse do JSON (garantido pelo response_format)
-            evaluation = json.loads(response_content)
+    # Alinhamento com o texto de referência e métricas de ritmo/pausas,
+    # calculados localmente
+    alignment = align_words(reference_text, transcribed_text)
+    prosody = compute_prosody_metrics(transcription)
+
+    messages = _build_evaluation_messages(
+        transcribed_text,
+        audio_duration,
+        word_count,
+        words_per_minute,
+        alignment if reference_text else None,
+        prosody,
+    )
+    return {
+        "transcribed_text": transcribed_text,
+        "audio_duration": audio_duration,
+        "word_count": word_count,
+        "words_per_minute": words_per_minute,
+        "alignment": alignment,
+        "prosody": prosody,
+        "messages": messages,
+    }
+
+
+def _evaluation_cache_key(transcribed_text: str, reference_text: Optional[str]) -> str:
+    # Tokens normalizados: caixa, acentos e pontuação não mudam a chave
+    tokens, _, _ = tokenize(transcribed_text)
+    return make_cache_key(
+        " ".join(tokens),
+        " ".join((reference_text or "").split()),
+        EVALUATION_MODEL,
+        EVALUATION_PROMPT_VERSION,
+    )
 
-            _log_debug(
-                "JSON parsed com sucesso",
-                {
-                    "evaluation_keys": (
-                        list(evaluation.keys())
-                        if isinstance(evaluation, dict)
-                        else None
-                    )
-                },
-            )
 
-            _log_debug(
-                "Análise concluída com sucesso",
-                {
-                    "overall_score": evaluation.get("overall_score"),
-                    "words_per_minute": evaluation.get("words_per_minute"),
-                },
-            )
+def _get_cached_evaluation(key: str) -> Tuple[Optional[Dict[str, Any]], str]:
+    """
+    Consulta o cache de avaliações.
 
-            return {"status": "success", "evaluation": evaluation}, 200
+    Returns:
+        (avaliação do GPT ou None, status do cache: "hit", "miss" ou "disabled")
+    """
+    if _evaluation_cache is None:
+        return None, "disabled"
+    evaluation = _evaluation_cache.get(key)
+    if evaluation is None:
+        return None, "miss"
+    _log_debug("Avaliação encontrada no cache", {"key": key})
+    return evaluation, "hit"
+
+
+def _store_evaluation(key: str, evaluation: Dict[str, Any]) -> None:
+    # Guarda só o que veio do GPT; as métricas locais são sempre recalculadas
+    if _evaluation_cache is not None and isinstance(evaluation, dict):
+        _evaluation_cache.set(key, evaluation)
+
+
+def _evaluation_params(messages: List[Dict[str, str]]) -> Dict[str, Any]:
+    """Parâmetros da chamada de avaliação ao GPT, comuns às versões sync e async."""
+    return {
+        "model": EVALUATION_MODEL,
+        "response_format": {"type": "json_object"},
+        "messages": messages,
+        "temperature": 0.3,
+    }
+
+
+def _parse_evaluation(response_content: str) -> Dict[str, Any]:
+    """Lê o JSON devolvido pelo GPT (garantido pelo response_format)."""
+    _log_debug(
+        "Resposta recebida do GPT-4o",
+        {
+            "response_length": len(response_content) if response_content else 0,
+            "response_preview": (
+                (response_content[:200] + "...")
+                if response_content and len(response_content) > 200
+                else response_content
+            ),
+        },
+    )
+    return json.loads(response_content)
+
+
+def _build_success_response(
+    evaluation: Dict[str, Any],
+    analysis: Dict[str, Any],
+    reference_text: Optional[str],
+    preprocessing: Dict[str, Any],
+    cache_status: Dict[str, str],
+) -> Dict[str, Any]:
+    """Monta a resposta de sucesso a partir da avaliação do GPT."""
+    _apply_local_metrics(
+        evaluation,
+        analysis["audio_duration"],
+        analysis["words_per_minute"],
+        bool(reference_text),
+        analysis["alignment"],
+        analysis["prosody"],
+    )
+
+    _log_debug(
+        "Análise concluída com sucesso",
+        {
+            "overall_score": evaluation.get("overall_score"),
+            "words_per_minute": evaluation.get("words_per_minute"),
+            "cache": cache_status,
+        },
+    )
+
+    result = {"status": "success", "evaluation": evaluation, "cache": cache_status}
+    if preprocessing:
+        result["preprocessing"] = preprocessing
+    return result
 
-        finally:
-            try:
-                _log_debug(
-                    "Removendo arquivo temporário", {"temp_path": temp_audio_path}
-                )
-                os.unlink(temp_audio_path)
-            except Exception as cleanup_error:
-                _log_debug(
-                    "Erro ao remover arquivo temporário", {"error": str(cleanup_error)}
-                )
 
-    except RateLimitError as e:
+def _error_response(e: Exception) -> Tuple[Dict[str, Any], int]:
+    """Converte erros da OpenAI (ou do processamento) na resposta da API."""
+    if isinstance(e, RateLimitError):
         _log_debug(
             "Erro de rate limit ou quota da OpenAI",
             {
@@ -293,7 +587,7 @@ Importante:
             "message": user_message,
             "error_details": error_msg,
         }, 429
-    except APIError as e:
+    if isinstance(e, APIError):
         _log_debug(
             "Erro da API OpenAI",
             {
@@ -328,7 +622,7 @@ Importante:
                 "message": f"Erro na API OpenAI: {str(e)}",
                 "error_details": str(e),
             }, 500
-    except APIConnectionError as e:
+    if isinstance(e, APIConnectionError):
         _log_debug(
             "Erro de conexão com API OpenAI",
             {
@@ -344,16 +638,161 @@ Importante:
             ),
             "error_details": str(e),
         }, 503
-    except Exception as e:
+    if isinstance(e, RateLimitTimeout):
+        _log_debug("Limite de taxa local esgotado", {"error_message": str(e)})
+        return {
+            "status": "quota_error",
+            "message": (
+                "Muitas análises em andamento no momento. "
+                "Aguarde alguns instantes e tente novamente."
+            ),
+            "error_details": str(e),
+        }, 429
+    _log_debug(
+        "Erro durante análise de áudio",
+        {
+            "error_type": type(e).__name__,
+            "error_message": str(e),
+            "error_details": repr(e),
+        },
+    )
+    return {
+        "status": "processing_error",
+        "message": f"Erro ao analisar áudio: {str(e)}",
+    }, 500
+
+
+def analyze_audio_request(
+    file_storage,
+    reference_text: Optional[str],
+    include_usage: bool = False,
+    endpoint: str = "analisar-audio",
+) -> Tuple[Dict[str, Any], int]:
+    """
+    Analisa áudio de leitura e contabiliza as chamadas à OpenAI.
+
+    Args:
+        file_storage: Arquivo de áudio enviado.
+        reference_text: Texto de referência (opcional).
+        include_usage: Inclui ``usage`` (tempos, tokens, custo) na resposta.
+        endpoint: Rótulo do endpoint nas estatísticas de uso.
+    """
+    with usage_request(endpoint) as usage:
+        result, status = _analyze_audio(file_storage, reference_text)
+    if include_usage:
+        result["usage"] = usage.summary()
+    return result, status
+
+
+def _analyze_audio(
+    file_storage, reference_text: Optional[str]
+) -> Tuple[Dict[str, Any], int]:
+    """
+    Analisa áudio de leitura usando OpenAI (Whisper + GPT-4o).
+
+    Fluxo:
+    1. Transcreve o áudio usando Whisper API
+    2. Analisa a transcrição usando GPT-4o com JSON mode
+    3. Retorna avaliação estruturada compatível com o frontend
+    """
+    _log_debug(
+        "Iniciando análise de áudio",
+        {
+            "has_file_storage": bool(file_storage),
+            "filename": file_storage.filename if file_storage else None,
+            "has_reference_text": bool(reference_text),
+            "reference_text_length": len(reference_text) if reference_text else 0,
+        },
+    )
+
+    if not file_storage:
+        _log_debug("Arquivo não fornecido")
+        return {"status": "no_file", "message": "Nenhum arquivo de áudio enviado"}, 200
+
+    invalid = _check_audio_filename(file_storage.filename)
+    if invalid:
+        return invalid
+
+    api_key, config_error = _get_api_key()
+    if config_error:
+        return config_error
+
+    try:
+        _log_debug("Criando cliente OpenAI")
+        client = OpenAI(api_key=api_key, max_retries=0)
+
+        suffix = os.path.splitext(file_storage.filename)[1] or ".m4a"
+
+        # Ler o arquivo para obter o tamanho
+        file_storage.seek(0)  # Resetar posição do arquivo
+        file_data = file_storage.read()
+        file_size = len(file_data)
+
         _log_debug(
-            "Erro durante análise de áudio",
+            "Arquivo de áudio lido",
             {
-                "error_type": type(e).__name__,
-                "error_message": str(e),
-                "error_details": repr(e),
+                "filename": file_storage.filename,
+                "file_size": file_size,
+                "file_size_mb": round(file_size / (1024 * 1024), 2),
             },
         )
-        return {
-            "status": "processing_error",
-            "message": f"Erro ao analisar áudio: {str(e)}",
-        }, 500
+
+        rejected = _preflight(file_data, file_storage.filename)
+        if rejected:
+            return rejected
+
+        # ============================================================
+        # PASSO 1: Transcrição com Whisper API (ou cache)
+        # ============================================================
+        transcription, transcription_cache_status, preprocessing = _transcribe_with_cache(
+            client, file_data, suffix
+        )
+        analysis = _local_analysis(transcription, reference_text)
+
+        _log_debug(
+            "Transcrição concluída",
+            {
+                "cache": transcription_cache_status,
+                "transcribed_text_length": len(analysis["transcribed_text"]),
+                "audio_duration": analysis["audio_duration"],
+            },
+        )
+
+        # ============================================================
+        # PASSO 2: Análise com GPT-4o (apenas feedback qualitativo)
+        # ============================================================
+        _log_debug(
+            "Enviando requisição para GPT-4o",
+            {
+                "model": EVALUATION_MODEL,
+                "has_reference_text": bool(reference_text),
+                "transcription_length": len(analysis["transcribed_text"]),
+            },
+        )
+
+        evaluation_key = _evaluation_cache_key(analysis["transcribed_text"], reference_text)
+        evaluation, evaluation_cache_status = _get_cached_evaluation(evaluation_key)
+        if evaluation is None:
+            messages = analysis["messages"]
+            with track_call(EVALUATION_MODEL, "chat") as call:
+                response = _scheduler.call(
+                    EVALUATION_MODEL,
+                    lambda: client.chat.completions.create(**_evaluation_params(messages)),
+                    tokens=_estimate_tokens(messages),
+                    on_retry=call.retry_hook(_log_retry),
+                )
+                call.set_token_usage(response.usage)
+            evaluation = _parse_evaluation(response.choices[0].message.content)
+            _store_evaluation(evaluation_key, evaluation)
+
+        result = _build_success_response(
+            evaluation,
+            analysis,
+            reference_text,
+            preprocessing,
+            {"transcription": transcription_cache_status, "evaluation": evaluation_cache_status},
+        )
+        return result, 200
+
+    except Exception as e:
+        return _error_response(e)
@@ -0,0 +1,178 @@
+"""
+Análise de leitura em lote (turma inteira numa só requisição).
+
+Cada gravação passa pelo mesmo fluxo de ``analyze_audio_request``; as
+análises rodam em paralelo com um limite de concorrência, e os resultados
+voltam na ordem de envio, acompanhados de um resumo da turma. Na resposta em
+fluxo (streaming.py) cada gravação é enviada assim que termina.
+"""
+import contextvars
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional, Tuple, Dict, Any, List, Iterator
+
+from .audio_service import analyze_audio_request, _log_debug
+
+# Limites de concorrência e de tamanho do lote
+DEFAULT_BATCH_CONCURRENCY = int(os.getenv("AUDIO_BATCH_CONCURRENCY", "4"))
+MAX_BATCH_CONCURRENCY = int(os.getenv("AUDIO_BATCH_MAX_CONCURRENCY", "16"))
+MAX_BATCH_SIZE = int(os.getenv("AUDIO_BATCH_MAX_SIZE", "60"))
+
+
+def _parse_reference_texts(
+    textos_json: Optional[str], count: int
+) -> Tuple[Optional[List[Optional[str]]], Optional[str]]:
+    """
+    Lê a lista de textos de referência por gravação (JSON).
+
+    Returns:
+        (lista de textos ou None, mensagem de erro ou None)
+    """
+    if not textos_json:
+        return None, None
+    try:
+        textos = json.loads(textos_json)
+    except json.JSONDecodeError:
+        return None, "O campo 'textos' não é um JSON válido."
+    if not isinstance(textos, list) or not all(t is None or isinstance(t, str) for t in textos):
+        return None, "O campo 'textos' deve ser uma lista de strings (ou null)."
+    if len(textos) != count:
+        return None, (
+            f"O campo 'textos' deve ter um item por áudio. "
+            f"Esperado: {count}, Encontrado: {len(textos)}"
+        )
+    return textos, None
+
+
+def _mean(values: List[float]) -> Optional[float]:
+    return round(sum(values) / len(values), 1) if values else None
+
+
+def _class_summary(resultados: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Resumo da turma a partir das avaliações bem-sucedidas."""
+    evaluations = [r["evaluation"] for r in resultados if r.get("status") == "success"]
+
+    def numbers(getter) -> List[float]:
+        values = []
+        for evaluation in evaluations:
+            try:
+                value = getter(evaluation)
+            except (KeyError, TypeError):
+                continue
+            if isinstance(value, (int, float)):
+                values.append(float(value))
+        return values
+
+    scores = numbers(lambda e: e["overall_score"])
+    return {
+        "total": len(resultados),
+        "succeeded": len(evaluations),
+        "failed": len(resultados) - len(evaluations),
+        "overall_score_mean": _mean(scores),
+        "overall_score_min": min(scores) if scores else None,
+        "overall_score_max": max(scores) if scores else None,
+        "words_per_minute_mean": _mean(numbers(lambda e: e["words_per_minute"])),
+        "accuracy_percent_mean": _mean(numbers(
+            lambda e: e["alignment"]["accuracy_percent"] if e.get("reference_used") else None
+        )),
+    }
+
+
+def analyze_audio_batch_request(
+    file_storages: List[Any],
+    reference_text: Optional[str],
+    reference_texts_json: Optional[str] = None,
+    concurrency: Optional[str] = None,
+    include_usage: bool = False,
+    stream: bool = False,
+) -> Tuple[Any, int]:
+    """
+    Analisa várias gravações em paralelo.
+
+    Args:
+        file_storages: Arquivos de áudio, na ordem dos alunos.
+        reference_text: Texto de referência compartilhado (``texto``).
+        reference_texts_json: Lista JSON com um texto por áudio (``textos``);
+            itens null usam o texto compartilhado.
+        concurrency: Limite de análises simultâneas (``concorrencia``).
+        include_usage: Inclui ``usage`` (tempos, tokens, custo) em cada resultado.
+        stream: Devolve os eventos ``(tipo, dados)`` da resposta em fluxo
+            (streaming.py): cada gravação assim que termina e o resumo no fim.
+
+    Returns:
+        (resposta ou eventos, status HTTP)
+    """
+    file_storages = [f for f in (file_storages or []) if f is not None]
+    if not file_storages:
+        return {"status": "no_file", "message": "Nenhum arquivo de áudio enviado"}, 200
+
+    if len(file_storages) > MAX_BATCH_SIZE:
+        return {
+            "status": "bad_request",
+            "message": f"Lote grande demais. Máximo: {MAX_BATCH_SIZE} áudios, Encontrado: {len(file_storages)}",
+        }, 400
+
+    textos, error = _parse_reference_texts(reference_texts_json, len(file_storages))
+    if error:
+        return {"status": "bad_request", "message": error}, 400
+
+    try:
+        workers = int(concurrency) if concurrency else DEFAULT_BATCH_CONCURRENCY
+    except ValueError:
+        return {"status": "bad_request", "message": "O campo 'concorrencia' deve ser um número inteiro."}, 400
+    workers = max(1, min(workers, MAX_BATCH_CONCURRENCY, len(file_storages)))
+
+    _log_debug(
+        "Iniciando análise em lote",
+        {"audios": len(file_storages), "concurrency": workers},
+    )
+
+    def analyze(index: int) -> Dict[str, Any]:
+        file_storage = file_storages[index]
+        texto = textos[index] if textos and textos[index] is not None else reference_text
+        result, status = analyze_audio_request(
+            file_storage=file_storage,
+            reference_text=texto,
+            include_usage=include_usage,
+            endpoint="analisar-audio-lote",
+        )
+        return {
+            "index": index,
+            "filename": file_storage.filename,
+            "http_status": status,
+            **result,
+        }
+
+    def analyses() -> Iterator[Dict[str, Any]]:
+        # Na ordem em que terminam; um lote interrompido não inicia as gravações restantes
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # Cada análise herda o contexto da requisição (id de correlação dos logs)
+            futures = [executor.submit(contextvars.copy_context().run, analyze, i) for i in range(len(file_storages))]
+            try:
+                for future in as_completed(futures):
+                    yield future.result()
+            finally:
+                for future in futures:
+                    future.cancel()
+
+    if stream:
+        return _events(analyses()), 200
+
+    resultados = sorted(analyses(), key=lambda r: r["index"])
+    summary = _class_summary(resultados)
+    return {
+        "status": "success" if summary["failed"] == 0 else "partial_success",
+        "summary": summary,
+        "resultados": resultados,
+    }, 200
+
+
+def _events(analyses: Iterator[Dict[str, Any]]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Eventos da resposta em fluxo: um ``resultado`` por gravação e o ``resumo`` da turma."""
+    resultados = []
+    for resultado in analyses:
+        resultados.append(resultado)
+        yield "resultado", resultado
+    summary = _class_summary(resultados)
+    yield "resumo", {"status": "success" if summary["failed"] == 0 else "partial_success", "summary": summary}
@@ -0,0 +1,173 @@
+"""
+Cache de resultados da análise de áudio.
+
+Guarda dicionários JSON-serializáveis (ex.: a transcrição verbose do Whisper)
+com limite de entradas e tempo de expiração (TTL). Há dois backends:
+
+- ``memory``: LRU em memória do processo (``cachetools.TTLCache``). É o mais
+  rápido, mas cada worker do gunicorn tem o seu.
+- ``disk``: um arquivo JSON por chave em um diretório local, compartilhado
+  por todos os workers da mesma máquina.
+
+A configuração vem de variáveis de ambiente com um prefixo, por exemplo
+``TRANSCRIPTION_CACHE_BACKEND``, ``TRANSCRIPTION_CACHE_MAX_ENTRIES``,
+``TRANSCRIPTION_CACHE_TTL_SECONDS`` e ``TRANSCRIPTION_CACHE_DIR``.
+"""
+import copy
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Optional, Dict, Any, Union
+
+from cachetools import TTLCache
+
+CACHE_BACKENDS = {"memory", "disk", "off"}
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+
+
+def make_cache_key(*parts: Union[str, bytes]) -> str:
+    """Gera uma chave SHA-256 estável a partir de partes em texto ou bytes."""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        # O tamanho como prefixo evita colisões do tipo ("ab", "c") x ("a", "bc")
+        digest.update(str(len(part)).encode("ascii") + b":")
+        digest.update(part)
+    return digest.hexdigest()
+
+
+class MemoryCache:
+    """Cache LRU com TTL em memória, seguro para uso entre threads."""
+
+    backend = "memory"
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._data = TTLCache(maxsize=max_entries, ttl=ttl_seconds)
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            value = self._data.get(key)
+        # Cópia para que o chamador possa alterar o resultado livremente
+        return copy.deepcopy(value) if value is not None else None
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        with self._lock:
+            self._data[key] = copy.deepcopy(value)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class DiskCache:
+    """
+    Cache em disco compartilhado entre processos.
+
+    Cada entrada é um arquivo ``<chave>.json``; a escrita é atômica
+    (arquivo temporário + ``os.replace``), então leitores em outros workers
+    nunca veem um JSON pela metade. A expiração usa o mtime do arquivo e,
+    ao ultrapassar ``max_entries``, os arquivos mais antigos são removidos.
+    """
+
+    backend = "disk"
+
+    def __init__(self, directory: str, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl_seconds:
+                self._remove(path)
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(value, f, ensure_ascii=False, default=str)
+            os.replace(tmp_path, self._path(key))
+        except Exception:
+            self._remove(tmp_path)
+            raise
+        self._prune()
+
+    def clear(self) -> None:
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".json"):
+                self._remove(entry.path)
+
+    def _prune(self) -> None:
+        """Remove entradas expiradas e as mais antigas acima do limite."""
+        now = time.time()
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(".json"):
+                continue
+            try:
+                mtime = entry.stat().st_mtime
+            except OSError:
+                continue
+            if now - mtime > self.ttl_seconds:
+                self._remove(entry.path)
+            else:
+                entries.append((mtime, entry.path))
+
+        excess = len(entries) - self.max_entries
+        if excess > 0:
+            entries.sort()
+            for _, path in entries[:excess]:
+                self._remove(path)
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+def cache_from_env(prefix: str) -> Optional[Union[MemoryCache, DiskCache]]:
+    """
+    Cria o cache configurado pelas variáveis de ambiente ``<prefix>_*``.
+
+    Returns:
+        MemoryCache, DiskCache ou None se o backend for ``off``.
+    """
+    backend = os.getenv(f"{prefix}_BACKEND", "memory").strip().lower()
+    if backend not in CACHE_BACKENDS:
+        raise ValueError(
+            f"{prefix}_BACKEND inválido: '{backend}'. Use: {', '.join(sorted(CACHE_BACKENDS))}"
+        )
+    if backend == "off":
+        return None
+
+    max_entries = int(os.getenv(f"{prefix}_MAX_ENTRIES", str(DEFAULT_MAX_ENTRIES)))
+    ttl_seconds = float(os.getenv(f"{prefix}_TTL_SECONDS", str(DEFAULT_TTL_SECONDS)))
+
+    if backend == "disk":
+        directory = os.getenv(f"{prefix}_DIR") or os.path.join(
+            tempfile.gettempdir(), "florescer-ia-cache", prefix.lower()
+        )
+        return DiskCache(directory, max_entries=max_entries, ttl_seconds=ttl_seconds)
+
+    return MemoryCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
@@ -0,0 +1,171 @@
+"""
+Transcrição em trechos (chunks) paralelos para gravações longas.
+
+Uma passagem longa enviada numa única chamada ao Whisper tem latência
+proporcional à duração e, se falhar, perde tudo. Aqui o WAV é dividido em
+pontos de silêncio, os trechos são transcritos em paralelo (com limite de
+concorrência e novas tentativas por trecho) e as transcrições são
+costuradas de volta em ordem, com os tempos deslocados para a linha do
+tempo do áudio completo.
+"""
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Any, List, Optional
+
+import numpy as np
+
+from .vad import FRAME_MS, speech_mask, mask_runs
+from .wav import read_wav
+
+# Duração alvo de cada trecho e limite rígido (corte sem silêncio)
+CHUNK_SECONDS = 60.0
+MAX_CHUNK_SECONDS = 90.0
+# Só divide áudios com pelo menos esta duração
+MIN_DURATION_TO_SPLIT = 120.0
+MAX_WORKERS = 4
+RETRIES = 2
+RETRY_BACKOFF_SECONDS = 1.0
+
+
+def split_at_silence(
+    data: bytes,
+    chunk_seconds: float = CHUNK_SECONDS,
+    max_chunk_seconds: float = MAX_CHUNK_SECONDS,
+    min_duration: float = MIN_DURATION_TO_SPLIT,
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    Divide um WAV PCM em trechos, cortando no meio de silêncios.
+
+    Cada corte é feito no maior silêncio entre metade da duração alvo e a
+    duração máxima a partir do início do trecho; sem silêncio nessa janela,
+    o corte é feito na duração máxima.
+
+    Returns:
+        None se o áudio não for WAV ou for curto demais para dividir; senão a
+        lista de trechos ``{"audio", "offset", "duration"}`` (em segundos).
+    """
+    audio = read_wav(data)
+    if audio is None or audio.duration < min_duration:
+        return None
+
+    sr = audio.sample_rate
+    frame_len = max(1, int(sr * FRAME_MS / 1000))
+    frame_seconds = frame_len / float(sr)
+    mask = speech_mask(audio.mono(), sr, FRAME_MS, hangover_ms=0)
+    n_frames = mask.size
+
+    # Meio de cada silêncio (em quadros) e seu tamanho
+    silences = [(start, end) for start, end, is_speech in mask_runs(mask) if not is_speech]
+    mids = np.array([(s + e) // 2 for s, e in silences], dtype=np.int64)
+    sizes = np.array([e - s for s, e in silences], dtype=np.int64)
+
+    target = int(chunk_seconds / frame_seconds)
+    limit = int(max_chunk_seconds / frame_seconds)
+    cuts = [0]
+    while n_frames - cuts[-1] > limit:
+        start = cuts[-1]
+        window = (mids >= start + target // 2) & (mids <= start + limit)
+        if window.any():
+            candidates = np.flatnonzero(window)
+            cut = int(mids[candidates[np.argmax(sizes[candidates])]])
+        else:
+            cut = start + limit
+        cuts.append(cut)
+    cuts.append(n_frames)
+
+    chunks = []
+    for a, b in zip(cuts[:-1], cuts[1:]):
+        s, e = a * frame_len, min(b * frame_len, audio.num_frames)
+        if e <= s:
+            continue
+        chunks.append({
+            "audio": audio.to_bytes(slice(s, e)),
+            "offset": s / float(sr),
+            "duration": (e - s) / float(sr),
+        })
+    return chunks if len(chunks) > 1 else None
+
+
+def _with_retries(
+    fn: Callable[[bytes], Dict[str, Any]],
+    data: bytes,
+    retries: int,
+    is_retryable: Optional[Callable[[Exception], bool]],
+) -> Dict[str, Any]:
+    attempt = 0
+    while True:
+        try:
+            return fn(data)
+        except Exception as e:
+            if attempt >= retries or is_retryable is None or not is_retryable(e):
+                raise
+            attempt += 1
+            time.sleep(RETRY_BACKOFF_SECONDS * (2 ** (attempt - 1)))
+
+
+def transcribe_chunks(
+    chunks: List[Dict[str, Any]],
+    transcribe: Callable[[bytes], Dict[str, Any]],
+    max_workers: int = MAX_WORKERS,
+    retries: int = RETRIES,
+    is_retryable: Optional[Callable[[Exception], bool]] = lambda e: True,
+) -> Dict[str, Any]:
+    """
+    Transcreve os trechos em paralelo e costura o resultado.
+
+    Args:
+        chunks: Saída de ``split_at_silence``.
+        transcribe: Função que recebe os bytes de um trecho e devolve a
+            transcrição verbose (dicionário).
+        max_workers: Máximo de chamadas simultâneas.
+        retries: Novas tentativas por trecho em erros transitórios. Use 0
+            quando ``transcribe`` já repete sozinho (ex.: via agendador).
+        is_retryable: Decide se um erro merece nova tentativa; None desliga
+            as novas tentativas.
+
+    Returns:
+        Transcrição verbose única, como se o áudio tivesse sido enviado inteiro.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks)))) as executor:
+        futures = [
+            # Cada trecho herda o contexto de quem chamou (ex.: contabilidade de uso)
+            executor.submit(contextvars.copy_context().run, _with_retries, transcribe,
+                            chunk["audio"], retries, is_retryable)
+            for chunk in chunks
+        ]
+        # Propaga a primeira falha definitiva; os demais trechos já terminaram
+        results = [future.result() for future in futures]
+    return stitch_transcriptions(results, [chunk["offset"] for chunk in chunks],
+                                 chunks[-1]["offset"] + chunks[-1]["duration"])
+
+
+def stitch_transcriptions(
+    results: List[Dict[str, Any]], offsets: List[float], total_duration: float
+) -> Dict[str, Any]:
+    """Junta transcrições de trechos consecutivos, deslocando os tempos."""
+    words: List[Dict[str, Any]] = []
+    segments: List[Dict[str, Any]] = []
+    texts: List[str] = []
+
+    for result, offset in zip(results, offsets):
+        text = (result.get("text") or "").strip()
+        if text:
+            texts.append(text)
+        for word in result.get("words") or []:
+            words.append({**word, "start": word.get("start", 0.0) + offset,
+                          "end": word.get("end", 0.0) + offset})
+        for segment in result.get("segments") or []:
+            segments.append({**segment, "id": len(segments),
+                             "start": segment.get("start", 0.0) + offset,
+                             "end": segment.get("end", 0.0) + offset})
+
+    stitched = {
+        "text": " ".join(texts),
+        "duration": total_duration,
+        "words": words,
+        "segments": segments,
+    }
+    if results and results[0].get("language"):
+        stitched["language"] = results[0]["language"]
+    return stitched
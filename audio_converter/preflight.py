@@ -0,0 +1,478 @@
+"""
+Verificação prévia (preflight) dos arquivos de áudio, sem decodificá-los.
+
+Só a extensão do arquivo era conferida antes do upload ao Whisper: arquivos
+corrompidos, vazios ou gravações de meia hora custavam uma ida e volta à API
+antes de falhar. Aqui os cabeçalhos dos contêineres são lidos em Python puro
+(WAV/RIFF, Ogg, MP4/M4A, WebM e MP3) para obter duração, taxa de amostragem e
+canais, e os limites configurados são aplicados em microssegundos.
+
+Quando o contêiner é reconhecido mas a duração não está no cabeçalho (ex.:
+WebM gravado ao vivo sem ``Duration``), a duração é estimada pelos tempos dos
+blocos; se nem isso for possível, fica ``None`` e o limite de duração não é
+aplicado.
+"""
+import struct
+from typing import Optional, Dict, Any, Tuple
+
+# Whisper recusa arquivos acima de 25 MB
+MAX_FILE_BYTES = 25 * 1024 * 1024
+MIN_DURATION_SECONDS = 0.5
+MAX_DURATION_SECONDS = 600.0
+
+
+def _info(fmt: str, codec: Optional[str] = None, duration: Optional[float] = None,
+          sample_rate: Optional[int] = None, channels: Optional[int] = None) -> Dict[str, Any]:
+    return {
+        "format": fmt,
+        "codec": codec,
+        "duration_seconds": round(duration, 3) if duration is not None and duration >= 0 else None,
+        "sample_rate": sample_rate or None,
+        "channels": channels or None,
+    }
+
+
+# ----------------------------------------------------------------------
+# WAV / RIFF
+# ----------------------------------------------------------------------
+
+def _probe_wav(data: bytes) -> Optional[Dict[str, Any]]:
+    pos = 12
+    fmt = None
+    data_size = None
+    while pos + 8 <= len(data):
+        chunk_id = data[pos:pos + 4]
+        size = struct.unpack_from("<I", data, pos + 4)[0]
+        body = pos + 8
+        if chunk_id == b"fmt " and size >= 16:
+            fmt = struct.unpack_from("<HHIIHH", data, body)
+        elif chunk_id == b"data":
+            # Tamanho 0/0xFFFFFFFF (gravação interrompida ou em fluxo): usa o resto do arquivo
+            available = len(data) - body
+            data_size = available if size in (0, 0xFFFFFFFF) or size > available else size
+            break
+        pos = body + size + (size & 1)
+
+    if fmt is None:
+        return None
+    audio_format, channels, sample_rate, byte_rate, block_align, _ = fmt
+    if channels == 0 or sample_rate == 0:
+        return None
+    codec = "pcm" if audio_format in (1, 0xFFFE) else f"0x{audio_format:04x}"
+    rate = byte_rate or block_align * sample_rate
+    duration = data_size / float(rate) if data_size is not None and rate else None
+    return _info("wav", codec, duration, sample_rate, channels)
+
+
+# ----------------------------------------------------------------------
+# Ogg (Opus / Vorbis)
+# ----------------------------------------------------------------------
+
+def _probe_ogg(data: bytes) -> Optional[Dict[str, Any]]:
+    if len(data) < 28:
+        return None
+    serial = data[14:18]
+    n_segments = data[26]
+    start = 27 + n_segments
+    packet = data[start:start + sum(data[27:start])]
+
+    if packet.startswith(b"OpusHead") and len(packet) >= 16:
+        codec = "opus"
+        channels = packet[9]
+        pre_skip = struct.unpack_from("<H", packet, 10)[0]
+        sample_rate = struct.unpack_from("<I", packet, 12)[0] or 48000
+        # Posições de granule do Opus são sempre em 48 kHz
+        granule_rate = 48000
+    elif packet.startswith(b"\x01vorbis") and len(packet) >= 16:
+        codec = "vorbis"
+        channels = packet[11]
+        sample_rate = struct.unpack_from("<I", packet, 12)[0]
+        pre_skip = 0
+        granule_rate = sample_rate
+    else:
+        return _info("ogg")
+
+    # Granule da última página do fluxo = amostras decodificadas até o fim
+    duration = None
+    pos = len(data)
+    while True:
+        pos = data.rfind(b"OggS", 0, pos)
+        if pos < 0 or pos + 27 > len(data):
+            break
+        granule = struct.unpack_from("<q", data, pos + 6)[0]
+        if data[pos + 14:pos + 18] == serial and granule >= 0:
+            if granule_rate:
+                duration = max(0, granule - pre_skip) / float(granule_rate)
+            break
+    return _info("ogg", codec, duration, sample_rate, channels)
+
+
+# ----------------------------------------------------------------------
+# MP4 / M4A (ISO BMFF)
+# ----------------------------------------------------------------------
+
+_MP4_CONTAINERS = {b"moov", b"trak", b"mdia", b"minf", b"stbl"}
+
+
+def _mp4_boxes(data: bytes, start: int, end: int):
+    pos = start
+    while pos + 8 <= end:
+        size, box_type = struct.unpack_from(">I4s", data, pos)
+        header = 8
+        if size == 1:
+            if pos + 16 > end:
+                return
+            size = struct.unpack_from(">Q", data, pos + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header:
+            return
+        yield box_type, pos + header, min(pos + size, end)
+        pos += size
+
+
+def _mp4_duration(data: bytes, body: int) -> Tuple[int, int]:
+    """(timescale, duração) de um ``mvhd``/``mdhd``."""
+    if data[body] == 1:
+        timescale, duration = struct.unpack_from(">IQ", data, body + 20)
+    else:
+        timescale, duration = struct.unpack_from(">II", data, body + 12)
+    return timescale, duration
+
+
+def _probe_mp4(data: bytes) -> Optional[Dict[str, Any]]:
+    movie = None
+    track = None  # estado (duration, codec, sample_rate, channels) da trilha de áudio
+
+    def walk(start: int, end: int, state: Dict[str, Any]) -> None:
+        nonlocal movie, track
+        for box_type, body, box_end in _mp4_boxes(data, start, end):
+            if box_type == b"trak":
+                trak_state: Dict[str, Any] = {}
+                walk(body, box_end, trak_state)
+                if trak_state.get("handler") == b"soun" and track is None:
+                    track = trak_state
+            elif box_type in _MP4_CONTAINERS:
+                walk(body, box_end, state)
+            elif box_type == b"mvhd" and box_end - body >= 32:
+                movie = _mp4_duration(data, body)
+            elif box_type == b"mdhd" and box_end - body >= 32:
+                state["duration"] = _mp4_duration(data, body)
+            elif box_type == b"hdlr" and box_end - body >= 12:
+                state["handler"] = data[body + 8:body + 12]
+            elif box_type == b"stsd" and box_end - body >= 8 + 36:
+                # Primeira entrada: tamanho(4) formato(4) reservado(6) índice(2)
+                # versão(2) revisão(2) fornecedor(4) canais(2) bits(2) ...(4) taxa 16.16(4)
+                entry = body + 8
+                state["codec"] = data[entry + 4:entry + 8].decode("latin-1").strip()
+                state["channels"] = struct.unpack_from(">H", data, entry + 24)[0]
+                state["sample_rate"] = struct.unpack_from(">I", data, entry + 32)[0] >> 16
+
+    try:
+        walk(0, len(data), {})
+    except (struct.error, IndexError):
+        pass
+
+    if track is None and movie is None:
+        return _info("mp4")
+    timescale, duration = (track or {}).get("duration") or movie or (0, 0)
+    seconds = duration / float(timescale) if timescale else None
+    track = track or {}
+    return _info("mp4", track.get("codec"), seconds, track.get("sample_rate"), track.get("channels"))
+
+
+# ----------------------------------------------------------------------
+# WebM / Matroska (EBML)
+# ----------------------------------------------------------------------
+
+_EBML_SEGMENT = 0x18538067
+_EBML_INFO = 0x1549A966
+_EBML_TRACKS = 0x1654AE6B
+_EBML_CLUSTER = 0x1F43B675
+_EBML_CLUSTER_BYTES = b"\x1f\x43\xb6\x75"
+# Elementos de nível 1: marcam o fim de um Cluster de tamanho desconhecido
+_EBML_LEVEL1 = {_EBML_INFO, _EBML_TRACKS, _EBML_CLUSTER, 0x114D9B74, 0x1C53BB6B,
+                0x1941A469, 0x1043A770, 0x1254C367}
+
+
+def _ebml_vint(data: bytes, pos: int, keep_marker: bool) -> Tuple[int, int, bool]:
+    """Lê um inteiro de tamanho variável: (valor, nova posição, tamanho desconhecido)."""
+    first = data[pos]
+    length, mask = 1, 0x80
+    while length <= 8 and not first & mask:
+        mask >>= 1
+        length += 1
+    if length > 8 or pos + length > len(data):
+        raise ValueError("vint inválido")
+    value = first if keep_marker else first & (mask - 1)
+    for byte in data[pos + 1:pos + length]:
+        value = (value << 8) | byte
+    unknown = not keep_marker and value == (1 << (7 * length)) - 1
+    return value, pos + length, unknown
+
+
+def _ebml_elements(data: bytes, start: int, end: int):
+    """Itera (id, início do conteúdo, fim) dos elementos filhos."""
+    pos = start
+    while pos < end:
+        element_id, pos, _ = _ebml_vint(data, pos, keep_marker=True)
+        size, body, unknown = _ebml_vint(data, pos, keep_marker=False)
+        yield element_id, body, end if unknown else min(body + size, end), unknown
+        pos = end if unknown else body + size
+
+
+def _ebml_uint(data: bytes, start: int, end: int) -> int:
+    return int.from_bytes(data[start:end], "big")
+
+
+def _ebml_float(data: bytes, start: int, end: int) -> Optional[float]:
+    if end - start == 4:
+        return struct.unpack_from(">f", data, start)[0]
+    if end - start == 8:
+        return struct.unpack_from(">d", data, start)[0]
+    return None
+
+
+def _webm_cluster(data: bytes, start: int, end: int) -> Tuple[Optional[int], int]:
+    """
+    Lê um Cluster a partir do seu ID.
+
+    MediaRecorder grava Clusters de tamanho desconhecido: nesse caso o
+    Cluster termina no próximo elemento de nível 1.
+
+    Returns:
+        (maior tempo de bloco, em unidades do TimecodeScale, ou None; fim do Cluster)
+    """
+    cluster_id, pos, _ = _ebml_vint(data, start, keep_marker=True)
+    if cluster_id != _EBML_CLUSTER:
+        raise ValueError("não é um Cluster")
+    size, body, unknown = _ebml_vint(data, pos, keep_marker=False)
+    cluster_end = end if unknown else min(body + size, end)
+
+    cluster_time = None
+    last = None
+    pos = body
+    while pos < cluster_end:
+        element_id, next_pos, _ = _ebml_vint(data, pos, keep_marker=True)
+        if element_id in _EBML_LEVEL1:
+            break
+        size, element_body, _ = _ebml_vint(data, next_pos, keep_marker=False)
+        if element_id == 0xE7:
+            cluster_time = _ebml_uint(data, element_body, element_body + size)
+        elif element_id in (0xA3, 0xA0) and cluster_time is not None:
+            block = element_body
+            if element_id == 0xA0:
+                # BlockGroup: o Block (0xA1) é o primeiro filho
+                _, inner, _ = _ebml_vint(data, element_body, keep_marker=True)
+                _, block, _ = _ebml_vint(data, inner, keep_marker=False)
+            _, after_track, _ = _ebml_vint(data, block, keep_marker=False)
+            relative = struct.unpack_from(">h", data, after_track)[0]
+            last = max(last or 0, cluster_time + relative)
+        pos = element_body + size
+    return last, pos
+
+
+def _probe_webm(data: bytes) -> Optional[Dict[str, Any]]:
+    timecode_scale = 1_000_000  # ns por unidade de tempo (padrão do Matroska)
+    duration_units = None
+    last_timecode = None
+    codec = sample_rate = channels = None
+
+    try:
+        for element_id, body, end, _ in _ebml_elements(data, 0, len(data)):
+            if element_id != _EBML_SEGMENT:
+                continue
+            pos = body
+            while pos < end:
+                child_start = pos
+                child_id, pos, _ = _ebml_vint(data, pos, keep_marker=True)
+                size, child_body, unknown = _ebml_vint(data, pos, keep_marker=False)
+                child_end = end if unknown else min(child_body + size, end)
+
+                if child_id == _EBML_INFO:
+                    for info_id, a, b, _ in _ebml_elements(data, child_body, child_end):
+                        if info_id == 0x2AD7B1:
+                            timecode_scale = _ebml_uint(data, a, b) or timecode_scale
+                        elif info_id == 0x4489:
+                            duration_units = _ebml_float(data, a, b)
+                elif child_id == _EBML_TRACKS:
+                    for entry_id, a, b, _ in _ebml_elements(data, child_body, child_end):
+                        if entry_id != 0xAE or sample_rate:
+                            continue
+                        entry = {k: (x, y) for k, x, y, _ in _ebml_elements(data, a, b)}
+                        if 0x83 in entry and _ebml_uint(data, *entry[0x83]) != 2:
+                            continue  # não é trilha de áudio
+                        if 0x86 in entry:
+                            codec = data[slice(*entry[0x86])].decode("latin-1")
+                        if 0xE1 in entry:
+                            for audio_id, x, y, _ in _ebml_elements(data, *entry[0xE1]):
+                                if audio_id == 0xB5:
+                                    sample_rate = int(_ebml_float(data, x, y) or 0)
+                                elif audio_id == 0x9F:
+                                    channels = _ebml_uint(data, x, y)
+                elif child_id == _EBML_CLUSTER:
+                    if duration_units:
+                        break  # a duração já veio no cabeçalho
+                    # Gravação ao vivo sem Duration: basta o último Cluster do arquivo
+                    last = data.rfind(_EBML_CLUSTER_BYTES, child_body)
+                    if last > 0:
+                        try:
+                            last_timecode, _ = _webm_cluster(data, last, end)
+                        except (ValueError, IndexError, struct.error):
+                            last_timecode = None
+                    if last_timecode is not None:
+                        break
+                    # Fallback: percorre os Clusters em sequência
+                    cluster_last, pos = _webm_cluster(data, child_start, end)
+                    if cluster_last is not None:
+                        last_timecode = max(last_timecode or 0, cluster_last)
+                    continue
+
+                if unknown and child_id != _EBML_CLUSTER:
+                    break
+                pos = child_end
+            break
+    except (ValueError, IndexError, struct.error):
+        # Arquivo truncado: fica com o que foi lido até aqui
+        pass
+
+    units = duration_units if duration_units else last_timecode
+    duration = units * timecode_scale / 1e9 if units is not None else None
+    return _info("webm", codec, duration, sample_rate, channels)
+
+
+# ----------------------------------------------------------------------
+# MP3
+# ----------------------------------------------------------------------
+
+_MP3_BITRATES = {
+    1: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+_MP3_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+
+def _probe_mp3(data: bytes) -> Optional[Dict[str, Any]]:
+    pos = 0
+    if data.startswith(b"ID3") and len(data) >= 10:
+        tag_size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        pos = 10 + tag_size + (10 if data[5] & 0x10 else 0)
+
+    # Procura o primeiro quadro (tolera um pouco de lixo após a tag)
+    limit = min(len(data) - 4, pos + 4096)
+    while pos <= limit and not (data[pos] == 0xFF and data[pos + 1] & 0xE0 == 0xE0):
+        pos += 1
+    if pos > limit:
+        return None
+
+    header = struct.unpack_from(">I", data, pos)[0]
+    version = (header >> 19) & 3
+    layer = (header >> 17) & 3
+    bitrate_index = (header >> 12) & 15
+    rate_index = (header >> 10) & 3
+    mono = (header >> 6) & 3 == 3
+    if version == 1 or layer != 1 or rate_index == 3 or bitrate_index in (0, 15):
+        # Só MPEG Layer III (mp3) com bitrate e taxa válidos
+        return None
+
+    sample_rate = _MP3_SAMPLE_RATES[version][rate_index]
+    bitrate = _MP3_BITRATES[1 if version == 3 else 2][bitrate_index] * 1000
+    samples_per_frame = 1152 if version == 3 else 576
+
+    # Bytes soltos podem imitar um sincronismo: exige o quadro seguinte
+    frame_length = samples_per_frame // 8 * bitrate // sample_rate + ((header >> 9) & 1)
+    following = pos + frame_length
+    if following + 2 <= len(data) and not (
+        data[following] == 0xFF and data[following + 1] & 0xFE == data[pos + 1] & 0xFE
+    ):
+        return None
+
+    # Cabeçalho Xing/Info (VBR) logo após as informações laterais
+    side_info = (17 if mono else 32) if version == 3 else (9 if mono else 17)
+    xing = pos + 4 + side_info
+    duration = None
+    if data[xing:xing + 4] in (b"Xing", b"Info") and len(data) >= xing + 12:
+        flags = struct.unpack_from(">I", data, xing + 4)[0]
+        if flags & 1:
+            frames = struct.unpack_from(">I", data, xing + 8)[0]
+            duration = frames * samples_per_frame / float(sample_rate)
+    if duration is None:
+        duration = (len(data) - pos) * 8 / float(bitrate)
+    return _info("mp3", "mp3", duration, sample_rate, 1 if mono else 2)
+
+
+def probe_audio(data: bytes) -> Optional[Dict[str, Any]]:
+    """
+    Identifica o contêiner pelo conteúdo e lê duração, taxa e canais.
+
+    Returns:
+        None se o conteúdo não for um formato de áudio reconhecido; senão
+        ``{"format", "codec", "duration_seconds", "sample_rate", "channels"}``
+        (campos desconhecidos ficam None).
+    """
+    try:
+        if len(data) >= 12 and data[:4] == b"RIFF" and data[8:12] == b"WAVE":
+            return _probe_wav(data)
+        if data[:4] == b"OggS":
+            return _probe_ogg(data)
+        if data[4:8] == b"ftyp":
+            return _probe_mp4(data)
+        if data[:4] == b"\x1a\x45\xdf\xa3":
+            return _probe_webm(data)
+        return _probe_mp3(data)
+    except (struct.error, IndexError, ValueError):
+        return None
+
+
+def check_audio(
+    data: bytes,
+    max_bytes: int = MAX_FILE_BYTES,
+    min_duration: float = MIN_DURATION_SECONDS,
+    max_duration: float = MAX_DURATION_SECONDS,
+) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, str]]]:
+    """
+    Aplica os limites de tamanho e duração.
+
+    Returns:
+        (informações do áudio, None) se passou; senão (informações ou None,
+        ``{"status", "message"}`` descrevendo a recusa).
+    """
+    if not data:
+        return None, {"status": "invalid_audio", "message": "O arquivo de áudio está vazio."}
+
+    if len(data) > max_bytes:
+        return None, {
+            "status": "file_too_large",
+            "message": (
+                f"Arquivo de áudio grande demais. Máximo: {max_bytes / (1024 * 1024):.0f} MB, "
+                f"Encontrado: {len(data) / (1024 * 1024):.1f} MB"
+            ),
+        }
+
+    info = probe_audio(data)
+    if info is None:
+        return None, {
+            "status": "invalid_audio",
+            "message": "O arquivo não é um áudio válido (cabeçalho não reconhecido ou corrompido).",
+        }
+
+    duration = info["duration_seconds"]
+    if duration is not None:
+        if duration < min_duration:
+            return info, {
+                "status": "audio_too_short",
+                "message": (
+                    f"Áudio curto demais. Mínimo: {min_duration:g} s, "
+                    f"Encontrado: {duration:.1f} s"
+                ),
+            }
+        if duration > max_duration:
+            return info, {
+                "status": "audio_too_long",
+                "message": (
+                    f"Áudio longo demais. Máximo: {max_duration:g} s, "
+                    f"Encontrado: {duration:.1f} s"
+                ),
+            }
+    return info, None
@@ -0,0 +1,167 @@
+"""
+Métricas locais de fluência e prosódia a partir dos timestamps do Whisper.
+
+A transcrição ``verbose_json`` traz o início e o fim de cada palavra (quando
+pedimos ``timestamp_granularities=["word", "segment"]``) e de cada segmento.
+Com isso calculamos aqui, em NumPy, o que antes era "adivinhado" pelo GPT a
+partir do texto puro:
+
+- velocidade (palavras por minuto) ao longo do tempo, em janelas fixas;
+- média e desvio padrão da velocidade entre janelas (regularidade do ritmo);
+- velocidade de articulação (desconsiderando as pausas);
+- quantidade, duração e posição das pausas e das pausas longas.
+"""
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+# Intervalo mínimo entre palavras para contar como pausa (segundos)
+PAUSE_THRESHOLD_SECONDS = 0.3
+# Pausas a partir deste valor são listadas individualmente
+LONG_PAUSE_THRESHOLD_SECONDS = 1.0
+# Tamanho da janela da linha do tempo de velocidade
+WINDOW_SECONDS = 10.0
+# Limite de pausas longas listadas na resposta
+MAX_LONG_PAUSES_LISTED = 20
+
+
+def _word_timeline(transcription: Dict[str, Any]) -> Tuple[List[str], np.ndarray, np.ndarray, str]:
+    """
+    Extrai palavras com início/fim a partir da transcrição.
+
+    Usa os timestamps por palavra quando existem; caso contrário distribui as
+    palavras de cada segmento uniformemente dentro dele (as pausas passam a
+    ser apenas os intervalos entre segmentos).
+    """
+    words = transcription.get("words") or []
+    if words:
+        texts = [str(w.get("word", "")).strip() for w in words]
+        starts = np.array([float(w.get("start", 0.0)) for w in words])
+        ends = np.array([float(w.get("end", 0.0)) for w in words])
+        return texts, starts, ends, "words"
+
+    texts: List[str] = []
+    starts_list: List[np.ndarray] = []
+    ends_list: List[np.ndarray] = []
+    for segment in transcription.get("segments") or []:
+        seg_words = str(segment.get("text", "")).split()
+        if not seg_words:
+            continue
+        start, end = float(segment.get("start", 0.0)), float(segment.get("end", 0.0))
+        bounds = np.linspace(start, max(end, start), len(seg_words) + 1)
+        texts.extend(seg_words)
+        starts_list.append(bounds[:-1])
+        ends_list.append(bounds[1:])
+
+    if not texts:
+        return [], np.empty(0), np.empty(0), "none"
+    return texts, np.concatenate(starts_list), np.concatenate(ends_list), "segments"
+
+
+def compute_prosody_metrics(
+    transcription: Dict[str, Any],
+    pause_threshold: float = PAUSE_THRESHOLD_SECONDS,
+    long_pause_threshold: float = LONG_PAUSE_THRESHOLD_SECONDS,
+    window_seconds: float = WINDOW_SECONDS,
+) -> Dict[str, Any]:
+    """
+    Calcula as métricas de ritmo e pausas de uma transcrição verbose.
+
+    Args:
+        transcription: Dicionário da transcrição (``text``, ``duration``,
+            ``words`` e/ou ``segments``).
+        pause_threshold: Intervalo mínimo entre palavras considerado pausa.
+        long_pause_threshold: Intervalo mínimo para uma pausa longa.
+        window_seconds: Tamanho da janela da linha do tempo de velocidade.
+
+    Returns:
+        Dicionário com as métricas (valores arredondados, prontos para JSON).
+    """
+    texts, starts, ends, source = _word_timeline(transcription)
+    duration = float(transcription.get("duration") or (ends[-1] if len(ends) else 0.0))
+
+    metrics: Dict[str, Any] = {
+        "source": source,
+        "window_seconds": window_seconds,
+        "words_per_minute_timeline": [],
+        "speech_rate_mean_wpm": 0.0,
+        "speech_rate_std_wpm": 0.0,
+        "articulation_rate_wpm": 0.0,
+        "pause_count": 0,
+        "pause_total_seconds": 0.0,
+        "pause_mean_seconds": 0.0,
+        "pause_max_seconds": 0.0,
+        "long_pause_count": 0,
+        "long_pauses": [],
+    }
+    if not texts or duration <= 0:
+        return metrics
+
+    # Pausas: intervalos entre o fim de uma palavra e o início da seguinte.
+    # O silêncio antes da primeira e depois da última palavra não conta.
+    gaps = np.clip(starts[1:] - ends[:-1], 0.0, None)
+    is_pause = gaps >= pause_threshold
+    pauses = gaps[is_pause]
+
+    # Velocidade por janela, pela palavra que começa em cada janela. A última
+    # janela (parcial) é normalizada pelo tempo que de fato cobre.
+    n_windows = max(1, int(np.ceil(duration / window_seconds)))
+    counts = np.bincount(
+        np.minimum((starts // window_seconds).astype(int), n_windows - 1),
+        minlength=n_windows,
+    )
+    window_lengths = np.full(n_windows, window_seconds)
+    window_lengths[-1] = duration - window_seconds * (n_windows - 1)
+    # Janelas finais muito curtas distorcem a taxa; junta com a anterior
+    if n_windows > 1 and window_lengths[-1] < window_seconds / 2:
+        counts[-2] += counts[-1]
+        window_lengths[-2] += window_lengths[-1]
+        counts, window_lengths = counts[:-1], window_lengths[:-1]
+    timeline = counts / window_lengths * 60.0
+
+    speaking_time = max(float(ends[-1] - starts[0]) - float(pauses.sum()), 1e-6)
+
+    long_idx = np.flatnonzero(gaps >= long_pause_threshold)
+    long_pauses = [
+        {
+            "after_word": texts[i],
+            "word_index": int(i),
+            "start": round(float(ends[i]), 2),
+            "duration": round(float(gaps[i]), 2),
+        }
+        for i in long_idx[:MAX_LONG_PAUSES_LISTED]
+    ]
+
+    metrics.update({
+        "words_per_minute_timeline": [round(float(v), 1) for v in timeline],
+        "speech_rate_mean_wpm": round(float(timeline.mean()), 1),
+        "speech_rate_std_wpm": round(float(timeline.std()), 1),
+        "articulation_rate_wpm": round(len(texts) / speaking_time * 60.0, 1),
+        "pause_count": int(pauses.size),
+        "pause_total_seconds": round(float(pauses.sum()), 2),
+        "pause_mean_seconds": round(float(pauses.mean()), 2) if pauses.size else 0.0,
+        "pause_max_seconds": round(float(pauses.max()), 2) if pauses.size else 0.0,
+        "long_pause_count": int(long_idx.size),
+        "long_pauses": long_pauses,
+    })
+    return metrics
+
+
+def prosody_summary(metrics: Optional[Dict[str, Any]]) -> str:
+    """Resumo numérico compacto das métricas para o prompt do GPT."""
+    if not metrics or metrics.get("source") == "none":
+        return "Métricas de ritmo indisponíveis."
+
+    linhas = [
+        f"Velocidade média por janela de {metrics['window_seconds']:.0f}s: "
+        f"{metrics['speech_rate_mean_wpm']:.1f} ppm (desvio padrão {metrics['speech_rate_std_wpm']:.1f})",
+        f"Velocidade de articulação (sem pausas): {metrics['articulation_rate_wpm']:.1f} ppm",
+        f"Pausas: {metrics['pause_count']} (total {metrics['pause_total_seconds']:.1f}s, "
+        f"média {metrics['pause_mean_seconds']:.2f}s, maior {metrics['pause_max_seconds']:.1f}s)",
+        f"Pausas longas: {metrics['long_pause_count']}",
+    ]
+    if metrics["long_pauses"]:
+        linhas.append("Pausas longas após: " + ", ".join(
+            f"'{p['after_word']}' ({p['duration']:.1f}s)" for p in metrics["long_pauses"][:5]
+        ))
+    return "\n".join(linhas)
@@ -0,0 +1,339 @@
+"""
+Agendador de chamadas à OpenAI sensível aos limites de taxa da conta.
+
+Todos os workers do gunicorn compartilham os mesmos limites (requisições e
+tokens por minuto). Para não estourá-los em rajadas, cada chamada passa por
+baldes de fichas (token buckets) guardados num SQLite local, compartilhado
+entre os processos da máquina:
+
+- ``<modelo>:requests`` — capacidade = RPM, reabastece RPM/60 por segundo;
+- ``<modelo>:tokens`` — capacidade = TPM (só para modelos de chat).
+
+Quando a API responde 429 mesmo assim, o ``Retry-After`` bloqueia o modelo
+para todos os workers, e a chamada é repetida com backoff exponencial com
+jitter. Erros transitórios de conexão e 5xx também são repetidos.
+
+``call_async``/``acquire_async`` fazem o mesmo sem bloquear o event loop
+(usados pelo servidor ASGI).
+
+Para testar contra um servidor falso que devolve 429, aponte
+``OPENAI_BASE_URL`` para ele.
+"""
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+from openai import APIConnectionError, APIStatusError, InternalServerError, RateLimitError
+
+T = TypeVar("T")
+
+DEFAULT_DB_PATH = os.path.join(tempfile.gettempdir(), "florescer-ia-ratelimit.sqlite3")
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 20.0
+# Espera máxima por vaga no balde antes de desistir da chamada
+ACQUIRE_TIMEOUT_SECONDS = 60.0
+
+
+class RateLimitTimeout(Exception):
+    """Não houve vaga nos limites de taxa dentro do tempo máximo de espera."""
+
+
+def is_transient_error(error: Exception) -> bool:
+    """Erros da OpenAI que valem uma nova tentativa (quota esgotada não vale)."""
+    if isinstance(error, RateLimitError):
+        return "insufficient_quota" not in str(error).lower()
+    return isinstance(error, (APIConnectionError, InternalServerError))
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Lê ``retry-after-ms``/``retry-after`` da resposta de erro, se houver."""
+    if not isinstance(error, APIStatusError):
+        return None
+    headers = error.response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        # Retry-After em formato de data HTTP: usa o backoff padrão
+        return None
+    return None
+
+
+class RateLimitScheduler:
+    """
+    Controla o ritmo e as novas tentativas das chamadas à OpenAI.
+
+    Args:
+        limits: ``{modelo: (rpm, tpm)}``; ``tpm`` 0 desativa o balde de tokens.
+            Modelos fora do dicionário não são limitados.
+        db_path: Arquivo SQLite compartilhado; None desativa os baldes
+            (apenas as novas tentativas continuam ativas).
+        max_retries: Novas tentativas por chamada em erros transitórios.
+    """
+
+    def __init__(self, limits: Dict[str, Tuple[int, int]], db_path: Optional[str] = DEFAULT_DB_PATH,
+                 max_retries: int = 4):
+        self.limits = limits
+        self.db_path = db_path
+        self.max_retries = max_retries
+        if self.db_path:
+            conn = self._connect()
+            try:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS buckets ("
+                    "name TEXT PRIMARY KEY, level REAL NOT NULL, "
+                    "updated REAL NOT NULL, blocked_until REAL NOT NULL DEFAULT 0)"
+                )
+            finally:
+                conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        # Uma conexão por operação: seguro entre threads e processos
+        return sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+
+    def _needs(self, model: str, tokens: int):
+        rpm, tpm = self.limits.get(model, (0, 0))
+        needs = []
+        if rpm > 0:
+            needs.append((f"{model}:requests", 1.0, float(rpm)))
+        if tpm > 0 and tokens > 0:
+            needs.append((f"{model}:tokens", float(min(tokens, tpm)), float(tpm)))
+        return needs
+
+    def _try_acquire(self, model: str, tokens: int) -> float:
+        """Retira as fichas se houver; senão devolve quantos segundos esperar."""
+        needs = self._needs(model, tokens)
+        if not needs or not self.db_path:
+            return 0.0
+
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            wait = 0.0
+            levels = []
+            for name, amount, capacity in needs:
+                row = conn.execute(
+                    "SELECT level, updated, blocked_until FROM buckets WHERE name = ?", (name,)
+                ).fetchone()
+                if row is None:
+                    level, blocked_until = capacity, 0.0
+                else:
+                    level = min(capacity, row[0] + (now - row[1]) * capacity / 60.0)
+                    blocked_until = row[2]
+                if blocked_until > now:
+                    wait = max(wait, blocked_until - now)
+                elif level < amount:
+                    wait = max(wait, (amount - level) * 60.0 / capacity)
+                levels.append((name, level - amount, blocked_until))
+
+            if wait > 0:
+                conn.execute("ROLLBACK")
+                return wait
+
+            conn.executemany(
+                "INSERT INTO buckets (name, level, updated, blocked_until) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET level = excluded.level, updated = excluded.updated",
+                [(name, level, now, blocked) for name, level, blocked in levels],
+            )
+            conn.execute("COMMIT")
+            return 0.0
+        finally:
+            conn.close()
+
+    def acquire(self, model: str, tokens: int = 0, timeout: float = ACQUIRE_TIMEOUT_SECONDS) -> None:
+        """Bloqueia até haver vaga para uma chamada de ``tokens`` tokens."""
+        deadline = time.time() + timeout
+        while True:
+            wait = self._try_acquire(model, tokens)
+            if wait <= 0:
+                return
+            if time.time() + wait > deadline:
+                raise RateLimitTimeout(
+                    f"Limite de taxa local para {model} não liberou em {timeout:.0f}s"
+                )
+            # Jitter para que os workers não acordem todos juntos
+            time.sleep(min(wait, 1.0) + random.uniform(0, 0.05))
+
+    def block(self, model: str, seconds: float) -> None:
+        """Pausa o modelo para todos os workers (ex.: após um 429 com Retry-After)."""
+        if not self.db_path or seconds <= 0:
+            return
+        name = f"{model}:requests"
+        rpm = float(self.limits.get(model, (0, 0))[0] or 1)
+        until = time.time() + seconds
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT INTO buckets (name, level, updated, blocked_until) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET blocked_until = MAX(blocked_until, excluded.blocked_until)",
+                (name, rpm, time.time(), until),
+            )
+        finally:
+            conn.close()
+
+    def backoff_delay(self, attempt: int, error: Exception, model: str) -> float:
+        """Tempo até a próxima tentativa: Retry-After ou backoff com jitter."""
+        retry_after = retry_after_seconds(error)
+        if retry_after is not None:
+            if isinstance(error, RateLimitError):
+                self.block(model, retry_after)
+            return retry_after + random.uniform(0, 0.25)
+        # "Full jitter": espalha as novas tentativas de vários workers
+        return random.uniform(BACKOFF_BASE_SECONDS, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (attempt + 1)))
+
+    def call(self, model: str, fn: Callable[[], T], tokens: int = 0,
+             on_retry: Optional[Callable[[int, Exception, float], None]] = None) -> T:
+        """
+        Executa ``fn`` respeitando os limites e repetindo erros transitórios.
+
+        Args:
+            model: Modelo chamado (define os baldes usados).
+            fn: Função sem argumentos que faz a chamada à API.
+            tokens: Estimativa de tokens da chamada (prompt + resposta).
+            on_retry: Callback opcional (tentativa, erro, espera) para logs.
+        """
+        attempt = 0
+        while True:
+            self.acquire(model, tokens)
+            try:
+                return fn()
+            except Exception as e:
+                if attempt >= self.max_retries or not is_transient_error(e):
+                    raise
+                delay = self.backoff_delay(attempt, e, model)
+                if on_retry is not None:
+                    on_retry(attempt + 1, e, delay)
+                attempt += 1
+                time.sleep(delay)
+
+    async def acquire_async(self, model: str, tokens: int = 0,
+                            timeout: float = ACQUIRE_TIMEOUT_SECONDS) -> None:
+        """Versão assíncrona de ``acquire``: espera com ``asyncio.sleep``."""
+        deadline = time.time() + timeout
+        while True:
+            # A transação no SQLite pode esperar o lock de outro processo
+            wait = await asyncio.to_thread(self._try_acquire, model, tokens)
+            if wait <= 0:
+                return
+            if time.time() + wait > deadline:
+                raise RateLimitTimeout(
+                    f"Limite de taxa local para {model} não liberou em {timeout:.0f}s"
+                )
+            await asyncio.sleep(min(wait, 1.0) + random.uniform(0, 0.05))
+
+    async def call_async(self, model: str, fn: Callable[[], Awaitable[T]], tokens: int = 0,
+                         on_retry: Optional[Callable[[int, Exception, float], None]] = None) -> T:
+        """Versão assíncrona de ``call``; ``fn`` devolve uma corrotina a cada tentativa."""
+        attempt = 0
+        while True:
+            await self.acquire_async(model, tokens)
+            try:
+                return await fn()
+            except Exception as e:
+                if attempt >= self.max_retries or not is_transient_error(e):
+                    raise
+                delay = await asyncio.to_thread(self.backoff_delay, attempt, e, model)
+                if on_retry is not None:
+                    on_retry(attempt + 1, e, delay)
+                attempt += 1
+                await asyncio.sleep(delay)
+
+
+def scheduler_from_env(models: Dict[str, Tuple[str, Optional[str]]]) -> RateLimitScheduler:
+    """
+    Cria o agendador a partir das variáveis de ambiente.
+
+    Args:
+        models: ``{modelo: (variável de RPM, variável de TPM)}``; os valores
+            padrão são os limites do tier 1 da OpenAI. Sem variável de TPM,
+            só o RPM é limitado.
+    """
+    enabled = os.getenv("OPENAI_RATE_LIMITER", "1").strip().lower() in ("1", "true", "yes", "on")
+    limits = {
+        model: (int(os.getenv(rpm_var, "500")), int(os.getenv(tpm_var, "200000")) if tpm_var else 0)
+        for model, (rpm_var, tpm_var) in models.items()
+    }
+    db_path = (os.getenv("OPENAI_RATE_LIMIT_DB") or DEFAULT_DB_PATH) if enabled else None
+    return RateLimitScheduler(
+        limits,
+        db_path=db_path,
+        max_retries=int(os.getenv("OPENAI_MAX_RETRIES", "4")),
+    )
+
+
+def _outro_worker(db_path: str, model: str, rpm: int) -> float:
+    # Roda noutro processo: quanto esperaria pelo balde compartilhado
+    return RateLimitScheduler({model: (rpm, 0)}, db_path=db_path)._try_acquire(model, 0)
+
+
+if __name__ == "__main__":
+    # Autoteste: python -m audio_converter.rate_limiter
+    import threading
+    from concurrent.futures import ProcessPoolExecutor
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    from openai import OpenAI
+
+    RETRY_AFTER = 1.0
+    chamadas = []
+
+    class ServidorFalso(BaseHTTPRequestHandler):
+        """Responde 429 com Retry-After na primeira chamada e 200 depois."""
+
+        def do_GET(self):
+            chamadas.append(time.time())
+            if len(chamadas) == 1:
+                corpo = b'{"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}}'
+                self.send_response(429)
+                self.send_header("retry-after", str(RETRY_AFTER))
+            else:
+                corpo = b'{"object": "list", "data": []}'
+                self.send_response(200)
+            self.send_header("content-type", "application/json")
+            self.send_header("content-length", str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def log_message(self, *args):
+            pass
+
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), ServidorFalso)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+
+    with tempfile.TemporaryDirectory() as pasta:
+        db = os.path.join(pasta, "ratelimit.sqlite3")
+        modelo = "modelo-teste"
+
+        # 1) Um 429 com Retry-After: a nova tentativa espera pelo menos esse tempo
+        # e o modelo fica bloqueado no SQLite para os outros workers
+        scheduler = RateLimitScheduler({modelo: (600, 0)}, db_path=db, max_retries=2)
+        client = OpenAI(api_key="teste", base_url=f"http://127.0.0.1:{servidor.server_port}/v1", max_retries=0)
+        bloqueios = []
+        scheduler.call(modelo, client.models.list,
+                       on_retry=lambda tentativa, erro, espera: bloqueios.append(_outro_worker(db, modelo, 600)))
+        intervalo = chamadas[1] - chamadas[0]
+        assert len(chamadas) == 2, chamadas
+        assert intervalo >= RETRY_AFTER, f"nova tentativa após {intervalo:.2f}s (< Retry-After)"
+        assert bloqueios and bloqueios[0] > 0.5 * RETRY_AFTER, bloqueios
+        print(f"Retry-After respeitado: nova tentativa após {intervalo:.2f}s; outro worker esperaria {bloqueios[0]:.2f}s")
+
+        # 2) Dois workers (processos) dividem o mesmo balde: com o balde
+        # esvaziado aqui, o outro processo precisa esperar o reabastecimento
+        rpm = 6
+        local = RateLimitScheduler({"balde": (rpm, 0)}, db_path=db)
+        for _ in range(rpm):
+            local.acquire("balde", timeout=1)
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            espera = executor.submit(_outro_worker, db, "balde", rpm).result()
+        assert espera > 0.5 * 60.0 / rpm, espera
+        print(f"Balde compartilhado: o outro worker esperaria {espera:.2f}s")
+
+    servidor.shutdown()
+    print("OK")
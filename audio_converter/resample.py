@@ -0,0 +1,117 @@
+"""
+Normalização de WAV para o Whisper: mono, 16 kHz, PCM 16 bits.
+
+Os aparelhos dos professores gravam WAV estéreo a 44,1/48 kHz, várias vezes
+maior do que o necessário para reconhecimento de fala (o Whisper converte
+tudo para 16 kHz mono do lado dele). Em redes escolares lentas o upload é
+boa parte da latência; aqui o WAV é reduzido localmente antes do envio.
+
+A reamostragem é polifásica (filtro FIR sinc com janela de Kaiser),
+vetorizada com NumPy: para cada fase do filtro, as janelas de entrada são
+uma visão sem cópia (``sliding_window_view``) e o cálculo vira um produto
+matriz-vetor.
+"""
+from math import gcd
+from typing import Optional, Dict, Any
+
+import numpy as np
+
+from .wav import read_wav, encode_wav
+
+TARGET_SAMPLE_RATE = 16000
+# Cruzamentos por zero de cada lado do sinc e forma da janela de Kaiser
+ZERO_CROSSINGS = 10
+KAISER_BETA = 8.0
+# Fração da nova frequência de Nyquist mantida pelo filtro passa-baixas
+ROLLOFF = 0.94
+
+
+def _polyphase_filter(up: int, down: int) -> np.ndarray:
+    """
+    Filtro passa-baixas na taxa ``up`` vezes maior, já dividido em fases.
+
+    Returns:
+        Matriz (up, taps) com a resposta de cada fase, invertida para o
+        produto direto com as janelas de entrada.
+    """
+    factor = max(up, down)
+    half = ZERO_CROSSINGS * factor
+    cutoff = ROLLOFF * 0.5 / factor  # ciclos por amostra na taxa superamostrada
+    n = np.arange(-half, half + 1, dtype=np.float64)
+    h = 2 * cutoff * np.sinc(2 * cutoff * n) * np.kaiser(n.size, KAISER_BETA)
+    h *= up / h.sum()  # ganho unitário após a inserção de zeros
+
+    taps = -(-h.size // up)
+    padded = np.zeros(taps * up, dtype=np.float64)
+    padded[:h.size] = h
+    # fase p usa h[p], h[p + up], h[p + 2*up], ...
+    return padded.reshape(taps, up).T[:, ::-1].astype(np.float32)
+
+
+def resample_poly(x: np.ndarray, sample_rate: int, target_rate: int) -> np.ndarray:
+    """
+    Reamostra um sinal mono (float32) de ``sample_rate`` para ``target_rate``.
+
+    Equivale a superamostrar por ``up``, filtrar e subamostrar por ``down``,
+    mas só calcula as amostras de saída.
+    """
+    if sample_rate == target_rate or x.size == 0:
+        return x.astype(np.float32, copy=False)
+
+    g = gcd(sample_rate, target_rate)
+    up, down = target_rate // g, sample_rate // g
+    bank = _polyphase_filter(up, down)
+    taps = bank.shape[1]
+    delay = ZERO_CROSSINGS * max(up, down)  # centro do filtro (atraso de grupo)
+
+    n_out = -(-x.size * up // down)
+    last_index = ((n_out - 1) * down + delay) // up
+    x_pad = np.zeros(last_index + taps + 1, dtype=np.float32)
+    x_pad[taps - 1:taps - 1 + x.size] = x
+    windows = np.lib.stride_tricks.sliding_window_view(x_pad, taps)
+
+    y = np.empty(n_out, dtype=np.float32)
+    for n0 in range(min(up, n_out)):
+        t = n0 * down + delay
+        phase, start = t % up, t // up
+        # saídas n0, n0 + up, n0 + 2*up, ... têm a mesma fase e janelas
+        # espaçadas de ``down`` amostras
+        count = len(range(n0, n_out, up))
+        y[n0::up] = windows[start:start + count * down:down] @ bank[phase]
+    return y
+
+
+def normalize_wav(data: bytes, target_rate: int = TARGET_SAMPLE_RATE) -> Optional[Dict[str, Any]]:
+    """
+    Converte um WAV PCM para mono, ``target_rate`` Hz e 16 bits.
+
+    Áudios com taxa abaixo de ``target_rate`` não são superamostrados
+    (apenas convertidos para mono/16 bits).
+
+    Returns:
+        None se não for WAV PCM ou se já estiver no formato alvo (nada a
+        ganhar); senão ``{"audio", "original_bytes", "normalized_bytes",
+        "bytes_saved", "original_sample_rate", "original_channels",
+        "sample_rate"}``.
+    """
+    audio = read_wav(data)
+    if audio is None or audio.num_frames == 0:
+        return None
+
+    rate = min(audio.sample_rate, target_rate)
+    if audio.channels == 1 and audio.sampwidth == 2 and audio.sample_rate == rate:
+        return None
+
+    mono = resample_poly(audio.mono(), audio.sample_rate, rate)
+    normalized = encode_wav(mono, rate)
+    if len(normalized) >= len(data):
+        return None
+    return {
+        "audio": normalized,
+        "original_bytes": len(data),
+        "normalized_bytes": len(normalized),
+        "bytes_saved": len(data) - len(normalized),
+        "original_sample_rate": audio.sample_rate,
+        "original_channels": audio.channels,
+        "sample_rate": rate,
+    }
@@ -0,0 +1,375 @@
+"""
+Avaliação de leitura em tempo real via WebSocket (servida por ``ws_server.py``).
+
+O fluxo normal só começa depois que a gravação inteira é enviada; aqui o
+áudio chega em pedaços enquanto o aluno lê. O buffer é cortado em silêncios
+a cada ~``AUDIO_STREAM_SEGMENT_SECONDS``, e cada trecho fechado vai ao
+Whisper em segundo plano. O cliente recebe transcrições parciais e o
+progresso do alinhamento com o texto de referência; ao final só falta
+transcrever o último trecho e chamar a avaliação.
+
+Protocolo (mensagens de texto em JSON, áudio em mensagens binárias):
+
+1. cliente: ``{"type": "start", "texto": "...", "sample_rate": 16000, "channels": 1}``
+   (``"incluir_uso": true`` acrescenta ``usage`` ao resultado)
+2. servidor: ``{"type": "ready", ...}``
+3. cliente: quadros PCM 16 bits little-endian intercalados (binário), quantos quiser
+4. servidor: ``{"type": "partial", "segment", "text", "transcript", "progress", ...}``
+5. cliente: ``{"type": "stop"}``
+6. servidor: ``{"type": "result", "http_status", ...}`` com o mesmo corpo de
+   ``analyze_audio_request``; a conexão é fechada em seguida.
+"""
+import asyncio
+import json
+import os
+import time
+from typing import Optional, Tuple, Dict, Any, List
+
+import numpy as np
+
+from log_config import new_request_id
+from .alignment import alignment_progress
+from .async_audio_service import _get_client, _transcribe_audio_async
+from .audio_service import (
+    CHUNK_CONCURRENCY,
+    EVALUATION_MODEL,
+    MAX_AUDIO_SECONDS,
+    MIN_AUDIO_SECONDS,
+    NORMALIZE_SAMPLE_RATE,
+    _build_success_response,
+    _error_response,
+    _estimate_tokens,
+    _evaluation_cache_key,
+    _evaluation_params,
+    _get_api_key,
+    _get_cached_evaluation,
+    _local_analysis,
+    _log_debug,
+    _log_retry,
+    _parse_evaluation,
+    _scheduler,
+    _store_evaluation,
+)
+from .chunking import stitch_transcriptions
+from .resample import resample_poly
+from .usage import track_call, usage_request
+from .vad import FRAME_MS, speech_mask, mask_runs
+from .wav import encode_wav
+
+# Duração alvo de cada trecho e corte forçado quando não há silêncio
+SEGMENT_SECONDS = float(os.getenv("AUDIO_STREAM_SEGMENT_SECONDS", "15"))
+MAX_SEGMENT_SECONDS = SEGMENT_SECONDS * 1.5
+# Silêncio mínimo para cortar sem partir uma palavra
+MIN_CUT_SILENCE_SECONDS = 0.15
+# Tempo máximo de espera pela mensagem "start"
+START_TIMEOUT_SECONDS = 10.0
+MIN_SAMPLE_RATE, MAX_SAMPLE_RATE = 8000, 48000
+
+
+def find_cut(mono: np.ndarray, sample_rate: int, min_seconds: float, max_seconds: float) -> Optional[int]:
+    """
+    Ponto de corte (em amostras) no maior silêncio após ``min_seconds``.
+
+    Returns:
+        None se ainda não houver silêncio adequado e o buffer não tiver
+        chegado a ``max_seconds``; nesse caso o corte é forçado no limite.
+    """
+    frame_len = max(1, int(sample_rate * FRAME_MS / 1000))
+    mask = speech_mask(mono, sample_rate, FRAME_MS, hangover_ms=0)
+    min_frames = int(min_seconds * sample_rate / frame_len)
+    min_silence = max(1, int(MIN_CUT_SILENCE_SECONDS * sample_rate / frame_len))
+
+    best = None
+    # O último run pode ser um silêncio ainda em andamento: não corta nele
+    for start, end, is_speech in mask_runs(mask)[:-1]:
+        if is_speech or end - start < min_silence or (start + end) // 2 < min_frames:
+            continue
+        if best is None or end - start > best[1] - best[0]:
+            best = (start, end)
+    if best is not None:
+        return (best[0] + best[1]) // 2 * frame_len
+    if mono.size >= max_seconds * sample_rate:
+        return int(max_seconds * sample_rate)
+    return None
+
+
+class StreamSession:
+    """
+    Estado de uma leitura em andamento.
+
+    Args:
+        websocket: Conexão (``websockets``) usada para enviar as parciais.
+        reference_text: Texto de referência (``texto``), opcional.
+        sample_rate: Taxa do PCM recebido.
+        channels: Canais do PCM recebido (intercalados).
+    """
+
+    def __init__(self, websocket, reference_text: Optional[str], sample_rate: int, channels: int, api_key: str):
+        self.websocket = websocket
+        self.reference_text = reference_text
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.client = _get_client(api_key)
+
+        self._leftover = b""  # bytes de um quadro incompleto entre mensagens
+        self._pending: List[np.ndarray] = []
+        self._pending_samples = 0
+        self.consumed_samples = 0  # amostras já enviadas em trechos fechados
+
+        self.tasks: List[asyncio.Task] = []
+        self.offsets: List[float] = []
+        self.results: List[Optional[Dict[str, Any]]] = []
+        self.errors: List[Exception] = []
+        self._emitted = 0
+        self._emit_lock = asyncio.Lock()
+        self._semaphore = asyncio.Semaphore(max(1, CHUNK_CONCURRENCY))
+
+    @property
+    def duration(self) -> float:
+        return (self.consumed_samples + self._pending_samples) / float(self.sample_rate)
+
+    def feed(self, data: bytes) -> None:
+        """Acrescenta PCM recebido e dispara a transcrição dos trechos fechados."""
+        data = self._leftover + data
+        frame_bytes = 2 * self.channels
+        usable = len(data) - len(data) % frame_bytes
+        self._leftover = data[usable:]
+        if not usable:
+            return
+
+        samples = np.frombuffer(data[:usable], dtype="<i2").astype(np.float32) / 32768.0
+        mono = samples.reshape(-1, self.channels).mean(axis=1) if self.channels > 1 else samples
+        self._pending.append(mono)
+        self._pending_samples += mono.size
+
+        if self._pending_samples >= SEGMENT_SECONDS * self.sample_rate:
+            buffer = np.concatenate(self._pending)
+            cut = find_cut(buffer, self.sample_rate, SEGMENT_SECONDS / 2, MAX_SEGMENT_SECONDS)
+            if cut:
+                self._close_segment(buffer[:cut])
+                rest = buffer[cut:]
+                self._pending = [rest]
+                self._pending_samples = rest.size
+            else:
+                self._pending = [buffer]
+
+    def _close_segment(self, samples: np.ndarray) -> None:
+        index = len(self.tasks)
+        offset = self.consumed_samples / float(self.sample_rate)
+        self.consumed_samples += samples.size
+        self.offsets.append(offset)
+        self.results.append(None)
+        self.tasks.append(asyncio.create_task(self._transcribe_segment(index, samples)))
+
+    async def _transcribe_segment(self, index: int, samples: np.ndarray) -> None:
+        async with self._semaphore:
+            try:
+                rate = min(self.sample_rate, NORMALIZE_SAMPLE_RATE)
+                audio = await asyncio.to_thread(
+                    lambda: encode_wav(resample_poly(samples, self.sample_rate, rate), rate)
+                )
+                self.results[index] = await _transcribe_audio_async(
+                    self.client, audio, f"trecho-{index}.wav"
+                )
+            except Exception as e:
+                self.errors.append(e)
+                return
+        await self._emit_ready()
+
+    async def _emit_ready(self) -> None:
+        """Envia, em ordem, as parciais dos trechos já transcritos."""
+        async with self._emit_lock:
+            while self._emitted < len(self.results) and self.results[self._emitted] is not None:
+                index = self._emitted
+                self._emitted += 1
+                transcript = " ".join(
+                    (r.get("text") or "").strip() for r in self.results[:index + 1]
+                ).strip()
+                message = {
+                    "type": "partial",
+                    "segment": index,
+                    "offset_seconds": round(self.offsets[index], 2),
+                    "text": (self.results[index].get("text") or "").strip(),
+                    "transcript": transcript,
+                    "duration_seconds": round(self.duration, 2),
+                }
+                if self.reference_text:
+                    message["progress"] = await asyncio.to_thread(
+                        alignment_progress, self.reference_text, transcript
+                    )
+                try:
+                    await self.websocket.send(json.dumps(message, ensure_ascii=False))
+                except Exception:
+                    # Cliente desconectou: a sessão será cancelada pelo handler
+                    return
+
+    def cancel(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+
+    async def finish(self) -> Tuple[Dict[str, Any], int]:
+        """Transcreve o que resta, espera os trechos e faz a avaliação."""
+        started = time.perf_counter()
+        if self._pending_samples:
+            tail = np.concatenate(self._pending)
+            self._pending, self._pending_samples = [], 0
+            # Resto sem fala (silêncio final) não vai ao Whisper
+            if speech_mask(tail, self.sample_rate, FRAME_MS).any():
+                self._close_segment(tail)
+            else:
+                self.consumed_samples += tail.size
+
+        total_duration = self.consumed_samples / float(self.sample_rate)
+        if total_duration < MIN_AUDIO_SECONDS or not self.tasks:
+            self.cancel()
+            return {
+                "status": "audio_too_short",
+                "message": (
+                    f"Áudio curto demais ou sem fala. Mínimo: {MIN_AUDIO_SECONDS:g} s, "
+                    f"Encontrado: {total_duration:.1f} s"
+                ),
+            }, 200
+
+        await asyncio.gather(*self.tasks)
+        try:
+            if self.errors:
+                raise self.errors[0]
+            transcription = stitch_transcriptions(self.results, self.offsets, total_duration)
+            analysis = await asyncio.to_thread(_local_analysis, transcription, self.reference_text)
+
+            evaluation_key = _evaluation_cache_key(analysis["transcribed_text"], self.reference_text)
+            evaluation, evaluation_cache_status = await asyncio.to_thread(
+                _get_cached_evaluation, evaluation_key
+            )
+            if evaluation is None:
+                messages = analysis["messages"]
+                with track_call(EVALUATION_MODEL, "chat") as call:
+                    response = await _scheduler.call_async(
+                        EVALUATION_MODEL,
+                        lambda: self.client.chat.completions.create(**_evaluation_params(messages)),
+                        tokens=_estimate_tokens(messages),
+                        on_retry=call.retry_hook(_log_retry),
+                    )
+                    call.set_token_usage(response.usage)
+                evaluation = _parse_evaluation(response.choices[0].message.content)
+                await asyncio.to_thread(_store_evaluation, evaluation_key, evaluation)
+
+            preprocessing = {
+                "streaming": {
+                    "segments": len(self.tasks),
+                    "finalize_seconds": round(time.perf_counter() - started, 2),
+                }
+            }
+            result = _build_success_response(
+                evaluation,
+                analysis,
+                self.reference_text,
+                preprocessing,
+                {"transcription": "disabled", "evaluation": evaluation_cache_status},
+            )
+            return result, 200
+        except Exception as e:
+            return _error_response(e)
+
+
+def _parse_start(message) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """Valida a mensagem inicial; devolve (parâmetros, erro)."""
+    if not isinstance(message, str):
+        return None, "A primeira mensagem deve ser o JSON 'start'."
+    try:
+        start = json.loads(message)
+    except json.JSONDecodeError:
+        return None, "A mensagem 'start' não é um JSON válido."
+    if not isinstance(start, dict) or start.get("type") != "start":
+        return None, "A primeira mensagem deve ter type 'start'."
+
+    try:
+        sample_rate = int(start.get("sample_rate", 16000))
+        channels = int(start.get("channels", 1))
+    except (TypeError, ValueError):
+        return None, "Os campos 'sample_rate' e 'channels' devem ser números inteiros."
+    if not MIN_SAMPLE_RATE <= sample_rate <= MAX_SAMPLE_RATE:
+        return None, f"sample_rate deve estar entre {MIN_SAMPLE_RATE} e {MAX_SAMPLE_RATE}."
+    if channels not in (1, 2):
+        return None, "channels deve ser 1 ou 2."
+    texto = start.get("texto")
+    if texto is not None and not isinstance(texto, str):
+        return None, "O campo 'texto' deve ser uma string."
+    return {
+        "reference_text": texto,
+        "sample_rate": sample_rate,
+        "channels": channels,
+        "include_usage": start.get("incluir_uso") is True,
+    }, None
+
+
+async def _send_result(websocket, result: Dict[str, Any], status: int) -> None:
+    await websocket.send(json.dumps({"type": "result", "http_status": status, **result}, ensure_ascii=False))
+
+
+async def handle_stream(websocket) -> None:
+    """Atende uma conexão WebSocket de leitura em tempo real."""
+    new_request_id(websocket.request.headers.get("X-Request-ID") if websocket.request else None)
+    try:
+        message = await asyncio.wait_for(websocket.recv(), timeout=START_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        await _send_result(websocket, {"status": "bad_request", "message": "Mensagem 'start' não recebida."}, 400)
+        return
+
+    params, error = _parse_start(message)
+    if error:
+        await _send_result(websocket, {"status": "bad_request", "message": error}, 400)
+        return
+
+    api_key, config_error = _get_api_key()
+    if config_error:
+        await _send_result(websocket, *config_error)
+        return
+
+    include_usage = params.pop("include_usage")
+    # Os trechos são tarefas criadas dentro deste contexto e entram na mesma contabilidade
+    with usage_request("analisar-audio-stream") as usage:
+        await _run_session(websocket, api_key, params, include_usage, usage)
+
+
+async def _run_session(websocket, api_key: str, params: Dict[str, Any], include_usage: bool, usage) -> None:
+    session = StreamSession(websocket, api_key=api_key, **params)
+    _log_debug("Leitura em tempo real iniciada", params | {"reference_text": bool(params["reference_text"])})
+    await websocket.send(json.dumps({
+        "type": "ready",
+        "sample_rate": session.sample_rate,
+        "channels": session.channels,
+        "segment_seconds": SEGMENT_SECONDS,
+    }))
+
+    try:
+        async for message in websocket:
+            if isinstance(message, bytes):
+                session.feed(message)
+                if session.duration > MAX_AUDIO_SECONDS:
+                    session.cancel()
+                    await _send_result(websocket, {
+                        "status": "audio_too_long",
+                        "message": f"Áudio longo demais. Máximo: {MAX_AUDIO_SECONDS:g} s",
+                    }, 200)
+                    return
+                continue
+
+            try:
+                control = json.loads(message)
+            except json.JSONDecodeError:
+                control = {}
+            if isinstance(control, dict) and control.get("type") == "stop":
+                result, status = await session.finish()
+                _log_debug("Leitura em tempo real finalizada", {
+                    "status": result.get("status"),
+                    "segments": len(session.tasks),
+                    "duration": round(session.duration, 2),
+                })
+                if include_usage:
+                    result["usage"] = usage.summary()
+                await _send_result(websocket, result, status)
+                return
+    finally:
+        # Desconexão antes do "stop": nada a avaliar
+        session.cancel()
@@ -0,0 +1,322 @@
+"""
+Contabilidade das chamadas à OpenAI: tempo, áudio, tokens, novas tentativas e custo.
+
+Cada análise abre um registro (``usage_request``) guardado num ContextVar;
+as chamadas ao Whisper e ao chat feitas dentro dela (``track_call``), inclusive
+em threads e tarefas asyncio derivadas, são anotadas nesse registro. Ao final
+o registro pode ir na resposta (opt-in) e é gravado num SQLite local por uma
+thread em segundo plano, compartilhado por todos os workers e servidores
+(Flask, ASGI, WebSocket) da máquina. ``usage_stats`` agrega por endpoint e
+janela de tempo para o endpoint interno de estatísticas.
+"""
+import contextvars
+import json
+import os
+import queue
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, List, Callable
+
+from log_config import get_logger
+
+logger = get_logger("audio.usage")
+
+DEFAULT_DB_PATH = os.path.join(tempfile.gettempdir(), "florescer-ia-usage.sqlite3")
+
+# Preços em USD da tabela pública da OpenAI; OPENAI_PRICES (JSON) sobrescreve
+DEFAULT_PRICES: Dict[str, Dict[str, float]] = {
+    "whisper-1": {"audio_minute": 0.006},
+    "gpt-4o-mini": {"input_1m": 0.15, "output_1m": 0.60},
+    "gpt-4o": {"input_1m": 2.50, "output_1m": 10.00},
+}
+
+TRACKING_ENABLED = os.getenv("OPENAI_USAGE_TRACKING", "1").strip().lower() in ("1", "true", "yes", "on")
+DB_PATH = os.getenv("OPENAI_USAGE_DB") or DEFAULT_DB_PATH
+RETENTION_SECONDS = float(os.getenv("OPENAI_USAGE_RETENTION_HOURS", "168")) * 3600
+PRICES = {**DEFAULT_PRICES, **json.loads(os.getenv("OPENAI_PRICES") or "{}")}
+
+_current: contextvars.ContextVar[Optional["RequestUsage"]] = contextvars.ContextVar(
+    "openai_usage", default=None
+)
+
+
+def usage_requested(value: Optional[str]) -> bool:
+    """Interpreta o campo ``incluir_uso`` do formulário."""
+    return (value or "").strip().lower() in ("1", "true", "sim", "yes", "on")
+
+
+def estimate_cost(model: str, audio_seconds: float = 0.0, prompt_tokens: int = 0,
+                  completion_tokens: int = 0) -> float:
+    """Custo estimado (USD) de uma chamada; modelos sem preço custam 0."""
+    price = PRICES.get(model, {})
+    return (
+        audio_seconds / 60.0 * price.get("audio_minute", 0.0)
+        + prompt_tokens / 1e6 * price.get("input_1m", 0.0)
+        + completion_tokens / 1e6 * price.get("output_1m", 0.0)
+    )
+
+
+class CallUsage:
+    """Uma chamada à OpenAI (incluindo as novas tentativas)."""
+
+    def __init__(self, model: str, kind: str):
+        self.model = model
+        self.kind = kind
+        self.audio_seconds = 0.0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.retries = 0
+        self.error: Optional[str] = None
+        self._started = time.perf_counter()
+        self.wall_seconds = 0.0
+
+    def retry_hook(self, callback: Optional[Callable[[int, Exception, float], None]] = None):
+        """Callback ``on_retry`` do agendador que também conta as novas tentativas."""
+        def on_retry(attempt: int, error: Exception, delay: float) -> None:
+            self.retries += 1
+            if callback is not None:
+                callback(attempt, error, delay)
+        return on_retry
+
+    def set_token_usage(self, usage) -> None:
+        """Lê ``prompt_tokens``/``completion_tokens`` do ``usage`` da resposta."""
+        if usage is not None:
+            self.prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+            self.completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "kind": self.kind,
+            "wall_seconds": round(self.wall_seconds, 3),
+            "audio_seconds": round(self.audio_seconds, 2),
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "retries": self.retries,
+            "cost_usd": round(estimate_cost(self.model, self.audio_seconds, self.prompt_tokens,
+                                            self.completion_tokens), 6),
+            "error": self.error,
+        }
+
+
+class RequestUsage:
+    """Chamadas à OpenAI feitas por uma análise."""
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.request_id = uuid.uuid4().hex
+        self.calls: List[CallUsage] = []
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self.timestamp = time.time()
+        self.wall_seconds = 0.0
+
+    def add(self, call: CallUsage) -> None:
+        with self._lock:
+            self.calls.append(call)
+
+    def summary(self) -> Dict[str, Any]:
+        """Resumo para a resposta: totais e chamadas, com tempos por tipo."""
+        calls = [c.as_dict() for c in self.calls]
+
+        def total(field: str, kind: Optional[str] = None):
+            return sum(c[field] for c in calls if kind is None or c["kind"] == kind)
+
+        return {
+            "request_id": self.request_id,
+            "endpoint": self.endpoint,
+            "wall_seconds": round(self.wall_seconds or time.perf_counter() - self._started, 3),
+            "transcription_seconds": round(total("wall_seconds", "transcription"), 3),
+            "evaluation_seconds": round(total("wall_seconds", "chat"), 3),
+            "audio_seconds": round(total("audio_seconds"), 2),
+            "prompt_tokens": total("prompt_tokens"),
+            "completion_tokens": total("completion_tokens"),
+            "retries": total("retries"),
+            "cost_usd": round(total("cost_usd"), 6),
+            "calls": calls,
+        }
+
+
+@contextmanager
+def track_call(model: str, kind: str):
+    """
+    Mede uma chamada à OpenAI e a anota na análise corrente.
+
+    ``kind`` é ``"transcription"`` ou ``"chat"``. Quem chama preenche
+    ``audio_seconds``/tokens a partir da resposta.
+    """
+    call = CallUsage(model, kind)
+    try:
+        yield call
+    except Exception as e:
+        call.error = type(e).__name__
+        raise
+    finally:
+        call.wall_seconds = time.perf_counter() - call._started
+        usage = _current.get()
+        if usage is not None:
+            usage.add(call)
+
+
+@contextmanager
+def usage_request(endpoint: str):
+    """Abre o registro de uso de uma análise e o grava ao sair."""
+    usage = RequestUsage(endpoint)
+    token = _current.set(usage)
+    try:
+        yield usage
+    finally:
+        _current.reset(token)
+        usage.wall_seconds = time.perf_counter() - usage._started
+        if TRACKING_ENABLED and usage.calls:
+            _writer.submit(usage)
+
+
+class _UsageWriter:
+    """Grava os registros no SQLite numa thread própria, fora do caminho da requisição."""
+
+    PRUNE_EVERY = 200
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._queue: "queue.Queue[RequestUsage]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS openai_calls ("
+            "ts REAL NOT NULL, request_id TEXT NOT NULL, endpoint TEXT NOT NULL, "
+            "request_wall REAL NOT NULL, model TEXT NOT NULL, kind TEXT NOT NULL, "
+            "wall REAL NOT NULL, audio REAL NOT NULL, prompt_tokens INTEGER NOT NULL, "
+            "completion_tokens INTEGER NOT NULL, retries INTEGER NOT NULL, "
+            "cost REAL NOT NULL, error TEXT)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS openai_calls_ts ON openai_calls (ts)")
+        return conn
+
+    def submit(self, usage: RequestUsage) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="openai-usage-writer", daemon=True)
+                self._thread.start()
+        self._queue.put(usage)
+
+    def _run(self) -> None:
+        conn = self.connect()
+        while True:
+            batch = [self._queue.get()]
+            # Junta o que chegou enquanto esperava numa só transação
+            while len(batch) < 100:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            rows = [
+                (u.timestamp, u.request_id, u.endpoint, u.wall_seconds, c.model, c.kind,
+                 c.wall_seconds, c.audio_seconds, c.prompt_tokens, c.completion_tokens,
+                 c.retries, estimate_cost(c.model, c.audio_seconds, c.prompt_tokens, c.completion_tokens),
+                 c.error)
+                for u in batch for c in u.calls
+            ]
+            try:
+                with conn:
+                    conn.executemany(
+                        "INSERT INTO openai_calls VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+                    )
+                    self._writes += len(batch)
+                    if self._writes >= self.PRUNE_EVERY:
+                        self._writes = 0
+                        conn.execute("DELETE FROM openai_calls WHERE ts < ?", (time.time() - RETENTION_SECONDS,))
+            except sqlite3.Error as e:
+                logger.warning("Falha ao gravar uso da OpenAI: %s", e)
+
+    def flush(self, timeout: float = 5.0) -> None:
+        """Espera a fila esvaziar (usado em testes e no desligamento)."""
+        deadline = time.time() + timeout
+        while not self._queue.empty() and time.time() < deadline:
+            time.sleep(0.01)
+        time.sleep(0.05)
+
+
+_writer = _UsageWriter(DB_PATH)
+
+
+def usage_stats(window_seconds: int = 300, since_seconds: int = 3600) -> Dict[str, Any]:
+    """
+    Agrega as chamadas gravadas por endpoint e janela de tempo.
+
+    Args:
+        window_seconds: Tamanho de cada janela.
+        since_seconds: Até quanto tempo atrás considerar.
+
+    Returns:
+        ``{"window_seconds", "since", "endpoints": {endpoint: [janela, ...]}}``;
+        cada janela traz requisições, tempos médio/máximo, custo e, por
+        modelo, chamadas, tempos, áudio, tokens, novas tentativas e erros.
+    """
+    since = time.time() - since_seconds
+    conn = _writer.connect()
+    try:
+        requests = conn.execute(
+            "SELECT endpoint, CAST(ts / ? AS INTEGER) * ? AS bucket, COUNT(*), "
+            "AVG(request_wall), MAX(request_wall) FROM ("
+            "  SELECT endpoint, request_id, MIN(ts) AS ts, MAX(request_wall) AS request_wall "
+            "  FROM openai_calls WHERE ts >= ? GROUP BY endpoint, request_id"
+            ") GROUP BY endpoint, bucket ORDER BY bucket",
+            (window_seconds, window_seconds, since),
+        ).fetchall()
+        calls = conn.execute(
+            "SELECT endpoint, CAST(ts / ? AS INTEGER) * ? AS bucket, model, kind, COUNT(*), "
+            "AVG(wall), MAX(wall), SUM(audio), SUM(prompt_tokens), SUM(completion_tokens), "
+            "SUM(retries), SUM(cost), SUM(error IS NOT NULL) "
+            "FROM openai_calls WHERE ts >= ? GROUP BY endpoint, bucket, model, kind",
+            (window_seconds, window_seconds, since),
+        ).fetchall()
+    finally:
+        conn.close()
+
+    windows: Dict[tuple, Dict[str, Any]] = {}
+    endpoints: Dict[str, List[Dict[str, Any]]] = {}
+    for endpoint, bucket, count, wall_mean, wall_max in requests:
+        window = {
+            "start": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(bucket)),
+            "requests": count,
+            "wall_seconds_mean": round(wall_mean, 3),
+            "wall_seconds_max": round(wall_max, 3),
+            "cost_usd": 0.0,
+            "models": {},
+        }
+        windows[(endpoint, bucket)] = window
+        endpoints.setdefault(endpoint, []).append(window)
+
+    for (endpoint, bucket, model, kind, count, wall_mean, wall_max, audio, prompt,
+         completion, retries, cost, errors) in calls:
+        window = windows.get((endpoint, bucket))
+        if window is None:
+            continue
+        window["cost_usd"] = round(window["cost_usd"] + cost, 6)
+        window["models"][model] = {
+            "kind": kind,
+            "calls": count,
+            "wall_seconds_mean": round(wall_mean, 3),
+            "wall_seconds_max": round(wall_max, 3),
+            "audio_seconds": round(audio, 1),
+            "prompt_tokens": prompt,
+            "completion_tokens": completion,
+            "retries": retries,
+            "errors": errors,
+            "cost_usd": round(cost, 6),
+        }
+
+    return {
+        "window_seconds": window_seconds,
+        "since": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(since)),
+        "endpoints": endpoints,
+    }
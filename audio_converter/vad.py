@@ -0,0 +1,183 @@
+"""
+Detecção de voz por energia (VAD) e remoção de silêncio antes da transcrição.
+
+As gravações costumam ter silêncio no início/fim e "tempo morto" enquanto o
+aparelho passa de mão em mão; como a latência e a cobrança do Whisper
+crescem com a duração, cortamos esses trechos de WAVs PCM antes do envio.
+
+Os intervalos removidos são registrados na linha do tempo original para que
+``restore_timestamps`` devolva à transcrição os tempos reais: duração,
+palavras por minuto e pausas continuam sendo medidos sobre o áudio completo.
+"""
+import copy
+from typing import Optional, Dict, Any, List, Tuple
+
+import numpy as np
+
+from .wav import read_wav
+
+FRAME_MS = 30
+# Margem acima do ruído de fundo para considerar um quadro como fala (dB)
+MARGIN_DB = 12.0
+# Limites absolutos do limiar: nunca abaixo de MIN_DB e nunca mais que
+# PEAK_HEADROOM_DB abaixo do quadro mais forte (gravações sem silêncio)
+MIN_DB = -55.0
+PEAK_HEADROOM_DB = 25.0
+# Margem de fala mantida em volta de cada trecho detectado
+HANGOVER_MS = 200
+# Silêncios internos acima de MAX_SILENCE_SECONDS são reduzidos a KEEP_SILENCE_SECONDS
+MAX_SILENCE_SECONDS = 1.0
+KEEP_SILENCE_SECONDS = 0.5
+
+
+def frame_energy_db(mono: np.ndarray, sample_rate: int, frame_ms: int = FRAME_MS) -> np.ndarray:
+    """Energia RMS (dBFS) de cada quadro de ``frame_ms`` milissegundos."""
+    frame_len = max(1, int(sample_rate * frame_ms / 1000))
+    n_frames = int(np.ceil(len(mono) / frame_len))
+    if n_frames == 0:
+        return np.empty(0, dtype=np.float32)
+    padded = np.zeros(n_frames * frame_len, dtype=np.float32)
+    padded[:len(mono)] = mono
+    rms = np.sqrt(np.mean(padded.reshape(n_frames, frame_len) ** 2, axis=1))
+    return 20.0 * np.log10(np.maximum(rms, 1e-10))
+
+
+def speech_mask(
+    mono: np.ndarray,
+    sample_rate: int,
+    frame_ms: int = FRAME_MS,
+    hangover_ms: int = HANGOVER_MS,
+) -> np.ndarray:
+    """
+    Marca os quadros com fala.
+
+    O limiar é adaptativo: percentil 10 da energia (ruído de fundo) mais
+    ``MARGIN_DB``, limitado por ``MIN_DB`` e ``PEAK_HEADROOM_DB``. A máscara
+    é dilatada por ``hangover_ms`` para não cortar inícios e finais de
+    palavras fracas.
+    """
+    energy = frame_energy_db(mono, sample_rate, frame_ms)
+    if energy.size == 0:
+        return np.zeros(0, dtype=bool)
+
+    noise_floor = float(np.percentile(energy, 10))
+    threshold = max(noise_floor + MARGIN_DB, MIN_DB)
+    threshold = min(threshold, float(energy.max()) - PEAK_HEADROOM_DB)
+    mask = energy > threshold
+
+    hangover = int(round(hangover_ms / frame_ms))
+    if hangover > 0 and mask.any():
+        kernel = np.ones(2 * hangover + 1, dtype=np.int32)
+        mask = np.convolve(mask.astype(np.int32), kernel, mode="same") > 0
+    return mask
+
+
+def mask_runs(mask: np.ndarray) -> List[Tuple[int, int, bool]]:
+    """Quebra a máscara em sequências (início, fim exclusivo, valor)."""
+    if mask.size == 0:
+        return []
+    change = np.flatnonzero(np.diff(mask.astype(np.int8))) + 1
+    bounds = np.concatenate([[0], change, [mask.size]])
+    return [(int(a), int(b), bool(mask[a])) for a, b in zip(bounds[:-1], bounds[1:])]
+
+
+def trim_silence(
+    data: bytes,
+    max_silence: float = MAX_SILENCE_SECONDS,
+    keep_silence: float = KEEP_SILENCE_SECONDS,
+    frame_ms: int = FRAME_MS,
+) -> Optional[Dict[str, Any]]:
+    """
+    Remove o silêncio inicial/final e comprime silêncios internos longos.
+
+    Args:
+        data: Bytes de um WAV PCM.
+        max_silence: Silêncios internos maiores que isso são comprimidos.
+        keep_silence: Quanto de cada silêncio comprimido é mantido.
+
+    Returns:
+        None se o áudio não for WAV PCM ou não tiver fala detectável; senão
+        um dicionário com ``audio`` (WAV recortado), ``removed_spans``
+        (intervalos removidos, em segundos da linha do tempo original),
+        ``original_duration``, ``trimmed_duration`` e ``seconds_saved``.
+    """
+    audio = read_wav(data)
+    if audio is None or audio.num_frames == 0:
+        return None
+
+    sr = audio.sample_rate
+    mask = speech_mask(audio.mono(), sr, frame_ms)
+    if not mask.any():
+        return None
+
+    frame_len = max(1, int(sr * frame_ms / 1000))
+    runs = mask_runs(mask)
+    removed: List[Tuple[int, int]] = []  # em amostras
+    max_gap = int(max_silence * sr)
+    keep_half = int(keep_silence * sr / 2)
+
+    for idx, (start, end, is_speech) in enumerate(runs):
+        if is_speech:
+            continue
+        s, e = start * frame_len, min(end * frame_len, audio.num_frames)
+        if idx == 0 or idx == len(runs) - 1:
+            removed.append((s, e))
+        elif e - s > max_gap:
+            removed.append((s + keep_half, e - keep_half))
+
+    removed = [(s, e) for s, e in removed if e > s]
+    keep = np.ones(audio.num_frames, dtype=bool)
+    for s, e in removed:
+        keep[s:e] = False
+
+    original_duration = audio.duration
+    trimmed_duration = int(keep.sum()) / float(sr)
+    return {
+        "audio": audio.to_bytes(np.flatnonzero(keep)) if removed else data,
+        "removed_spans": [[s / float(sr), e / float(sr)] for s, e in removed],
+        "original_duration": original_duration,
+        "trimmed_duration": trimmed_duration,
+        "seconds_saved": round(original_duration - trimmed_duration, 2),
+    }
+
+
+def restore_timestamps(
+    transcription: Dict[str, Any],
+    removed_spans: List[List[float]],
+    original_duration: float,
+) -> Dict[str, Any]:
+    """
+    Converte os tempos de uma transcrição do áudio recortado para a linha do
+    tempo do áudio original.
+
+    Returns:
+        Cópia da transcrição com ``words``/``segments`` deslocados e
+        ``duration`` igual à duração original.
+    """
+    restored = copy.deepcopy(transcription)
+    restored["duration"] = original_duration
+    if not removed_spans:
+        return restored
+
+    spans = np.asarray(removed_spans, dtype=np.float64)
+    lengths = spans[:, 1] - spans[:, 0]
+    removed_total = np.cumsum(lengths)
+    # Posição de cada corte na linha do tempo recortada
+    cut_positions = spans[:, 0] - np.concatenate([[0.0], removed_total[:-1]])
+
+    def shift(values: np.ndarray, side: str) -> np.ndarray:
+        k = np.searchsorted(cut_positions, values, side=side)
+        offset = np.where(k > 0, removed_total[np.maximum(k - 1, 0)], 0.0)
+        return values + offset
+
+    for field in ("words", "segments"):
+        items = restored.get(field) or []
+        if not items:
+            continue
+        starts = shift(np.array([float(i.get("start", 0.0)) for i in items]), "right")
+        # Um fim exatamente no ponto de corte pertence ao trecho anterior
+        ends = shift(np.array([float(i.get("end", 0.0)) for i in items]), "left")
+        for item, start, end in zip(items, starts, ends):
+            item["start"] = round(float(start), 3)
+            item["end"] = round(float(max(end, start)), 3)
+    return restored
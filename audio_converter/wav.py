@@ -0,0 +1,122 @@
+"""
+Leitura e escrita de arquivos WAV/PCM com NumPy, sem binários externos.
+
+Usado pelas etapas de pré-processamento de áudio (remoção de silêncio,
+divisão em trechos), que só se aplicam a WAV PCM: os demais formatos
+(mp3, m4a, ogg, webm) seguem direto para o Whisper.
+"""
+import io
+import wave
+from typing import Optional
+
+import numpy as np
+
+
+class WavAudio:
+    """
+    Áudio PCM decodificado de um WAV.
+
+    Mantém os quadros brutos (``raw``: um quadro por linha, em bytes) para
+    que recortes preservem exatamente o formato original, e decodifica as
+    amostras em float32 no intervalo [-1, 1] apenas quando necessário.
+    """
+
+    def __init__(self, raw: np.ndarray, sample_rate: int, channels: int, sampwidth: int):
+        self.raw = raw
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.sampwidth = sampwidth
+        self._samples = None
+
+    @property
+    def num_frames(self) -> int:
+        return self.raw.shape[0]
+
+    @property
+    def duration(self) -> float:
+        return self.num_frames / float(self.sample_rate) if self.sample_rate else 0.0
+
+    @property
+    def samples(self) -> np.ndarray:
+        """Amostras float32 com shape (quadros, canais)."""
+        if self._samples is None:
+            self._samples = _decode_pcm(self.raw, self.channels, self.sampwidth)
+        return self._samples
+
+    def mono(self) -> np.ndarray:
+        """Média dos canais (float32, shape (quadros,))."""
+        samples = self.samples
+        return samples[:, 0] if self.channels == 1 else samples.mean(axis=1)
+
+    def to_bytes(self, frame_index: Optional[np.ndarray] = None) -> bytes:
+        """Serializa (opcionalmente só os quadros em ``frame_index``) como WAV."""
+        raw = self.raw if frame_index is None else self.raw[frame_index]
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as out:
+            out.setnchannels(self.channels)
+            out.setsampwidth(self.sampwidth)
+            out.setframerate(self.sample_rate)
+            out.writeframes(np.ascontiguousarray(raw).tobytes())
+        return buffer.getvalue()
+
+
+def is_wav(data: bytes) -> bool:
+    return len(data) >= 12 and data[:4] == b"RIFF" and data[8:12] == b"WAVE"
+
+
+def read_wav(data: bytes) -> Optional[WavAudio]:
+    """
+    Decodifica um WAV PCM em memória.
+
+    Returns:
+        WavAudio ou None se os bytes não forem um WAV PCM suportado.
+    """
+    if not is_wav(data):
+        return None
+    try:
+        with wave.open(io.BytesIO(data), "rb") as wav_file:
+            channels = wav_file.getnchannels()
+            sampwidth = wav_file.getsampwidth()
+            sample_rate = wav_file.getframerate()
+            frames = wav_file.readframes(wav_file.getnframes())
+    except (wave.Error, EOFError):
+        return None
+
+    if sampwidth not in (1, 2, 3, 4) or channels < 1:
+        return None
+
+    frame_size = channels * sampwidth
+    usable = len(frames) - len(frames) % frame_size
+    raw = np.frombuffer(frames[:usable], dtype=np.uint8).reshape(-1, frame_size)
+    return WavAudio(raw, sample_rate, channels, sampwidth)
+
+
+def encode_wav(samples: np.ndarray, sample_rate: int) -> bytes:
+    """Codifica amostras float (quadros[, canais]) como WAV PCM 16 bits."""
+    if samples.ndim == 1:
+        samples = samples[:, None]
+    pcm = np.clip(np.round(samples * 32767.0), -32768, 32767).astype("<i2")
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as out:
+        out.setnchannels(pcm.shape[1])
+        out.setsampwidth(2)
+        out.setframerate(sample_rate)
+        out.writeframes(pcm.tobytes())
+    return buffer.getvalue()
+
+
+def _decode_pcm(raw: np.ndarray, channels: int, sampwidth: int) -> np.ndarray:
+    n = raw.shape[0]
+    if sampwidth == 1:
+        # PCM de 8 bits é sem sinal, centrado em 128
+        values = (raw.astype(np.float32) - 128.0) / 128.0
+    elif sampwidth == 2:
+        values = raw.view("<i2").astype(np.float32) / 32768.0
+    elif sampwidth == 3:
+        b = raw.reshape(n, channels, 3).astype(np.int32)
+        ints = b[..., 0] | (b[..., 1] << 8) | (b[..., 2] << 16)
+        ints = (ints << 8) >> 8  # extensão de sinal de 24 para 32 bits
+        values = ints.astype(np.float32) / 8388608.0
+    else:
+        values = raw.view("<i4").astype(np.float32) / 2147483648.0
+    return values.reshape(n, channels)
@@ -0,0 +1,35 @@
+import re
+
+# Lista de origens permitidas
+allowed_origins = [
+    'https://app.florescer.tec.br',
+    'https://www.florescer.tec.br',
+    'https://api.florescer.tec.br',
+    'https://ia.florescer.tec.br',
+]
+
+# Cabeçalhos CORS enviados às origens permitidas (Flask e ASGI)
+CORS_ALLOW_METHODS = 'GET, POST, PUT, DELETE, PATCH, OPTIONS'
+CORS_ALLOW_HEADERS = 'Content-Type, Authorization, X-Requested-With, Origin, Accept'
+
+# Função para validar origens permitidas (usada pelo flask-cors e pelo asgi.py)
+def origin_check(origin):
+    """Verifica se a origem é permitida"""
+    if not origin:
+        return True  # Permite requisições sem origin (mobile apps, curl, etc)
+    
+    # Verifica lista fixa de produção
+    if origin in allowed_origins:
+        return True
+    
+    # Permite localhost em qualquer porta (desenvolvimento)
+    if re.match(r'^http://localhost:\d+$', origin) or re.match(r'^http://127\.0\.0\.1:\d+$', origin):
+        return True
+    
+    # Permite IPs de rede local
+    if re.match(r'^http://192\.168\.\d+\.\d+:\d+$', origin) or \
+       re.match(r'^http://10\.\d+\.\d+\.\d+:\d+$', origin) or \
+       re.match(r'^http://172\.(1[6-9]|2[0-9]|3[0-1])\.\d+\.\d+:\d+$', origin):
+        return True
+    
+    return False
@@ -0,0 +1,21 @@
+# Configuração lida automaticamente pelo gunicorn quando iniciado nesta pasta.
+# Os valores de linha de comando (-w, -b, ...) continuam valendo.
+import os
+
+# GUNICORN_PRELOAD=1: importa o app e os subsistemas (OpenCV, OpenAI) no
+# processo mestre; os workers herdam tudo no fork e sobem sem importar nada
+preload_app = os.getenv("GUNICORN_PRELOAD", "0").strip().lower() in ("1", "true", "yes", "on")
+
+
+def on_starting(server):
+    if preload_app:
+        from startup import load_subsystems
+        load_subsystems()
+
+
+def post_worker_init(worker):
+    # Roda no worker, antes de aceitar conexões: o OpenCV é aquecido depois do
+    # fork (pools de threads não atravessam o fork)
+    from startup import WARMUP_ENABLED, warmup
+    if WARMUP_ENABLED:
+        warmup()
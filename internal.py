@@ -0,0 +1,18 @@
+import hmac
+import os
+
+# Token dos endpoints internos (estatísticas, diagnóstico); sem ele os endpoints não existem
+INTERNAL_API_TOKEN = os.getenv("INTERNAL_API_TOKEN", "")
+INTERNAL_TOKEN_HEADER = "X-Internal-Token"
+
+
+def internal_enabled():
+    """Indica se os endpoints internos estão habilitados"""
+    return bool(INTERNAL_API_TOKEN)
+
+
+def internal_token_ok(token):
+    """Compara o token recebido no cabeçalho com INTERNAL_API_TOKEN"""
+    if not INTERNAL_API_TOKEN or not token:
+        return False
+    return hmac.compare_digest(token.encode(), INTERNAL_API_TOKEN.encode())
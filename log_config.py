@@ -0,0 +1,158 @@
+"""
+Logs da aplicação (OMR e áudio) com níveis, id de requisição e amostragem.
+
+Os registros saem do caminho da requisição: o ``QueueHandler`` só enfileira o
+registro (sem formatar nem serializar os dados) e uma thread (``QueueListener``)
+formata e escreve no stdout. Mensagens usam formatação preguiçosa do
+``logging`` (``logger.debug("Questão %d", q)``) e dados estruturados vão em
+``extra={"data": {...}}``; nada é formatado se o nível estiver desligado.
+
+Variáveis de ambiente:
+
+- ``LOG_LEVEL``: ``DEBUG``, ``INFO`` (padrão), ``WARNING``...
+- ``LOG_FORMAT``: ``text`` (padrão) ou ``json`` (um objeto por linha).
+- ``LOG_SAMPLE_RATE``: fração (0–1, padrão 1) das requisições cujos logs
+  DEBUG/INFO são emitidos; a escolha é por id de requisição, então uma
+  requisição amostrada aparece inteira. WARNING e acima sempre saem.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+import zlib
+from typing import Optional
+
+from dotenv import load_dotenv
+
+# O .env precisa valer antes de ler LOG_*, e este módulo é importado cedo
+load_dotenv()
+
+LOGGER_NAME = "florescer"
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").strip().upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").strip().lower()
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1"))
+
+_request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+_VALID_ID = re.compile(r"^[A-Za-z0-9._:-]{1,64}$")
+_configured = False
+_configure_lock = threading.Lock()
+_handler: Optional[logging.handlers.QueueHandler] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def new_request_id(incoming: Optional[str] = None) -> str:
+    """Define o id da requisição corrente (o recebido no cabeçalho ou um novo)."""
+    # Só aceita ids simples: o valor volta no cabeçalho X-Request-ID
+    request_id = incoming.strip()[:64] if incoming and _VALID_ID.match(incoming.strip()) else ""
+    request_id = request_id or uuid.uuid4().hex[:16]
+    _request_id.set(request_id)
+    return request_id
+
+
+def current_request_id() -> Optional[str]:
+    return _request_id.get()
+
+
+class _ContextFilter(logging.Filter):
+    """Anota o id da requisição e aplica a amostragem, ainda na thread de origem."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        request_id = _request_id.get()
+        record.request_id = request_id
+        if LOG_SAMPLE_RATE >= 1 or record.levelno >= logging.WARNING:
+            return True
+        if request_id is None:
+            return random.random() < LOG_SAMPLE_RATE
+        return (zlib.crc32(request_id.encode()) % 10000) < LOG_SAMPLE_RATE * 10000
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # A fila é do próprio processo: o registro vai intacto e a formatação
+        # (inclusive dos dados e do traceback) fica para a thread do listener
+        return record
+
+
+class _TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(record.created))
+        line = f"[{timestamp}.{int(record.msecs):03d}] [{record.levelname}] [{record.name}]"
+        if record.request_id:
+            line += f" [{record.request_id}]"
+        line += f" {record.getMessage()}"
+        data = getattr(record, "data", None)
+        if data:
+            line += f" | Dados: {json.dumps(data, ensure_ascii=False, default=str)}"
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class _JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": record.request_id,
+            "message": record.getMessage(),
+        }
+        data = getattr(record, "data", None)
+        if data:
+            entry["data"] = data
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def _start_listener() -> None:
+    """Cria a fila e a thread que escreve no stdout."""
+    global _listener
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(_JsonFormatter() if LOG_FORMAT == "json" else _TextFormatter())
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    _handler.queue = log_queue
+    _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+
+
+def _stop_listener() -> None:
+    if _listener is not None:
+        _listener.stop()
+
+
+def configure_logging() -> None:
+    """Liga o logger ``florescer`` à fila e inicia o listener (idempotente)."""
+    global _configured, _handler
+    with _configure_lock:
+        if _configured:
+            return
+        _handler = _QueueHandler(queue.SimpleQueue())
+        _handler.addFilter(_ContextFilter())
+        _start_listener()
+        atexit.register(_stop_listener)
+        # Threads não sobrevivem ao fork (gunicorn --preload): cada worker
+        # recomeça com fila e listener próprios
+        os.register_at_fork(after_in_child=_start_listener)
+
+        root = logging.getLogger(LOGGER_NAME)
+        root.setLevel(LOG_LEVEL)
+        root.addHandler(_handler)
+        # Não duplica nos handlers do gunicorn/uvicorn
+        root.propagate = False
+        _configured = True
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger ``florescer.<name>``; configura os logs no primeiro uso."""
+    configure_logging()
+    return logging.getLogger(f"{LOGGER_NAME}.{name}")
@@ -0,0 +1,213 @@
+"""
+Registro de gabaritos: enviados uma vez, corrigidos por id.
+
+Uma turma inteira (30–40 folhas) é corrigida contra o mesmo gabarito; em vez
+de mandar e converter o JSON a cada folha, o gabarito é registrado em
+``POST /api/gabaritos`` e as correções passam só o ``gabarito_id``.
+
+O gabarito fica compilado em arrays NumPy (índice da alternativa correta por
+questão, uma linha por área), gravados em ``ANSWER_KEY_DIR/<id>.npz`` junto
+com o ``layout`` enviado no registro, e mantidos em memória por worker após a
+primeira leitura. O id é derivado do conteúdo: registrar o mesmo gabarito (e
+layout) de novo devolve o mesmo id.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple, Dict, Any, List
+
+import numpy as np
+
+from .layout import LETRAS, LayoutFolha, interpretar_layout
+
+ANSWER_KEY_DIR = os.getenv("ANSWER_KEY_DIR") or os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "gabaritos"
+)
+# Gabaritos mantidos em memória por worker
+CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_KEY_CACHE_ENTRIES", "128"))
+NUM_ALTERNATIVAS = 4
+
+_cache: "OrderedDict[str, GabaritoCompilado]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+class GabaritoCompilado:
+    """Gabarito pronto para a correção: um array de alternativas corretas por área."""
+
+    def __init__(self, areas: List[np.ndarray], num_alternativas: int = NUM_ALTERNATIVAS,
+                 layout: Optional[LayoutFolha] = None):
+        self.areas = [np.asarray(area, dtype=np.int8) for area in areas]
+        self.num_alternativas = num_alternativas
+        # Layout enviado no registro; None se o gabarito foi registrado sem ele
+        self.layout_registrado = layout
+        self.id = self._calcular_id()
+
+    def _calcular_id(self) -> str:
+        h = hashlib.sha256(f"alt={self.num_alternativas}".encode())
+        for area in self.areas:
+            h.update(b"|" + area.tobytes())
+        if self.layout_registrado is not None:
+            h.update(b"|layout=" + json.dumps(self.layout_registrado.resumo(), sort_keys=True).encode())
+        return h.hexdigest()[:20]
+
+    @property
+    def layout(self) -> LayoutFolha:
+        """Layout da correção por id: o do registro ou um derivado do próprio gabarito."""
+        if self.layout_registrado is not None:
+            return self.layout_registrado
+        return LayoutFolha(areas=len(self.areas), alternativas=self.num_alternativas,
+                           questoes=[int(area.size) for area in self.areas])
+
+    @property
+    def bolhas_esperadas(self) -> List[int]:
+        return [int(area.size) * self.num_alternativas for area in self.areas]
+
+    def resumo(self) -> Dict[str, Any]:
+        return {
+            "gabarito_id": self.id,
+            "num_alternativas": self.num_alternativas,
+            "layout": self.layout.resumo(),
+            "areas": [
+                {"area": i + 1, "questoes": int(area.size), "bolhas_esperadas": bolhas}
+                for i, (area, bolhas) in enumerate(zip(self.areas, self.bolhas_esperadas))
+            ],
+        }
+
+    def em_letras(self) -> List[Dict[str, str]]:
+        """Gabarito no formato do endpoint (``[{"1": "a", ...}, ...]``)."""
+        return [{str(q + 1): LETRAS[int(alt)] for q, alt in enumerate(area)} for area in self.areas]
+
+
+def compilar_gabarito(gabaritos_em_letras, num_alternativas: int = NUM_ALTERNATIVAS,
+                      layout: Optional[LayoutFolha] = None) -> Tuple[Optional[GabaritoCompilado], Optional[str]]:
+    """
+    Valida e compila a lista de gabaritos por área.
+
+    Diferente de ``transformar_gabaritos``, não aceita gabaritos parciais: cada
+    área precisa ter as questões 1..N, todas com uma das ``num_alternativas``
+    primeiras letras. Com ``layout``, o gabarito precisa ter as áreas (e, se
+    o layout as fixar, as questões por área) dele.
+
+    Returns:
+        (gabarito compilado, None) ou (None, mensagem de erro)
+    """
+    if not isinstance(gabaritos_em_letras, list) or not gabaritos_em_letras:
+        return None, "O gabarito deve ser uma lista (não vazia) com um objeto por área."
+
+    letras = LayoutFolha(alternativas=num_alternativas)
+    areas = []
+    for i, gabarito in enumerate(gabaritos_em_letras):
+        if not isinstance(gabarito, dict) or not gabarito:
+            return None, f"O gabarito de índice {i} deve ser um objeto não vazio (ex.: {{\"1\": \"a\"}})."
+        respostas = {}
+        for questao, letra in gabarito.items():
+            try:
+                numero = int(questao)
+            except (TypeError, ValueError):
+                return None, f"Chave de questão inválida: '{questao}' no gabarito de índice {i}. Deve ser um número."
+            alternativa = letras.letras.find(letra.strip().lower()) if isinstance(letra, str) and letra.strip() else -1
+            if alternativa < 0:
+                return None, f"Resposta inválida: '{letra}' no gabarito de índice {i}. Deve ser {letras.letras_validas()}."
+            respostas[numero] = alternativa
+        if sorted(respostas) != list(range(1, len(respostas) + 1)):
+            return None, f"As questões do gabarito de índice {i} devem ser numeradas de 1 a {len(respostas)}, sem lacunas."
+        areas.append(np.array([respostas[q] for q in range(1, len(respostas) + 1)], dtype=np.int8))
+
+    if layout is not None:
+        if len(areas) != layout.areas:
+            return None, f"O gabarito tem {len(areas)} área(s) e o layout, {layout.areas}."
+        if layout.questoes and [int(area.size) for area in areas] != layout.questoes:
+            return None, f"O gabarito não corresponde às questões por área do layout ({layout.questoes})."
+    return GabaritoCompilado(areas, num_alternativas, layout), None
+
+
+def _caminho(gabarito_id: str) -> str:
+    return os.path.join(ANSWER_KEY_DIR, f"{gabarito_id}.npz")
+
+
+def _guardar_em_memoria(gabarito: GabaritoCompilado) -> None:
+    with _cache_lock:
+        _cache[gabarito.id] = gabarito
+        _cache.move_to_end(gabarito.id)
+        while len(_cache) > CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+
+
+def salvar_gabarito(gabarito: GabaritoCompilado) -> None:
+    """Grava o ``.npz`` (escrita atômica) e mantém o gabarito em memória."""
+    os.makedirs(ANSWER_KEY_DIR, exist_ok=True)
+    destino = _caminho(gabarito.id)
+    if not os.path.exists(destino):
+        fd, temporario = tempfile.mkstemp(dir=ANSWER_KEY_DIR, suffix=".npz")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                extras = {}
+                if gabarito.layout_registrado is not None:
+                    # Texto JSON: o .npz continua legível sem pickle
+                    extras["layout"] = np.array(json.dumps(gabarito.layout_registrado.resumo()))
+                np.savez(
+                    f,
+                    num_alternativas=np.int16(gabarito.num_alternativas),
+                    **{f"area_{i}": area for i, area in enumerate(gabarito.areas)},
+                    **extras,
+                )
+            os.replace(temporario, destino)
+        except BaseException:
+            os.unlink(temporario)
+            raise
+    _guardar_em_memoria(gabarito)
+
+
+def carregar_gabarito(gabarito_id: str) -> Optional[GabaritoCompilado]:
+    """Gabarito registrado com esse id, ou None se não existir."""
+    if not gabarito_id or not gabarito_id.isalnum():
+        return None
+    with _cache_lock:
+        gabarito = _cache.get(gabarito_id)
+        if gabarito is not None:
+            _cache.move_to_end(gabarito_id)
+            return gabarito
+
+    try:
+        with np.load(_caminho(gabarito_id), allow_pickle=False) as dados:
+            num_areas = sum(1 for nome in dados.files if nome.startswith("area_"))
+            areas = [dados[f"area_{i}"] for i in range(num_areas)]
+            # Gabaritos gravados antes do layout no .npz não têm a entrada
+            layout = LayoutFolha(**json.loads(str(dados["layout"]))) if "layout" in dados.files else None
+            gabarito = GabaritoCompilado(areas, int(dados["num_alternativas"]), layout)
+    except FileNotFoundError:
+        return None
+    _guardar_em_memoria(gabarito)
+    return gabarito
+
+
+def registrar_gabarito(gabarito_json_str: Optional[str],
+                       layout_json_str: Optional[str] = None) -> Tuple[Dict[str, Any], int]:
+    """Trata ``POST /api/gabaritos`` (o ``layout`` opcional é guardado com o gabarito)."""
+    if not gabarito_json_str:
+        return {"status": "bad_request", "message": "O campo 'gabarito' é obrigatório."}, 400
+    try:
+        gabarito_recebido = json.loads(gabarito_json_str)
+    except json.JSONDecodeError:
+        return {"status": "bad_request", "message": "O gabarito fornecido não é um JSON válido."}, 400
+
+    layout, erro = interpretar_layout(layout_json_str)
+    if erro:
+        return {"status": "bad_request", "message": erro}, 400
+    gabarito, erro = compilar_gabarito(gabarito_recebido, layout.alternativas,
+                                       layout if layout_json_str else None)
+    if erro:
+        return {"status": "bad_request", "message": erro}, 400
+    salvar_gabarito(gabarito)
+    return {"status": "success", **gabarito.resumo()}, 200
+
+
+def consultar_gabarito(gabarito_id: str) -> Tuple[Dict[str, Any], int]:
+    """Trata ``GET /api/gabaritos/<id>``."""
+    gabarito = carregar_gabarito(gabarito_id)
+    if gabarito is None:
+        return {"status": "not_found", "message": f"Gabarito '{gabarito_id}' não encontrado."}, 404
+    return {"status": "success", **gabarito.resumo(), "gabarito": gabarito.em_letras()}, 200
@@ -0,0 +1,168 @@
+"""
+Correção de várias folhas (turma inteira) numa só requisição.
+
+As folhas usam o mesmo gabarito e layout e são corrigidas em paralelo no pool
+de processos do OMR (omr/pool.py), com as imagens em memória compartilhada.
+Os resultados voltam na ordem de envio, com um resumo do lote, e cada folha
+vai para o armazenamento de resultados como na correção individual. Na
+resposta em fluxo (streaming.py) cada folha é enviada assim que termina.
+"""
+import json
+import os
+from typing import Optional, Tuple, Dict, Any, List, Iterator
+
+from log_config import get_logger
+
+from .compact import FORMATO_COMPACTO, compactar_resultado, interpretar_formato
+from .pool import corrigir_folhas, decodificar_folha
+from .results_store import validar_identificador
+from .service import (allowed_file, interpretar_modo_captura, preparar_gabaritos, registrar_resultado,
+                      ALLOWED_EXTENSIONS)
+
+logger = get_logger("omr.batch")
+
+MAX_BATCH_SIZE = int(os.getenv("OMR_BATCH_MAX_SIZE", "100"))
+
+
+def _parse_alunos(alunos_json: Optional[str], count: int) -> Tuple[Optional[List[str]], Optional[str]]:
+    """
+    Lê a lista de ids de aluno por folha (JSON).
+
+    Returns:
+        (lista de ids ou None, mensagem de erro ou None)
+    """
+    if not alunos_json:
+        return None, None
+    try:
+        alunos = json.loads(alunos_json)
+    except json.JSONDecodeError:
+        return None, "O campo 'alunos' não é um JSON válido."
+    if not isinstance(alunos, list) or not all(a is None or isinstance(a, (str, int)) for a in alunos):
+        return None, "O campo 'alunos' deve ser uma lista de ids (string ou null)."
+    if len(alunos) != count:
+        return None, f"O campo 'alunos' deve ter um item por folha. Esperado: {count}, Encontrado: {len(alunos)}"
+    validados = []
+    for aluno in alunos:
+        aluno_id, erro = validar_identificador(None if aluno is None else str(aluno), "alunos")
+        if erro:
+            return None, erro
+        validados.append(aluno_id)
+    return validados, None
+
+
+def _acertos(resultado: Dict[str, Any]) -> Optional[int]:
+    """Acertos de uma folha corrigida com sucesso (None nas demais)."""
+    if resultado.get("status") != "success":
+        return None
+    return sum(1 for area in resultado["resultados"] for resposta in area["respostas"] if resposta["correto"])
+
+
+def _resumo(acertos_por_folha: List[Optional[int]]) -> Dict[str, Any]:
+    """Totais do lote e média de acertos das folhas corrigidas com sucesso."""
+    acertos = [n for n in acertos_por_folha if n is not None]
+    return {
+        "total": len(acertos_por_folha),
+        "succeeded": len(acertos),
+        "failed": len(acertos_por_folha) - len(acertos),
+        "acertos_media": round(sum(acertos) / len(acertos), 2) if acertos else None,
+        "acertos_min": min(acertos) if acertos else None,
+        "acertos_max": max(acertos) if acertos else None,
+    }
+
+
+def _eventos(folhas: Iterator[Tuple[Dict[str, Any], Optional[int]]]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Eventos da resposta em fluxo: um ``resultado`` por folha corrigida e o ``resumo`` no fim."""
+    acertos = []
+    for item, n in folhas:
+        acertos.append(n)
+        yield "resultado", item
+    resumo = _resumo(acertos)
+    yield "resumo", {"status": "success" if resumo["failed"] == 0 else "partial_success", "summary": resumo}
+
+
+def process_batch_request(file_storages: List[Any], gabarito_json_str: Optional[str],
+                          gabarito_id: Optional[str] = None, prova_id: Optional[str] = None,
+                          alunos_json: Optional[str] = None,
+                          layout_json_str: Optional[str] = None,
+                          formato_resposta: Optional[str] = None,
+                          modo_captura: Optional[str] = None,
+                          stream: bool = False) -> Tuple[Any, int]:
+    """
+    Corrige várias folhas com o mesmo gabarito.
+
+    Args:
+        file_storages: Imagens das folhas, na ordem dos alunos (``files``).
+        alunos_json: Lista JSON com o id do aluno de cada folha (``alunos``).
+        formato_resposta: ``completo`` (padrão) ou ``compacto`` (omr/compact.py).
+        modo_captura: ``auto``, ``foto`` ou ``scanner``, para todas as folhas.
+        stream: Devolve, em vez da resposta, os eventos ``(tipo, dados)`` da
+            resposta em fluxo (streaming.py); erros de validação continuam
+            vindo como resposta.
+
+    Returns:
+        (resposta ou eventos, status HTTP)
+    """
+    file_storages = [f for f in (file_storages or []) if f is not None and f.filename]
+    if not file_storages:
+        return {"status": "no_file", "message": "Nenhum arquivo enviado"}, 200
+
+    if len(file_storages) > MAX_BATCH_SIZE:
+        return {
+            "status": "bad_request",
+            "message": f"Lote grande demais. Máximo: {MAX_BATCH_SIZE} folhas, Encontrado: {len(file_storages)}",
+        }, 400
+
+    GABARITOS, layout, erro = preparar_gabaritos(gabarito_json_str, gabarito_id, layout_json_str)
+    if erro:
+        return erro
+    formato, erro = interpretar_formato(formato_resposta)
+    if erro:
+        return {"status": "bad_request", "message": erro}, 400
+    modo_captura, erro = interpretar_modo_captura(modo_captura)
+    if erro:
+        return {"status": "bad_request", "message": erro}, 400
+    alunos, erro = _parse_alunos(alunos_json, len(file_storages))
+    if erro:
+        return {"status": "bad_request", "message": erro}, 400
+    prova_id, erro = validar_identificador(prova_id or gabarito_id, "prova_id")
+    if erro:
+        return {"status": "bad_request", "message": erro}, 400
+
+    dados = [f.read() if allowed_file(f.filename) else None for f in file_storages]
+
+    def imagens():
+        # Decodificadas uma a uma, à medida que o pool tem buffer livre
+        for conteudo in dados:
+            yield None if conteudo is None else decodificar_folha(conteudo, layout)
+
+    def folhas() -> Iterator[Tuple[Dict[str, Any], Optional[int]]]:
+        # Cada folha sai assim que termina (não na ordem de envio), com seus acertos
+        logger.debug("Corrigindo lote de %d folhas", len(file_storages))
+        for i, item in corrigir_folhas(imagens(), GABARITOS, layout, modo_captura):
+            aluno_id = alunos[i] if alunos else None
+            brutos = None
+            if dados[i] is None:
+                resultado = {"status": "invalid_file_type",
+                             "message": f"Tipo de arquivo não permitido. Use: {', '.join(ALLOWED_EXTENSIONS)}"}
+            elif item is None:
+                resultado = {"status": "no_image", "message": "Não foi possível ler a imagem"}
+            elif isinstance(item, Exception):
+                resultado = {"status": "processing_error", "message": f"Erro ao processar a imagem: {str(item)}"}
+            else:
+                resultado, brutos = item
+                registrar_resultado(resultado, brutos, dados[i], prova_id, aluno_id or "", gabarito_id)
+            acertos = _acertos(resultado)
+            if formato == FORMATO_COMPACTO and brutos is not None:
+                resultado = compactar_resultado(resultado, brutos)
+            yield {"index": i, "filename": file_storages[i].filename, "aluno_id": aluno_id, **resultado}, acertos
+
+    if stream:
+        return _eventos(folhas()), 200
+
+    corrigidas = sorted(folhas(), key=lambda folha: folha[0]["index"])
+    resumo = _resumo([acertos for _, acertos in corrigidas])
+    return {
+        "status": "success" if resumo["failed"] == 0 else "partial_success",
+        "summary": resumo,
+        "resultados": [item for item, _ in corrigidas],
+    }, 200
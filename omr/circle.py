@@ -5,6 +5,12 @@ import numpy as np
 import imutils
 import cv2
 
+from log_config import get_logger
+
+from .memory import buffer, cinza
+
+logger = get_logger("omr.grader")
+
 class OMRGrader:
     """
     Classe para corrigir provas de múltipla escolha.
@@ -13,7 +19,8 @@ class OMRGrader:
     def __init__(self, answer_key, num_alternativas=4, debug_mode=False,
                  min_bubble_width=25, min_bubble_height=25,
                  min_bubble_ratio=0.8, max_bubble_ratio=1.5,
-                 merge_kernel_size=9, proximity_dist=20):
+                 merge_kernel_size=9, proximity_dist=20, tamanho_normalizado=(400, 800),
+                 enxuto=False):
         self.answer_key = answer_key
         self.num_alternativas = num_alternativas
         self.debug_mode = debug_mode
@@ -23,6 +30,10 @@ class OMRGrader:
         self.max_bubble_ratio = max_bubble_ratio
         self.merge_kernel_size = merge_kernel_size
         self.proximity_dist = proximity_dist
+        # (largura, altura) em que a área é corrigida; ver LayoutFolha.tamanho_normalizado
+        self.tamanho_normalizado = tuple(tamanho_normalizado)
+        # Modo enxuto (omr/memory.py): etapas nos buffers reaproveitados da thread
+        self.enxuto = enxuto
         self.image = None
         self.paper = None
         self.gray = None
@@ -32,41 +43,52 @@ class OMRGrader:
 
     def _carregar_e_preprocessar(self, imagem_entrada):
         """Carrega a imagem de um caminho OU objeto e aplica pré-processamento."""
-        print("[INFO] Carregando e pré-processando a área de resposta...")
+        logger.debug("Carregando e pré-processando a área de resposta")
 
         if isinstance(imagem_entrada, str): # Se a entrada for um texto (caminho)
             self.image = cv2.imread(imagem_entrada)
             if self.image is None:
-                print(f"[ERRO] Não foi possível carregar a imagem do caminho: {imagem_entrada}")
+                logger.error("Não foi possível carregar a imagem do caminho: %s", imagem_entrada)
                 return False
         else: # Senão, assume que é um objeto de imagem (numpy array)
             self.image = imagem_entrada
 
-        self.image = cv2.resize(self.image, (400, 800))
-        self.paper = self.image.copy()
-        self.gray = cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY)
-        blurred = cv2.GaussianBlur(self.gray, (5, 5), 0)
+        largura, altura = self.tamanho_normalizado
+        self.image = cv2.resize(self.image, self.tamanho_normalizado,
+                                dst=self._buffer("area", (altura, largura) + self.image.shape[2:]))
+        # Cópia para desenhar o resultado: só no modo de depuração
+        if self.debug_mode:
+            self.paper = self.image.copy() if self.image.ndim == 3 else cv2.cvtColor(self.image, cv2.COLOR_GRAY2BGR)
+        self.gray = cinza(self.image, "area_cinza" if self.enxuto else None)
+        blurred = cv2.GaussianBlur(self.gray, (5, 5), 0, dst=self._buffer("area_desfoque", self.gray.shape))
         
         thresh = cv2.adaptiveThreshold(
             blurred, 255,
             cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY_INV,
-            11, 5
+            11, 5,
+            dst=self._buffer("area_thresh", self.gray.shape)
         )
         kernel = cv2.getStructuringElement(
             cv2.MORPH_ELLIPSE, (self.merge_kernel_size, self.merge_kernel_size)
         )
-        self.thresh_closed = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
+        self.thresh_closed = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel,
+                                              dst=self._buffer("area_fechada", self.gray.shape))
         
         if self.debug_mode:
             cv2.imshow("Threshold Fechado", self.thresh_closed)
 
         return True
 
+    def _buffer(self, nome, shape):
+        # Destino de uma etapa: buffer da thread no modo enxuto, array novo no normal
+        return buffer(nome, shape) if self.enxuto else None
+
     def _detectar_e_agrupar_bolhas(self):
         """Encontra, filtra e agrupa os contornos que representam as bolhas."""
-        print("[INFO] Procurando e agrupando contornos das bolhas...")
+        logger.debug("Procurando e agrupando contornos das bolhas")
+        # findContours não altera a imagem (OpenCV >= 3.2): sem cópia
         cnts = cv2.findContours(
-            self.thresh_closed.copy(), cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE
+            self.thresh_closed, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE
         )
         cnts = imutils.grab_contours(cnts)
 
@@ -97,7 +119,7 @@ class OMRGrader:
 
         final_contours = [cv2.convexHull(np.vstack(members)) for _, _, _, _, members in merged]
         self.question_contours = final_contours
-        print(f"[INFO] {len(self.question_contours)} bolhas únicas encontradas.")
+        logger.debug("%d bolhas únicas encontradas", len(self.question_contours))
 
         radii = [max(cv2.boundingRect(c)[2:]) / 2 for c in self.question_contours]
         if radii:
@@ -114,21 +136,30 @@ class OMRGrader:
         cv2.imshow("Bolhas Detectadas (Debug)", debug_image)
         cv2.waitKey(0)
 
+    def _chave_em_array(self, n):
+        """Alternativas corretas das n primeiras questões (gabarito em array ou dicionário)."""
+        if isinstance(self.answer_key, np.ndarray):
+            return self.answer_key[:n].astype(np.int16)
+        return np.fromiter((self.answer_key[q] for q in range(n)), dtype=np.int16, count=n)
+
     def _ordenar_e_corrigir(self):
         """Ordena as bolhas por questão e corrige a prova."""
         results = {
             'rectangle_detected': len(self.question_contours) > 0,
             'bubble_count': len(self.question_contours),
             'marked_answers': [],
+            'fill_scores': [],
             'correct_answers': 0,
             'total_questions': len(self.answer_key)
         }
         
         if len(self.question_contours) < len(self.answer_key) * self.num_alternativas:
-            print(f"[AVISO] Número de bolhas ({len(self.question_contours)}) é menor que o esperado.")
+            logger.warning("Número de bolhas (%d) é menor que o esperado (%d)",
+                           len(self.question_contours), len(self.answer_key) * self.num_alternativas)
         
         self.question_contours = contours.sort_contours(self.question_contours, method="top-to-bottom")[0]
 
+        marcadas = []
         for (q, i) in enumerate(np.arange(0, len(self.question_contours), self.num_alternativas)):
             if q >= results['total_questions']:
                 break
@@ -145,12 +176,17 @@ class OMRGrader:
                 area = cv2.contourArea(cv2.convexHull(c))
                 bubble_areas.append(area)
                 
-                # Calcular o preenchimento
-                mask = np.zeros(self.thresh_closed.shape, dtype="uint8")
-                cv2.drawContours(mask, [c], -1, 255, -1)
-                filled = cv2.countNonZero(cv2.bitwise_and(self.thresh_closed, self.thresh_closed, mask=mask))
+                # Calcular o preenchimento (máscara só no retângulo da bolha, não na área inteira)
+                x, y, w, h = cv2.boundingRect(c)
+                recorte = self.thresh_closed[y:y + h, x:x + w]
+                mask = np.zeros(recorte.shape, dtype="uint8")
+                cv2.drawContours(mask, [c], -1, 255, -1, offset=(-x, -y))
+                filled = cv2.countNonZero(cv2.bitwise_and(recorte, recorte, mask=mask))
                 fill_ratio = filled / area if area > 0 else 0
                 bubble_scores.append((fill_ratio, j, filled, area))
+
+            # Preenchimento de cada alternativa, na ordem a, b, c, d
+            results['fill_scores'].append([round(score[0], 4) for score in bubble_scores])
             
             # Ordenar por pontuação (maior primeiro)
             bubble_scores.sort(reverse=True, key=lambda x: x[0])
@@ -173,8 +209,8 @@ class OMRGrader:
                     print(f"Diferença entre 1ª e 2ª: {diff_ratio*100:.1f}%")
                     print(f"Limite mínimo de diferença: {MIN_DIFF_RATIO*100}%")
                     print(f"Limite mínimo de preenchimento: {MIN_FILL_THRESHOLD*100}%")
-                print(f"MIN_FILL_THRESHOLD {diff_ratio}")
-                print(f"MIN_DIFF_RATIO {bubble_scores[0][0]}")
+                logger.debug("Questão %d: preenchimento máximo %.3f, diferença 1ª/2ª %.3f",
+                             q + 1, bubble_scores[0][0], diff_ratio)
                 # Verificar se a diferença é significativa e se o preenchimento é suficiente
                 if diff_ratio > MIN_DIFF_RATIO and bubble_scores[0][0] > MIN_FILL_THRESHOLD:
                    
@@ -187,26 +223,26 @@ class OMRGrader:
                     if bubble_scores[0][0] <= MIN_FILL_THRESHOLD:
                         print(f"Nenhuma bolha marcada: preenchimento máximo ({bubble_scores[0][0]*100:.1f}%) abaixo do limite mínimo")
             
-            correct_answer_idx = self.answer_key[q]
-            
-            results['marked_answers'].append({
-                'question': q + 1,
-                'marked': marked_answer_idx,
-                'correct': correct_answer_idx,
-                'is_correct': marked_answer_idx == correct_answer_idx
-            })
-            
-            if marked_answer_idx == correct_answer_idx:
-                results['correct_answers'] += 1
-                
+            marcadas.append(marked_answer_idx)
+
             if self.debug_mode and marked_answer_idx != -1:
-                
+                correct_answer_idx = self.answer_key[q]
                 color = (0, 255, 0) if marked_answer_idx == correct_answer_idx else (0, 0, 255)
                 cnt = cnts_q[correct_answer_idx]
                 M = cv2.moments(cnt)
                 center = (int(M['m10']/M['m00']), int(M['m01']/M['m00'])) if M['m00'] != 0 else tuple(map(int, cv2.minEnclosingCircle(cnt)[0]))
                 cv2.circle(self.paper, center, self.median_radius, color, 2)
         
+        # Correção de todas as questões de uma vez contra o gabarito em array
+        marcadas = np.array(marcadas, dtype=np.int16)
+        corretas = self._chave_em_array(marcadas.size)
+        acertos = marcadas == corretas
+        results['marked_answers'] = [
+            {'question': q + 1, 'marked': m, 'correct': c, 'is_correct': ok}
+            for q, (m, c, ok) in enumerate(zip(marcadas.tolist(), corretas.tolist(), acertos.tolist()))
+        ]
+        results['correct_answers'] = int(acertos.sum())
+
         results['score'] = (results['correct_answers'] / results['total_questions']) * 100 if results['total_questions'] > 0 else 0
         return results
 
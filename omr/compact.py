@@ -0,0 +1,83 @@
+"""
+Formato compacto da resposta do OMR, para consumidores em lote.
+
+Com ``formato_resposta=compacto`` cada área troca a lista ``respostas`` (um
+objeto por questão) por arrays:
+
+- ``marcadas`` / ``corretas``: alternativa de cada questão (1 = 'a'; 0 =
+  nenhuma bolha marcada com confiança);
+- ``preenchimento``: matriz questões x alternativas com o preenchimento de
+  cada bolha quantizado em ``uint8`` (0–255, ``escala_preenchimento``), em
+  base64, linha a linha. Com NumPy: ``np.frombuffer(base64.b64decode(p),
+  np.uint8).reshape(forma) / 255``.
+
+Com o preenchimento o cliente pode reaplicar outro limiar de marcação sem
+reenviar a imagem. O formato completo continua sendo o padrão.
+"""
+import base64
+from typing import Optional, Tuple, Dict, Any
+
+import numpy as np
+
+FORMATO_COMPLETO = "completo"
+FORMATO_COMPACTO = "compacto"
+FORMATOS_RESPOSTA = (FORMATO_COMPLETO, FORMATO_COMPACTO)
+ESCALA_PREENCHIMENTO = 255
+
+# Campos da área mantidos no formato compacto
+_CAMPOS_AREA = ("area", "status", "message", "bolhas_detectadas", "bolhas_esperadas")
+
+
+def interpretar_formato(valor: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Valida o campo ``formato_resposta`` do formulário.
+
+    Returns:
+        (formato, None) — o completo se o campo não veio — ou (None, mensagem de erro)
+    """
+    formato = (valor or FORMATO_COMPLETO).strip().lower()
+    if formato not in FORMATOS_RESPOSTA:
+        return None, f"'formato_resposta' deve ser {' ou '.join(FORMATOS_RESPOSTA)}."
+    return formato, None
+
+
+def quantizar_preenchimento(fill_scores) -> np.ndarray:
+    """Preenchimento (0–1) de cada bolha em ``uint8``; valores acima de 1 (borda) viram 255."""
+    scores = np.asarray(fill_scores, dtype=np.float32)
+    return np.rint(np.clip(scores, 0.0, 1.0) * ESCALA_PREENCHIMENTO).astype(np.uint8)
+
+
+def compactar_area(area: Dict[str, Any], bruto: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Área de ``process_omr_image`` no formato compacto (arrays em vez de ``respostas``)."""
+    compacta = {campo: area[campo] for campo in _CAMPOS_AREA if campo in area}
+    respostas = area.get("respostas") or []
+    if not respostas:
+        return compacta
+
+    compacta["marcadas"] = [r["alternativa_marcada"] or 0 for r in respostas]
+    compacta["corretas"] = [r["alternativa_correta"] for r in respostas]
+    compacta["acertos"] = sum(1 for r in respostas if r["correto"])
+    scores = (bruto or {}).get("fill_scores") or []
+    # Área completa: uma linha por questão, uma coluna por alternativa
+    if len(scores) == len(respostas) and len({len(linha) for linha in scores}) == 1:
+        matriz = quantizar_preenchimento(scores)
+        compacta["forma"] = list(matriz.shape)
+        compacta["preenchimento"] = base64.b64encode(matriz.tobytes()).decode("ascii")
+    return compacta
+
+
+def compactar_resultado(resultado: Dict[str, Any], brutos: Dict[int, Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Resposta de ``process_omr_image`` no formato compacto.
+
+    Args:
+        resultado: Resposta de ``process_omr_image`` (formato completo).
+        brutos: Resultado do ``OMRGrader`` por número de área (com ``fill_scores``).
+    """
+    if "resultados" not in resultado:
+        return resultado
+    compacto = {chave: valor for chave, valor in resultado.items() if chave != "resultados"}
+    compacto["formato"] = FORMATO_COMPACTO
+    compacto["escala_preenchimento"] = ESCALA_PREENCHIMENTO
+    compacto["resultados"] = [compactar_area(area, brutos.get(area["area"])) for area in resultado["resultados"]]
+    return compacto
@@ -0,0 +1,294 @@
+"""
+Análise de itens de uma prova: dificuldade, ponto-bisserial, distratores e
+distribuição das notas por área.
+
+As respostas das folhas (do armazenamento de resultados ou enviadas pelo
+cliente) viram matrizes folhas x questões e as estatísticas saem de somas
+acumuladas por questão, calculadas com NumPy de uma vez:
+
+- ``dificuldade``: proporção de acertos (índice de facilidade, 0–1);
+- ``ponto_bisserial``: correlação entre acertar a questão e a nota no restante
+  da prova (item-resto), a partir de Σx, Σx·T, ΣT e ΣT² por questão;
+- ``frequencias``: quantas folhas marcaram cada alternativa (ou nenhuma);
+- por área, o histograma de acertos, com média e desvio padrão.
+
+Como as somas são aditivas, uma folha nova só soma a sua parte: a análise de
+uma prova fica em memória no worker e, a cada consulta, lê do armazenamento
+apenas as folhas gravadas desde a anterior.
+"""
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Tuple
+
+import numpy as np
+
+from . import results_store
+from .layout import LETRAS, MAX_ALTERNATIVAS
+from .results_store import validar_identificador
+
+NUM_ALTERNATIVAS = 4
+# Análises de prova mantidas em memória por worker
+CACHE_MAX_ENTRIES = int(os.getenv("ITEM_ANALYSIS_CACHE_ENTRIES", "16"))
+# Folhas lidas do armazenamento (e somadas) por vez
+CHUNK_SHEETS = 5000
+# Folhas aceitas em POST /api/analise-itens
+MAX_SUBMITTED_SHEETS = 50000
+# Chave numérica de uma questão: area * BASE + questao
+_BASE = 1 << 16
+
+
+def _nulo(valor: float, casas: int = 4) -> Optional[float]:
+    return None if not np.isfinite(valor) else round(float(valor), casas)
+
+
+class AnaliseItens:
+    """Somas acumuladas de uma prova; ``adicionar`` soma um lote de folhas."""
+
+    def __init__(self, num_alternativas: int = NUM_ALTERNATIVAS):
+        self.num_alternativas = num_alternativas
+        self.folhas = 0
+        # Questões na ordem em que apareceram (chave = area * _BASE + questao)
+        self._chaves = np.zeros(0, dtype=np.int64)
+        self._gabarito = np.zeros(0, dtype=np.int16)
+        self._respondentes = np.zeros(0, dtype=np.int64)
+        self._acertos = np.zeros(0, dtype=np.int64)
+        self._soma_xt = np.zeros(0, dtype=np.float64)
+        self._soma_t = np.zeros(0, dtype=np.float64)
+        self._soma_t2 = np.zeros(0, dtype=np.float64)
+        self._frequencias = np.zeros((0, num_alternativas + 1), dtype=np.int64)
+        self._histogramas: Dict[int, np.ndarray] = {}
+
+    def reiniciar(self) -> None:
+        self.__init__(self.num_alternativas)
+
+    def _colunas(self, chaves: np.ndarray) -> np.ndarray:
+        """Coluna de cada chave, criando as questões ainda não vistas."""
+        novas = np.setdiff1d(chaves, self._chaves)
+        if novas.size:
+            def estender(array, valor=0):
+                extra = np.full((novas.size,) + array.shape[1:], valor, dtype=array.dtype)
+                return np.concatenate([array, extra])
+            self._chaves = np.concatenate([self._chaves, novas])
+            self._gabarito = estender(self._gabarito)
+            self._respondentes = estender(self._respondentes)
+            self._acertos = estender(self._acertos)
+            self._soma_xt = estender(self._soma_xt)
+            self._soma_t = estender(self._soma_t)
+            self._soma_t2 = estender(self._soma_t2)
+            self._frequencias = estender(self._frequencias)
+        ordem = np.argsort(self._chaves, kind="stable")
+        return ordem[np.searchsorted(self._chaves, chaves, sorter=ordem)]
+
+    def adicionar(self, folha: np.ndarray, area: np.ndarray, questao: np.ndarray,
+                  marcada: np.ndarray, correta: np.ndarray, correto: np.ndarray) -> None:
+        """
+        Soma um lote de respostas (uma posição por questão respondida).
+
+        Args:
+            folha: Índice da folha no lote (0..F-1).
+            area, questao: Identificação da questão.
+            marcada: Alternativa marcada (1 = a; 0 = nenhuma).
+            correta: Alternativa correta (1 = a).
+            correto: 1 se acertou.
+        """
+        if folha.size == 0:
+            return
+        largura = int(max(marcada.max(), correta.max(), self.num_alternativas))
+        if largura > self.num_alternativas:
+            extra = np.zeros((self._frequencias.shape[0], largura - self.num_alternativas), dtype=np.int64)
+            self._frequencias = np.hstack([self._frequencias, extra])
+            self.num_alternativas = largura
+
+        colunas = self._colunas(area.astype(np.int64) * _BASE + questao)
+        num_folhas, num_questoes = int(folha.max()) + 1, self._chaves.size
+
+        acertos = np.zeros((num_folhas, num_questoes), dtype=np.float64)
+        presentes = np.zeros((num_folhas, num_questoes), dtype=np.float64)
+        acertos[folha, colunas] = correto
+        presentes[folha, colunas] = 1.0
+        nota = acertos.sum(axis=1)
+
+        self.folhas += num_folhas
+        self._gabarito[colunas] = correta
+        self._respondentes += presentes.sum(axis=0).astype(np.int64)
+        self._acertos += acertos.sum(axis=0).astype(np.int64)
+        self._soma_xt += acertos.T @ nota
+        self._soma_t += presentes.T @ nota
+        self._soma_t2 += presentes.T @ (nota * nota)
+        self._frequencias += np.bincount(
+            colunas * (self.num_alternativas + 1) + marcada,
+            minlength=num_questoes * (self.num_alternativas + 1),
+        ).reshape(num_questoes, self.num_alternativas + 1)
+
+        areas_das_colunas = self._chaves // _BASE
+        for numero in np.unique(area).tolist():
+            da_area = areas_das_colunas == numero
+            respondeu = presentes[:, da_area].any(axis=1)
+            nota_area = acertos[:, da_area].sum(axis=1)[respondeu].astype(np.int64)
+            contagem = np.bincount(nota_area, minlength=int(da_area.sum()) + 1)
+            anterior = self._histogramas.get(numero, np.zeros(0, dtype=np.int64))
+            tamanho = max(anterior.size, contagem.size)
+            self._histogramas[numero] = (np.pad(anterior, (0, tamanho - anterior.size))
+                                         + np.pad(contagem, (0, tamanho - contagem.size)))
+
+    def estatisticas(self) -> Dict[str, Any]:
+        n = self._respondentes.astype(np.float64)
+        x = self._acertos.astype(np.float64)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            p = x / n
+            # Nota no restante da prova (R = T - x) a partir das somas acumuladas
+            media_resto = (self._soma_t - x) / n
+            variancia_resto = (self._soma_t2 - 2 * self._soma_xt + x) / n - media_resto ** 2
+            media_resto_acertou = (self._soma_xt - x) / x
+            bisserial = ((media_resto_acertou - media_resto) / np.sqrt(variancia_resto)
+                         * np.sqrt(p / (1 - p)))
+
+        questoes = []
+        for c in np.argsort(self._chaves, kind="stable").tolist():
+            frequencias = self._frequencias[c].tolist()
+            questoes.append({
+                "area": int(self._chaves[c] // _BASE),
+                "questao": int(self._chaves[c] % _BASE),
+                "alternativa_correta": int(self._gabarito[c]),
+                "respondentes": int(n[c]),
+                "dificuldade": _nulo(p[c]),
+                "ponto_bisserial": _nulo(bisserial[c]),
+                "frequencias": {"nenhuma": frequencias[0],
+                                **{LETRAS[j]: f for j, f in enumerate(frequencias[1:])}},
+            })
+
+        areas = []
+        for numero in sorted(self._histogramas):
+            histograma = self._histogramas[numero]
+            total = int(histograma.sum())
+            notas = np.arange(histograma.size)
+            media = float(notas @ histograma) / total if total else float("nan")
+            desvio = float(np.sqrt((notas ** 2) @ histograma / total - media ** 2)) if total else float("nan")
+            areas.append({
+                "area": numero,
+                "questoes": int(np.count_nonzero(self._chaves // _BASE == numero)),
+                "folhas": total,
+                "media": _nulo(media),
+                "desvio_padrao": _nulo(desvio),
+                "distribuicao": histograma.tolist(),
+            })
+
+        return {"folhas": self.folhas, "questoes": questoes, "areas": areas}
+
+
+def _colunas_de_linhas(linhas: List[Tuple]) -> Tuple[np.ndarray, ...]:
+    """(folha_id, area, questao, marcada, correta, correto) em arrays, com a folha reindexada de 0."""
+    dados = np.array(linhas, dtype=np.int64).reshape(-1, 6)
+    _, folha = np.unique(dados[:, 0], return_inverse=True)
+    return folha.reshape(-1), dados[:, 1], dados[:, 2], dados[:, 3], dados[:, 4], dados[:, 5]
+
+
+# Análises do armazenamento por prova: (análise, {folha_id: criado_em}, lock)
+_cache: "OrderedDict[str, Tuple[AnaliseItens, Dict[int, float], threading.Lock]]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _entrada(prova_id: str):
+    with _cache_lock:
+        entrada = _cache.get(prova_id)
+        if entrada is None:
+            entrada = _cache[prova_id] = (AnaliseItens(), {}, threading.Lock())
+        _cache.move_to_end(prova_id)
+        while len(_cache) > CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+        return entrada
+
+
+def analisar_prova(prova_id: str) -> Dict[str, Any]:
+    """Análise das folhas gravadas de uma prova, somando só as folhas novas."""
+    analise, conhecidas, lock = _entrada(prova_id)
+    with lock:
+        if not os.path.exists(results_store.RESULTS_DB):
+            return analise.estatisticas()
+        conn = results_store._connect()
+        try:
+            atuais = dict(conn.execute("SELECT id, criado_em FROM folhas WHERE prova_id = ?", (prova_id,)))
+            if any(atuais.get(folha_id) != criado_em for folha_id, criado_em in conhecidas.items()):
+                # Folha substituída (mesmo arquivo reenviado): recomeça a prova
+                analise.reiniciar()
+                conhecidas.clear()
+            novas = sorted(set(atuais) - set(conhecidas))
+            for inicio in range(0, len(novas), CHUNK_SHEETS):
+                lote = novas[inicio:inicio + CHUNK_SHEETS]
+                linhas = []
+                # Limite de parâmetros do SQLite por consulta
+                for i in range(0, len(lote), 900):
+                    ids = lote[i:i + 900]
+                    linhas.extend(conn.execute(
+                        "SELECT folha_id, area, questao, COALESCE(alternativa_marcada, 0), "
+                        f"alternativa_correta, correto FROM respostas WHERE folha_id IN ({','.join('?' * len(ids))})",
+                        ids,
+                    ))
+                analise.adicionar(*_colunas_de_linhas(linhas))
+                # Folhas sem nenhuma área completa contam como folhas, sem respostas
+                analise.folhas += len(lote) - len({linha[0] for linha in linhas})
+                conhecidas.update((folha_id, atuais[folha_id]) for folha_id in lote)
+        finally:
+            conn.close()
+        return analise.estatisticas()
+
+
+def _linhas_enviadas(folhas) -> Tuple[Optional[List[Tuple]], Optional[str]]:
+    """Respostas de ``/api/processar-omr`` enviadas pelo cliente, em linhas."""
+    if not isinstance(folhas, list) or not folhas:
+        return None, "O campo 'folhas' deve ser uma lista (não vazia) de respostas de /api/processar-omr."
+    if len(folhas) > MAX_SUBMITTED_SHEETS:
+        return None, f"No máximo {MAX_SUBMITTED_SHEETS} folhas por análise."
+
+    linhas = []
+    for i, folha in enumerate(folhas):
+        if not isinstance(folha, dict) or not isinstance(folha.get("resultados"), list):
+            return None, f"A folha de índice {i} não tem a lista 'resultados'."
+        for area in folha["resultados"]:
+            if not isinstance(area, dict) or area.get("status") != "complete":
+                continue
+            try:
+                for resposta in area.get("respostas") or []:
+                    numero, questao = int(area["area"]), int(resposta["questao"])
+                    marcada = int(resposta.get("alternativa_marcada") or 0)
+                    correta = int(resposta["alternativa_correta"])
+                    # Fora das faixas, a contagem por alternativa quebra e as
+                    # chaves area * _BASE + questao colidem
+                    if not (1 <= numero < _BASE and 1 <= questao < _BASE
+                            and 0 <= marcada <= MAX_ALTERNATIVAS and 1 <= correta <= MAX_ALTERNATIVAS):
+                        raise ValueError
+                    linhas.append((i, numero, questao, marcada, correta, int(bool(resposta["correto"]))))
+            except (KeyError, TypeError, ValueError):
+                return None, f"Respostas inválidas na área {area.get('area')} da folha de índice {i}."
+    return linhas, None
+
+
+def analisar_folhas_request(payload) -> Tuple[Dict[str, Any], int]:
+    """Trata ``POST /api/analise-itens`` (folhas enviadas no corpo, nada é gravado)."""
+    if not isinstance(payload, dict):
+        return {"status": "bad_request", "message": "Envie um JSON com o campo 'folhas'."}, 400
+    linhas, erro = _linhas_enviadas(payload.get("folhas"))
+    if erro:
+        return {"status": "bad_request", "message": erro}, 400
+
+    analise = AnaliseItens()
+    if linhas:
+        analise.adicionar(*_colunas_de_linhas(linhas))
+    analise.folhas = len(payload["folhas"])
+    return {"status": "success", **analise.estatisticas()}, 200
+
+
+def analisar_prova_request(args) -> Tuple[Dict[str, Any], int]:
+    """Trata ``GET /api/interno/resultados/analise``."""
+    prova_id, erro = validar_identificador(args.get("prova_id"), "prova_id")
+    if erro:
+        return {"status": "bad_request", "message": erro}, 400
+    if not prova_id:
+        return {"status": "bad_request", "message": "O parâmetro 'prova_id' é obrigatório."}, 400
+    try:
+        estatisticas = analisar_prova(prova_id)
+    except sqlite3.Error as e:
+        return {"status": "processing_error", "message": f"Erro ao ler os resultados: {str(e)}"}, 500
+    return {"status": "success", "prova_id": prova_id, **estatisticas}, 200
@@ -0,0 +1,129 @@
+"""
+Layout da folha de respostas: quantas áreas, questões e alternativas.
+
+O layout padrão é o da folha original (2 áreas, 4 alternativas de 'a' a 'd',
+imagem processada com 800 px de largura). Folhas maiores mandam o campo
+``layout`` (JSON) em ``/api/processar-omr``::
+
+    {"areas": 4, "alternativas": 5, "questoes": 25, "proporcao_area": 0.3}
+
+e o layout define a detecção (quantos retângulos, tamanhos aceitos), o tamanho
+em que cada área é normalizada antes da correção e as letras válidas no
+gabarito.
+"""
+import json
+import math
+from typing import Optional, Tuple, Dict, Any, List
+
+LETRAS = "abcdefghij"
+MAX_AREAS = 12
+MAX_ALTERNATIVAS = len(LETRAS)
+MAX_QUESTOES_POR_AREA = 100
+# Largura em que a folha é processada no layout padrão (2 áreas)
+LARGURA_PADRAO = 800
+MAX_LARGURA = 4000
+# Tolerância da proporção (largura/altura) de uma área em relação à do layout
+TOLERANCIA_PROPORCAO = 0.35
+# Espaço por alternativa e por questão na área normalizada (a área padrão,
+# 4 alternativas x 10 questões, é normalizada para 400x800)
+PIXELS_POR_ALTERNATIVA = 100
+PIXELS_POR_QUESTAO = 80
+
+
+class LayoutFolha:
+    """Layout de uma folha; os tamanhos de detecção acompanham ``largura_folha``."""
+
+    def __init__(self, areas: int = 2, alternativas: int = 4, questoes: Optional[List[int]] = None,
+                 proporcao_area: Optional[float] = None, largura_folha: Optional[int] = None):
+        self.areas = areas
+        self.alternativas = alternativas
+        self.questoes = questoes
+        self.proporcao_area = proporcao_area
+        # Duas áreas cabem em 800 px; mais colunas pedem mais resolução
+        self.largura_folha = largura_folha or LARGURA_PADRAO * max(1, math.ceil(areas / 2))
+
+    @property
+    def letras(self) -> str:
+        return LETRAS[:self.alternativas]
+
+    @property
+    def tamanho_min_area(self) -> int:
+        return int(100 * self.largura_folha / LARGURA_PADRAO)
+
+    @property
+    def tamanho_max_area(self) -> int:
+        return self.largura_folha
+
+    def letras_validas(self) -> str:
+        """Texto das letras aceitas, para mensagens de erro ("'a', 'b', 'c' ou 'd'")."""
+        letras = [f"'{letra}'" for letra in self.letras]
+        return letras[0] if len(letras) == 1 else ", ".join(letras[:-1]) + f" ou {letras[-1]}"
+
+    def tamanho_normalizado(self, num_questoes: int) -> Tuple[int, int]:
+        """(largura, altura) em que uma área com ``num_questoes`` é corrigida."""
+        return (max(400, PIXELS_POR_ALTERNATIVA * self.alternativas),
+                max(800, PIXELS_POR_QUESTAO * num_questoes))
+
+    def resumo(self) -> Dict[str, Any]:
+        return {
+            "areas": self.areas,
+            "alternativas": self.alternativas,
+            "questoes": self.questoes,
+            "proporcao_area": self.proporcao_area,
+            "largura_folha": self.largura_folha,
+        }
+
+
+LAYOUT_PADRAO = LayoutFolha()
+
+
+def interpretar_layout(layout_json_str: Optional[str]) -> Tuple[Optional[LayoutFolha], Optional[str]]:
+    """
+    Valida o campo ``layout`` do formulário.
+
+    Returns:
+        (layout, None) — o padrão se o campo não veio — ou (None, mensagem de erro)
+    """
+    if not layout_json_str:
+        return LAYOUT_PADRAO, None
+    try:
+        spec = json.loads(layout_json_str)
+    except json.JSONDecodeError:
+        return None, "O layout fornecido não é um JSON válido."
+    if not isinstance(spec, dict):
+        return None, "O layout deve ser um objeto (ex.: {\"areas\": 4, \"alternativas\": 5})."
+    desconhecidos = set(spec) - {"areas", "alternativas", "questoes", "proporcao_area", "largura_folha"}
+    if desconhecidos:
+        return None, f"Campos desconhecidos no layout: {', '.join(sorted(desconhecidos))}."
+
+    def inteiro(nome, padrao, minimo, maximo):
+        valor = spec.get(nome, padrao)
+        if isinstance(valor, bool) or not isinstance(valor, int) or not minimo <= valor <= maximo:
+            raise ValueError(f"'{nome}' deve ser um inteiro entre {minimo} e {maximo}.")
+        return valor
+
+    try:
+        areas = inteiro("areas", 2, 1, MAX_AREAS)
+        alternativas = inteiro("alternativas", 4, 2, MAX_ALTERNATIVAS)
+        largura = inteiro("largura_folha", 0, 0, MAX_LARGURA) or None
+        if largura is not None and largura < LARGURA_PADRAO / 2:
+            raise ValueError(f"'largura_folha' deve ser de pelo menos {LARGURA_PADRAO // 2} px.")
+
+        questoes = spec.get("questoes")
+        if questoes is not None:
+            if isinstance(questoes, int) and not isinstance(questoes, bool):
+                questoes = [questoes] * areas
+            if (not isinstance(questoes, list) or len(questoes) != areas
+                    or not all(isinstance(q, int) and not isinstance(q, bool)
+                               and 1 <= q <= MAX_QUESTOES_POR_AREA for q in questoes)):
+                raise ValueError(f"'questoes' deve ser um inteiro ou uma lista com {areas} inteiros "
+                                 f"entre 1 e {MAX_QUESTOES_POR_AREA}.")
+
+        proporcao = spec.get("proporcao_area")
+        if proporcao is not None and (isinstance(proporcao, bool) or not isinstance(proporcao, (int, float))
+                                      or not 0.05 <= proporcao <= 20):
+            raise ValueError("'proporcao_area' (largura/altura de uma área) deve ser um número entre 0.05 e 20.")
+    except ValueError as e:
+        return None, f"Layout inválido: {e}"
+
+    return LayoutFolha(areas, alternativas, questoes, proporcao, largura), None
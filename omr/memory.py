@@ -0,0 +1,146 @@
+"""
+Modo enxuto do OMR: só tons de cinza, buffers reaproveitados e pico de memória.
+
+Com ``OMR_MODO_ENXUTO=1``:
+
+- a folha é decodificada direto em tons de cinza (um canal em vez de três) e,
+  se for JPEG bem maior que a largura de processamento, já reduzida pelo
+  próprio decodificador (``IMREAD_REDUCED_GRAYSCALE_2/4/8``); a imagem
+  original em resolução cheia nunca existe na memória;
+- as etapas do pipeline (desfoque, binarização, fechamento, normalização das
+  áreas) escrevem em buffers da thread (``buffer``) que só crescem e são
+  reaproveitados entre as requisições do worker, em vez de alocar arrays
+  novos a cada folha;
+- cada resultado ganha ``memoria``: o pico de memória residente (RSS) do
+  processo durante a correção e o acréscimo sobre o RSS do início.
+
+O pico é do processo inteiro (``VmHWM`` de /proc, zerado no início da
+medição), então é exato quando o processo corrige uma folha por vez: workers
+síncronos do gunicorn e processos do pool (omr/pool.py). Fora do Linux a
+medição devolve ``None``.
+"""
+import os
+import threading
+from typing import Optional, Tuple, Dict, Any
+
+import cv2
+import numpy as np
+
+MODO_ENXUTO = os.getenv("OMR_MODO_ENXUTO", "0") == "1"
+
+_local = threading.local()
+
+
+def buffer(nome: str, shape: Tuple[int, ...], dtype=np.uint8) -> np.ndarray:
+    """
+    View com ``shape`` sobre o buffer ``nome`` da thread.
+
+    O buffer só cresce: uma folha menor que a anterior reaproveita o mesmo
+    bloco. Dois arrays vivos ao mesmo tempo precisam de nomes diferentes.
+    """
+    tamanho = int(np.prod(shape)) * np.dtype(dtype).itemsize
+    buffers = getattr(_local, "buffers", None)
+    if buffers is None:
+        buffers = _local.buffers = {}
+    base = buffers.get(nome)
+    if base is None or base.size < tamanho:
+        base = buffers[nome] = np.empty(tamanho, np.uint8)
+    return base[:tamanho].view(dtype).reshape(shape)
+
+
+def cinza(imagem: np.ndarray, nome: Optional[str] = None) -> np.ndarray:
+    """A imagem em tons de cinza; já em cinza, é a própria (sem cópia)."""
+    if imagem.ndim == 2:
+        return imagem
+    if nome is None:
+        return cv2.cvtColor(imagem, cv2.COLOR_BGR2GRAY)
+    return cv2.cvtColor(imagem, cv2.COLOR_BGR2GRAY, dst=buffer(nome, imagem.shape[:2]))
+
+
+def _dimensoes_jpeg(conteudo: bytes) -> Optional[Tuple[int, int]]:
+    """(largura, altura) do cabeçalho SOF de um JPEG, sem decodificar."""
+    if conteudo[:2] != b"\xff\xd8":
+        return None
+    i = 2
+    while i + 9 < len(conteudo):
+        if conteudo[i] != 0xFF:
+            return None
+        marcador = conteudo[i + 1]
+        if marcador in (0xD8, 0x01) or 0xD0 <= marcador <= 0xD7:
+            i += 2
+            continue
+        tamanho = int.from_bytes(conteudo[i + 2:i + 4], "big")
+        if 0xC0 <= marcador <= 0xCF and marcador not in (0xC4, 0xC8, 0xCC):
+            altura = int.from_bytes(conteudo[i + 5:i + 7], "big")
+            largura = int.from_bytes(conteudo[i + 7:i + 9], "big")
+            return largura, altura
+        i += 2 + tamanho
+    return None
+
+
+_REDUCOES = ((8, cv2.IMREAD_REDUCED_GRAYSCALE_8), (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+             (2, cv2.IMREAD_REDUCED_GRAYSCALE_2))
+
+
+def decodificar_cinza(conteudo: bytes, largura: int) -> Optional[np.ndarray]:
+    """
+    Decodifica a folha em tons de cinza já na largura de processamento.
+
+    Num JPEG com o dobro (ou mais) da ``largura``, o decodificador reduz a
+    imagem por 2, 4 ou 8 ao descomprimir, sem nunca ficar abaixo da largura;
+    o ajuste fino é um ``resize`` da imagem já reduzida. Vale o menor lado do
+    cabeçalho, porque a orientação EXIF pode girar a imagem.
+    """
+    flag = cv2.IMREAD_GRAYSCALE
+    dimensoes = _dimensoes_jpeg(conteudo)
+    if dimensoes:
+        for fator, reduzido in _REDUCOES:
+            if min(dimensoes) // fator >= largura:
+                flag = reduzido
+                break
+    imagem = cv2.imdecode(np.frombuffer(conteudo, np.uint8), flag)
+    if imagem is None or imagem.shape[1] == largura:
+        return imagem
+    h, w = imagem.shape
+    return cv2.resize(imagem, (largura, int(h * largura / float(w))))
+
+
+def _status_kb(campo: str) -> Optional[int]:
+    with open("/proc/self/status") as f:
+        for linha in f:
+            if linha.startswith(campo):
+                return int(linha.split()[1])
+    return None
+
+
+class PicoMemoria:
+    """Mede o pico de RSS do processo dentro do bloco ``with``."""
+
+    def __init__(self):
+        self.base_kb: Optional[int] = None
+        self.pico_kb: Optional[int] = None
+
+    def __enter__(self) -> "PicoMemoria":
+        try:
+            # "5" zera o VmHWM (pico de RSS) do processo
+            with open("/proc/self/clear_refs", "w") as f:
+                f.write("5")
+            self.base_kb = _status_kb("VmRSS:")
+        except OSError:
+            self.base_kb = None
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if self.base_kb is not None:
+            try:
+                self.pico_kb = _status_kb("VmHWM:")
+            except OSError:
+                self.pico_kb = None
+
+    def resumo(self) -> Optional[Dict[str, Any]]:
+        if self.base_kb is None or self.pico_kb is None:
+            return None
+        return {
+            "pico_mb": round(self.pico_kb / 1024, 1),
+            "acrescimo_mb": round(max(0, self.pico_kb - self.base_kb) / 1024, 1),
+        }
@@ -0,0 +1,276 @@
+"""
+Pool de processos do OMR com as imagens em memória compartilhada.
+
+Cada folha de um lote é decodificada no processo da requisição e copiada
+para um buffer de um anel de ``OMR_POOL_SLOTS`` blocos de
+``multiprocessing.shared_memory`` reutilizados entre as folhas e as
+requisições do worker. O processo do pool recebe só o nome do bloco, a forma
+e o tipo da imagem, monta uma view NumPy sobre o buffer (sem cópia nem
+pickle dos pixels) e devolve apenas o resultado da correção.
+
+Antes de ir para o anel a imagem é reduzida à largura em que o pipeline a
+processa (``layout.largura_folha``), o mesmo primeiro passo que
+``DocumentProcessor.load_and_resize`` faria; assim uma foto de 12 MP cabe
+num buffer de poucos MB. Se ainda assim não couber, a folha vai por pickle.
+
+Com ``OMR_POOL_WORKERS=0`` as folhas são corrigidas em sequência no próprio
+processo. No modo enxuto (omr/memory.py) as folhas vão para o anel em tons de
+cinza, um terço do tamanho.
+"""
+import atexit
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from multiprocessing import resource_tracker, shared_memory
+from typing import Optional, Dict, Any, Iterable, Iterator, Tuple
+
+import cv2
+import numpy as np
+
+from log_config import get_logger, new_request_id, current_request_id
+
+from .layout import LayoutFolha
+from .memory import MODO_ENXUTO, PicoMemoria, decodificar_cinza
+
+logger = get_logger("omr.pool")
+
+POOL_WORKERS = int(os.getenv("OMR_POOL_WORKERS", str(min(4, os.cpu_count() or 1))))
+POOL_SLOTS = int(os.getenv("OMR_POOL_SLOTS", "0")) or 2 * max(1, POOL_WORKERS)
+SLOT_BYTES = int(float(os.getenv("OMR_POOL_SLOT_MB", "16")) * 1024 * 1024)
+# spawn: os processos do pool não herdam threads (logs, gunicorn) do worker
+START_METHOD = os.getenv("OMR_POOL_START_METHOD", "spawn")
+
+
+class SharedImageRing:
+    """Anel de buffers em memória compartilhada, reaproveitados entre as folhas."""
+
+    def __init__(self, slots: int, slot_bytes: int):
+        self.slot_bytes = slot_bytes
+        self._blocks = [shared_memory.SharedMemory(create=True, size=slot_bytes) for _ in range(slots)]
+        self._free: "queue.Queue[int]" = queue.Queue()
+        for slot in range(slots):
+            self._free.put(slot)
+
+    def acquire(self, block: bool = True) -> Optional[int]:
+        try:
+            return self._free.get(block=block)
+        except queue.Empty:
+            return None
+
+    def release(self, slot: int) -> None:
+        self._free.put(slot)
+
+    def write(self, slot: int, image: np.ndarray) -> Tuple[str, Tuple[int, ...], str]:
+        """Copia a imagem para o buffer; devolve o descritor que vai para o processo do pool."""
+        block = self._blocks[slot]
+        np.ndarray(image.shape, dtype=image.dtype, buffer=block.buf)[...] = image
+        return block.name, image.shape, image.dtype.str
+
+    def close(self) -> None:
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
+
+
+# Blocos já abertos no processo do pool (um por buffer do anel)
+_attached: Dict[str, shared_memory.SharedMemory] = {}
+
+
+def _anexar(name: str) -> shared_memory.SharedMemory:
+    """
+    Abre um bloco do anel sem registrá-lo no ``resource_tracker``.
+
+    Só o processo principal (dono do anel) faz ``unlink``. Os processos do pool
+    usam o mesmo tracker do principal, então registrar e depois desfazer o
+    registro aqui apagaria o registro do dono; o bloco simplesmente não é
+    registrado (``track=False`` a partir do Python 3.13).
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    register = resource_tracker.register
+    resource_tracker.register = lambda *args, **kwargs: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+def _view(descritor: Tuple[str, Tuple[int, ...], str]) -> np.ndarray:
+    name, shape, dtype = descritor
+    block = _attached.get(name)
+    if block is None:
+        block = _attached[name] = _anexar(name)
+    return np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+
+
+def _corrigir_no_worker(imagem, GABARITOS, layout: LayoutFolha, modo_captura: str = "foto",
+                        request_id: Optional[str] = None) -> Tuple[Dict[str, Any], Dict[int, Dict[str, Any]]]:
+    """Roda no processo do pool: ``imagem`` é um descritor do anel ou o array (fallback)."""
+    from .service import process_omr_image
+
+    # Logs do processo do pool com o id da requisição que enviou a folha
+    new_request_id(request_id)
+    if isinstance(imagem, tuple):
+        imagem = _view(imagem)
+    brutos: Dict[int, Dict[str, Any]] = {}
+    if not MODO_ENXUTO:
+        return process_omr_image(imagem, GABARITOS=GABARITOS, brutos=brutos, layout=layout,
+                                 modo_captura=modo_captura), brutos
+    # Modo enxuto: pico de memória do processo durante a folha
+    with PicoMemoria() as memoria:
+        resultado = process_omr_image(imagem, GABARITOS=GABARITOS, brutos=brutos, layout=layout,
+                                      modo_captura=modo_captura, enxuto=True)
+    resumo = memoria.resumo()
+    if resumo is not None:
+        resultado["memoria"] = resumo
+    return resultado, brutos
+
+
+def decodificar_folha(conteudo: bytes, layout: LayoutFolha) -> Optional[np.ndarray]:
+    """Imagem da folha para o pool: BGR, ou em cinza já reduzida no modo enxuto."""
+    if MODO_ENXUTO:
+        return decodificar_cinza(conteudo, layout.largura_folha)
+    return cv2.imdecode(np.frombuffer(conteudo, np.uint8), cv2.IMREAD_COLOR)
+
+
+def reduzir_para_processamento(imagem: np.ndarray, layout: LayoutFolha) -> np.ndarray:
+    """Mesma redução de ``DocumentProcessor.load_and_resize``, feita antes do envio."""
+    h, w = imagem.shape[:2]
+    if w == layout.largura_folha:
+        return imagem
+    ratio = layout.largura_folha / float(w)
+    return cv2.resize(imagem, (layout.largura_folha, int(h * ratio)))
+
+
+class OMRPool:
+    """Processos do pool mais o anel de buffers; um por worker da API."""
+
+    def __init__(self, workers: int = POOL_WORKERS, slots: int = POOL_SLOTS, slot_bytes: int = SLOT_BYTES):
+        self.workers = workers
+        self.ring = SharedImageRing(slots, slot_bytes)
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context(START_METHOD)
+        )
+        logger.info("Pool do OMR iniciado: %d processos, %d buffers de %.1f MB",
+                    workers, slots, slot_bytes / 1024 / 1024)
+
+    def corrigir(self, imagens: Iterable[Optional[np.ndarray]], GABARITOS,
+                 layout: LayoutFolha, modo_captura: str = "foto") -> Iterator[Tuple[int, Any]]:
+        """
+        Corrige as folhas em paralelo, no máximo uma por buffer livre.
+
+        ``imagens`` pode ser um gerador (cada folha só é decodificada quando há
+        buffer para ela); ``None`` marca uma folha ilegível.
+
+        Yields:
+            (índice, (resultado, brutos)) na ordem em que terminam; o item é a
+            exceção se a correção da folha falhou.
+        """
+        pendentes: Dict[Any, Tuple[int, Optional[int]]] = {}
+        try:
+            yield from self._corrigir(pendentes, enumerate(imagens), GABARITOS, layout, modo_captura)
+        finally:
+            # Lote interrompido (erro ou cliente desconectado): os buffers das
+            # folhas em andamento só voltam ao anel quando elas terminam
+            for future, (_, slot) in pendentes.items():
+                future.cancel()
+                if slot is not None:
+                    future.add_done_callback(lambda _, slot=slot: self.ring.release(slot))
+
+    def _corrigir(self, pendentes, proximas, GABARITOS, layout, modo_captura):
+        esgotado = False
+        request_id = current_request_id()
+        while True:
+            while not esgotado:
+                # Sem folhas em andamento pode esperar um buffer; com folhas em
+                # andamento, não (os buffers delas só voltam ao coletar o resultado)
+                slot = self.ring.acquire(block=not pendentes)
+                if slot is None:
+                    break
+                try:
+                    indice, imagem = next(proximas)
+                except StopIteration:
+                    self.ring.release(slot)
+                    esgotado = True
+                    break
+                if imagem is None:
+                    self.ring.release(slot)
+                    yield indice, None
+                    continue
+                imagem = reduzir_para_processamento(imagem, layout)
+                if imagem.nbytes <= self.ring.slot_bytes:
+                    carga = self.ring.write(slot, imagem)
+                else:
+                    self.ring.release(slot)
+                    slot, carga = None, imagem
+                pendentes[self.executor.submit(_corrigir_no_worker, carga, GABARITOS, layout, modo_captura, request_id)] = (indice, slot)
+
+            if not pendentes:
+                return
+            concluidos, _ = wait(pendentes, return_when=FIRST_COMPLETED)
+            for future in concluidos:
+                indice, slot = pendentes.pop(future)
+                if slot is not None:
+                    self.ring.release(slot)
+                try:
+                    yield indice, future.result()
+                except Exception as e:
+                    yield indice, e
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.ring.close()
+
+
+_pool: Optional[OMRPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> Optional[OMRPool]:
+    """Pool do worker (criado na primeira chamada), ou None com ``OMR_POOL_WORKERS=0``."""
+    global _pool
+    if POOL_WORKERS <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = OMRPool()
+        return _pool
+
+
+def _fechar_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+def _descartar_no_filho() -> None:
+    # O pool (processos e buffers) pertence ao processo que o criou
+    global _pool, _pool_lock
+    _pool, _pool_lock = None, threading.Lock()
+
+
+atexit.register(_fechar_pool)
+os.register_at_fork(after_in_child=_descartar_no_filho)
+
+
+def corrigir_folhas(imagens: Iterable[Optional[np.ndarray]], GABARITOS,
+                    layout: LayoutFolha, modo_captura: str = "foto") -> Iterator[Tuple[int, Any]]:
+    """Corrige as folhas no pool (ou em sequência, sem pool); ver ``OMRPool.corrigir``."""
+    pool = get_pool()
+    if pool is not None:
+        yield from pool.corrigir(imagens, GABARITOS, layout, modo_captura)
+        return
+    for indice, imagem in enumerate(imagens):
+        if imagem is None:
+            yield indice, None
+            continue
+        try:
+            yield indice, _corrigir_no_worker(imagem, GABARITOS, layout, modo_captura)
+        except Exception as e:
+            yield indice, e
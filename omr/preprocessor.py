@@ -1,22 +1,35 @@
 import cv2
 import numpy as np
 
+from log_config import get_logger
+
+from .memory import buffer, cinza
+
+logger = get_logger("omr.preprocessor")
+
 class DocumentProcessor:
     """
     Classe responsável por processar o documento (folha) em imagem.
     Combina a correção de perspectiva com as técnicas de binarização e
     morfologia do script de análise de gabarito.
     """
-    def __init__(self, image_path, target_width=800):
+    def __init__(self, image_path=None, target_width=800, image=None, enxuto=False):
         """
         Inicializa o processador de documento.
 
         Args:
             image_path (str): Caminho para o arquivo de imagem.
             target_width (int): Largura desejada para redimensionamento inicial.
+            image (np.ndarray): Imagem BGR (ou em tons de cinza) já carregada
+                (dispensa image_path).
+            enxuto (bool): Etapas escrevem nos buffers reaproveitados da
+                thread (omr/memory.py) e a imagem de entrada é solta logo
+                após o redimensionamento.
         """
         self.image_path = image_path
+        self.image = image
         self.target_width = target_width
+        self.enxuto = enxuto
         self.original = None
         self.resized = None
         self.warped = None
@@ -31,16 +44,26 @@ class DocumentProcessor:
         Returns:
             np.ndarray: Imagem redimensionada.
         """
-        self.original = cv2.imread(self.image_path)
+        self.original = self.image if self.image is not None else cv2.imread(self.image_path)
         if self.original is None:
             raise FileNotFoundError(f"Erro: Não foi possível carregar a imagem em '{self.image_path}'. Verifique o caminho.")
         
         h, w = self.original.shape[:2]
-        ratio = self.target_width / float(w)
-        new_dim = (self.target_width, int(h * ratio))
-        self.resized = cv2.resize(self.original, new_dim)
+        if w == self.target_width:
+            # Já na largura de processamento (ex.: reduzida antes do pool)
+            self.resized = self.original
+        else:
+            ratio = self.target_width / float(w)
+            new_dim = (self.target_width, int(h * ratio))
+            self.resized = cv2.resize(self.original, new_dim)
+        if self.enxuto:
+            self.original = self.image = None
         return self.resized
 
+    def _buffer(self, nome, shape):
+        # Destino de uma etapa: buffer da thread no modo enxuto, array novo no normal
+        return buffer(nome, shape) if self.enxuto else None
+
     @staticmethod
     def order_points(pts):
         """
@@ -72,7 +95,7 @@ class DocumentProcessor:
         Returns:
             np.ndarray: Imagem com perspectiva corrigida (deskewed).
         """
-        gray = cv2.cvtColor(self.resized, cv2.COLOR_BGR2GRAY)
+        gray = cinza(self.resized)
         blur =cv2.GaussianBlur(gray, (5, 5), 0)
         edges = cv2.Canny(blur, 50, 150)
 
@@ -91,8 +114,9 @@ class DocumentProcessor:
                 break
 
         if sheet is None:
-            print("[AVISO] Nenhum contorno de folha detectado. Usando a imagem redimensionada.")
-            self.warped = self.resized.copy()
+            logger.debug("Nenhum contorno de folha detectado. Usando a imagem redimensionada.")
+            # As etapas seguintes só leem a imagem alinhada: não precisa de cópia
+            self.warped = self.resized
             return self.warped
 
         rect = self.order_points(sheet)
@@ -111,7 +135,76 @@ class DocumentProcessor:
         ], dtype='float32')
 
         M = cv2.getPerspectiveTransform(rect, dst)
-        self.warped = cv2.warpPerspective(self.resized, M, (maxW, maxH))
+        self.warped = cv2.warpPerspective(self.resized, M, (maxW, maxH),
+                                          dst=self._buffer("folha_alinhada", (maxH, maxW) + self.resized.shape[2:]))
+        return self.warped
+
+    def parece_digitalizada(self, faixa=0.03, min_claro=170, max_escuro=0.02):
+        """
+        Indica se a imagem parece vir de um scanner: a folha ocupa o quadro
+        inteiro, então a moldura externa da imagem é papel claro e quase sem
+        pixels escuros. Numa foto a moldura costuma ser o fundo (mesa, mão).
+
+        Args:
+            faixa (float): Largura da moldura examinada, em fração do lado.
+            min_claro (int): Brilho médio mínimo da moldura.
+            max_escuro (float): Fração máxima de pixels escuros (< 128) na moldura.
+
+        Returns:
+            bool: True se a imagem parece digitalizada.
+        """
+        gray = cinza(self.resized)
+        h, w = gray.shape
+        dy, dx = max(1, int(h * faixa)), max(1, int(w * faixa))
+        moldura = np.concatenate([
+            gray[:dy].ravel(), gray[-dy:].ravel(), gray[dy:-dy, :dx].ravel(), gray[dy:-dy, -dx:].ravel()
+        ])
+        return moldura.mean() >= min_claro and np.count_nonzero(moldura < 128) <= max_escuro * moldura.size
+
+    def deskew(self, max_angle=5.0, min_angle=0.5, min_size=100):
+        """
+        Caminho rápido para folhas de scanner: sem distorção de perspectiva,
+        só uma pequena rotação. O ângulo é a mediana do ``minAreaRect`` dos
+        contornos externos grandes (as áreas de resposta e a moldura), e a
+        imagem recebe uma única rotação afim.
+
+        Args:
+            max_angle (float): Maior rotação corrigida, em graus; acima disso
+                a imagem segue sem rotação.
+            min_angle (float): Menor rotação corrigida. Abaixo de 0,5° o desvio
+                numa linha de bolhas fica em poucos pixels, que a detecção e a
+                correção já toleram, e a rotação (a etapa mais cara) é evitada.
+            min_size (int): Lado mínimo de um contorno usado na estimativa.
+
+        Returns:
+            np.ndarray: Imagem alinhada (a própria imagem redimensionada se não houver rotação).
+        """
+        gray = cinza(self.resized)
+        _, binaria = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+        contours, _ = cv2.findContours(binaria, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+        angulos = []
+        for c in contours:
+            (_, _), (w, h), angulo = cv2.minAreaRect(c)
+            if w < min_size or h < min_size:
+                continue
+            # minAreaRect devolve (0, 90]; a inclinação fica em (-45, 45]
+            angulos.append(angulo - 90 if angulo > 45 else angulo)
+
+        angulo = float(np.median(angulos)) if angulos else 0.0
+        if abs(angulo) > max_angle:
+            logger.debug("Inclinação de %.1f° acima do limite do scanner (%.1f°); sem rotação.", angulo, max_angle)
+            angulo = 0.0
+        if abs(angulo) < min_angle:
+            self.warped = self.resized
+            return self.warped
+
+        h, w = self.resized.shape[:2]
+        M = cv2.getRotationMatrix2D((w / 2, h / 2), angulo, 1.0)
+        self.warped = cv2.warpAffine(self.resized, M, (w, h), dst=self._buffer("folha_alinhada", self.resized.shape),
+                                     flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT,
+                                     borderValue=(255, 255, 255))
+        logger.debug("Folha digitalizada alinhada: rotação de %.2f°", angulo)
         return self.warped
 
     def apply_thresholding(self, blur_ksize=(5, 5), block_size=11, C=3):
@@ -130,14 +223,15 @@ class DocumentProcessor:
         if self.warped is None:
             raise ValueError("A correção de perspectiva deve ser executada primeiro.")
             
-        gray = cv2.cvtColor(self.warped, cv2.COLOR_BGR2GRAY)
-        blurred = cv2.GaussianBlur(gray, blur_ksize, 0)
+        gray = cinza(self.warped, "folha_cinza" if self.enxuto else None)
+        blurred = cv2.GaussianBlur(gray, blur_ksize, 0, dst=self._buffer("folha_desfoque", gray.shape))
         
         self.thresh = cv2.adaptiveThreshold(
             blurred, 255,
             cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
             cv2.THRESH_BINARY_INV,
-            block_size, C
+            block_size, C,
+            dst=self._buffer("folha_thresh", gray.shape)
         )
         return self.thresh
 
@@ -156,7 +250,10 @@ class DocumentProcessor:
             raise ValueError("A binarização (thresholding) deve ser executada primeiro.")
             
         kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (kernel_size, kernel_size))
-        self.processed_image = cv2.morphologyEx(self.thresh, cv2.MORPH_CLOSE, kernel)
+        self.processed_image = cv2.morphologyEx(self.thresh, cv2.MORPH_CLOSE, kernel,
+                                                dst=self._buffer("folha_fechada", self.thresh.shape))
+        if self.enxuto:
+            self.thresh = None
         return self.processed_image
 
 
@@ -0,0 +1,374 @@
+"""
+Armazenamento local dos resultados corrigidos.
+
+Com ``OMR_RESULTS_STORE=1``, cada folha corrigida em ``/api/processar-omr``
+que traga ``prova_id`` ou ``aluno_id`` é gravada num SQLite
+(``OMR_RESULTS_DB``) com o status, as alternativas marcadas e o preenchimento
+de cada bolha, identificada por prova, aluno e hash do arquivo enviado. A
+gravação é feita em lotes por uma thread em segundo plano, fora do caminho da
+requisição; o mesmo arquivo reenviado para a mesma prova e aluno substitui o
+registro anterior.
+
+Painéis e relatórios leem daqui (``/api/interno/resultados`` e a exportação
+em CSV ou colunar ``.npz``) em vez de reprocessar as imagens.
+"""
+import atexit
+import csv
+import io
+import os
+import queue
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Optional, Dict, Any, List, Tuple
+
+import numpy as np
+
+from log_config import get_logger, current_request_id
+
+logger = get_logger("omr.results")
+
+# Desligado por padrão: grava respostas de alunos, então é opt-in
+RESULTS_STORE_ENABLED = os.getenv("OMR_RESULTS_STORE", "0").strip().lower() in ("1", "true", "yes", "on")
+# Fora da árvore do código; em produção aponte para um caminho persistente
+DEFAULT_RESULTS_DB = os.path.join(tempfile.gettempdir(), "florescer-ia-resultados.sqlite3")
+RESULTS_DB = os.getenv("OMR_RESULTS_DB") or DEFAULT_RESULTS_DB
+# Folhas por transação na thread de gravação
+BATCH_SIZE = 200
+# Tentativas de abrir o banco (com backoff) e pausa antes de tentar de novo;
+# durante a pausa as folhas recebidas são descartadas
+CONNECT_RETRIES = 3
+CONNECT_BACKOFF_SECONDS = 0.5
+RECONNECT_SECONDS = 30.0
+# Tamanho máximo de prova_id e aluno_id
+MAX_ID_LENGTH = 128
+# Folhas por consulta em /api/interno/resultados
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+EXPORT_FORMATS = ("csv", "npz")
+
+EXPORT_COLUMNS = (
+    "folha_id", "prova_id", "aluno_id", "upload_hash", "gabarito_id", "status", "criado_em",
+    "area", "questao", "alternativa_marcada", "alternativa_correta", "correto", "preenchimento",
+)
+
+
+def _connect() -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(RESULTS_DB) or ".", exist_ok=True)
+    conn = sqlite3.connect(RESULTS_DB, timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS folhas ("
+        "id INTEGER PRIMARY KEY, prova_id TEXT NOT NULL, aluno_id TEXT NOT NULL, "
+        "upload_hash TEXT NOT NULL, gabarito_id TEXT, status TEXT NOT NULL, "
+        "acertos INTEGER NOT NULL, questoes INTEGER NOT NULL, criado_em REAL NOT NULL, "
+        "request_id TEXT, UNIQUE (prova_id, aluno_id, upload_hash))"
+    )
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS respostas ("
+        "folha_id INTEGER NOT NULL REFERENCES folhas (id) ON DELETE CASCADE, "
+        "area INTEGER NOT NULL, questao INTEGER NOT NULL, alternativa_marcada INTEGER, "
+        "alternativa_correta INTEGER NOT NULL, correto INTEGER NOT NULL, preenchimento TEXT NOT NULL, "
+        "PRIMARY KEY (folha_id, area, questao)) WITHOUT ROWID"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS folhas_prova ON folhas (prova_id, criado_em)")
+    conn.execute("CREATE INDEX IF NOT EXISTS folhas_aluno ON folhas (aluno_id, criado_em)")
+    conn.execute("CREATE INDEX IF NOT EXISTS folhas_hash ON folhas (upload_hash)")
+    return conn
+
+
+def montar_registro(resultado: Dict[str, Any], brutos: Dict[int, Dict[str, Any]], upload_hash: str,
+                    prova_id: str = "", aluno_id: str = "",
+                    gabarito_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Registro de uma folha a partir da resposta de ``process_omr_image``.
+
+    Só as áreas com todas as bolhas detectadas entram com respostas; as
+    marcações de uma área incompleta não são confiáveis.
+
+    Args:
+        resultado: Resposta de ``process_omr_image``.
+        brutos: Resultado do ``OMRGrader`` por número de área (com ``fill_scores``).
+    """
+    respostas = []
+    for area in resultado.get("resultados", []):
+        bruto = brutos.get(area["area"])
+        if area.get("status") != "complete" or not bruto:
+            continue
+        for ans, preenchimento in zip(bruto["marked_answers"], bruto["fill_scores"]):
+            respostas.append((
+                area["area"], ans["question"],
+                ans["marked"] + 1 if ans["marked"] != -1 else None,
+                ans["correct"] + 1, int(ans["is_correct"]),
+                ",".join(f"{score:.4f}" for score in preenchimento),
+            ))
+    return {
+        "prova_id": prova_id or "",
+        "aluno_id": aluno_id or "",
+        "upload_hash": upload_hash,
+        "gabarito_id": gabarito_id,
+        "status": resultado.get("status", "unknown"),
+        "acertos": sum(r[4] for r in respostas),
+        "questoes": len(respostas),
+        "criado_em": time.time(),
+        "request_id": current_request_id(),
+        "respostas": respostas,
+    }
+
+
+class _ResultsWriter:
+    """Grava as folhas no SQLite numa thread própria, em lotes."""
+
+    def __init__(self):
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, registro: Dict[str, Any]) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="omr-results-writer", daemon=True)
+                self._thread.start()
+        self._queue.put(registro)
+
+    def _conectar(self) -> Optional[sqlite3.Connection]:
+        """Abre o banco com novas tentativas; None se continuar indisponível."""
+        for tentativa in range(CONNECT_RETRIES):
+            try:
+                return _connect()
+            except (sqlite3.Error, OSError) as e:
+                erro = e
+                if tentativa + 1 < CONNECT_RETRIES:
+                    time.sleep(CONNECT_BACKOFF_SECONDS * 2 ** tentativa)
+        logger.warning("Armazenamento de resultados indisponível (%s): %s; nova tentativa em %.0fs",
+                       RESULTS_DB, erro, RECONNECT_SECONDS)
+        return None
+
+    def _run(self) -> None:
+        conn: Optional[sqlite3.Connection] = None
+        indisponivel_ate = 0.0
+        while True:
+            batch = [self._queue.get()]
+            # Junta o que chegou enquanto esperava numa só transação
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                if conn is None and time.time() >= indisponivel_ate:
+                    conn = self._conectar()
+                    if conn is None:
+                        indisponivel_ate = time.time() + RECONNECT_SECONDS
+                if conn is None:
+                    # Banco indisponível: descarta o lote em vez de acumular a fila
+                    logger.debug("Descartando %d resultado(s) do OMR: armazenamento indisponível", len(batch))
+                    continue
+                with conn:
+                    for r in batch:
+                        conn.execute(
+                            "DELETE FROM folhas WHERE prova_id = ? AND aluno_id = ? AND upload_hash = ?",
+                            (r["prova_id"], r["aluno_id"], r["upload_hash"]),
+                        )
+                        folha_id = conn.execute(
+                            "INSERT INTO folhas (prova_id, aluno_id, upload_hash, gabarito_id, status, "
+                            "acertos, questoes, criado_em, request_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                            (r["prova_id"], r["aluno_id"], r["upload_hash"], r["gabarito_id"], r["status"],
+                             r["acertos"], r["questoes"], r["criado_em"], r["request_id"]),
+                        ).lastrowid
+                        conn.executemany(
+                            "INSERT INTO respostas VALUES (?, ?, ?, ?, ?, ?, ?)",
+                            [(folha_id, *resposta) for resposta in r["respostas"]],
+                        )
+            except sqlite3.Error as e:
+                logger.warning("Falha ao gravar %d resultado(s) do OMR: %s", len(batch), e)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def flush(self, timeout: float = 5.0) -> None:
+        """Espera as folhas pendentes serem gravadas (testes e desligamento)."""
+        deadline = time.time() + timeout
+        while self._queue.unfinished_tasks and time.time() < deadline:
+            time.sleep(0.01)
+
+
+_writer = _ResultsWriter()
+atexit.register(_writer.flush)
+
+
+def registrar_folha(registro: Dict[str, Any]) -> None:
+    """Enfileira a gravação de uma folha (não bloqueia a requisição)."""
+    # Folha sem prova nem aluno não tem como ser consultada depois: não grava
+    if RESULTS_STORE_ENABLED and (registro.get("prova_id") or registro.get("aluno_id")):
+        _writer.submit(registro)
+
+
+def validar_identificador(valor: Optional[str], campo: str) -> Tuple[str, Optional[str]]:
+    """Normaliza ``prova_id``/``aluno_id``; devolve (valor, mensagem de erro)."""
+    valor = (valor or "").strip()
+    if len(valor) > MAX_ID_LENGTH:
+        return "", f"O campo '{campo}' deve ter no máximo {MAX_ID_LENGTH} caracteres."
+    return valor, None
+
+
+def _filtros(prova_id: str, aluno_id: str) -> Tuple[str, List[Any]]:
+    condicoes, parametros = [], []
+    if prova_id:
+        condicoes.append("f.prova_id = ?")
+        parametros.append(prova_id)
+    if aluno_id:
+        condicoes.append("f.aluno_id = ?")
+        parametros.append(aluno_id)
+    return (" WHERE " + " AND ".join(condicoes)) if condicoes else "", parametros
+
+
+def _preenchimento(texto: str) -> List[float]:
+    return [float(v) for v in texto.split(",")] if texto else []
+
+
+def consultar_resultados(prova_id: str = "", aluno_id: str = "", limite: int = DEFAULT_LIMIT,
+                         deslocamento: int = 0) -> List[Dict[str, Any]]:
+    """Folhas gravadas (mais recentes primeiro), com as respostas de cada uma."""
+    if not os.path.exists(RESULTS_DB):
+        return []
+    where, parametros = _filtros(prova_id, aluno_id)
+    conn = _connect()
+    try:
+        conn.row_factory = sqlite3.Row
+        folhas = [dict(row) for row in conn.execute(
+            f"SELECT f.* FROM folhas f{where} ORDER BY f.criado_em DESC, f.id DESC LIMIT ? OFFSET ?",
+            (*parametros, limite, deslocamento),
+        )]
+        por_id = {}
+        for folha in folhas:
+            folha["folha_id"] = folha.pop("id")
+            folha["respostas"] = []
+            por_id[folha["folha_id"]] = folha
+        if por_id:
+            marcadores = ",".join("?" * len(por_id))
+            for row in conn.execute(
+                f"SELECT * FROM respostas WHERE folha_id IN ({marcadores}) ORDER BY folha_id, area, questao",
+                list(por_id),
+            ):
+                resposta = dict(row)
+                resposta["correto"] = bool(resposta["correto"])
+                resposta["preenchimento"] = _preenchimento(resposta["preenchimento"])
+                por_id[resposta.pop("folha_id")]["respostas"].append(resposta)
+    finally:
+        conn.close()
+    return folhas
+
+
+def _linhas_exportacao(prova_id: str, aluno_id: str):
+    """Uma linha por questão (folhas sem respostas aparecem com a questão vazia)."""
+    if not os.path.exists(RESULTS_DB):
+        return
+    where, parametros = _filtros(prova_id, aluno_id)
+    conn = _connect()
+    try:
+        yield from conn.execute(
+            "SELECT f.id, f.prova_id, f.aluno_id, f.upload_hash, f.gabarito_id, f.status, f.criado_em, "
+            "r.area, r.questao, r.alternativa_marcada, r.alternativa_correta, r.correto, r.preenchimento "
+            f"FROM folhas f LEFT JOIN respostas r ON r.folha_id = f.id{where} "
+            "ORDER BY f.id, r.area, r.questao",
+            parametros,
+        )
+    finally:
+        conn.close()
+
+
+def exportar_csv(prova_id: str = "", aluno_id: str = "") -> bytes:
+    saida = io.StringIO()
+    escritor = csv.writer(saida)
+    escritor.writerow(EXPORT_COLUMNS)
+    escritor.writerows(_linhas_exportacao(prova_id, aluno_id))
+    return saida.getvalue().encode("utf-8")
+
+
+def exportar_colunar(prova_id: str = "", aluno_id: str = "") -> bytes:
+    """
+    Exporta em ``.npz``: um array por coluna (como um Parquet sem dependências).
+
+    Inteiros ausentes viram -1 (questão/alternativa) e o preenchimento é uma
+    matriz ``linhas x alternativas`` com NaN onde não há bolha.
+    """
+    linhas = list(_linhas_exportacao(prova_id, aluno_id))
+    colunas = list(zip(*linhas)) if linhas else [()] * len(EXPORT_COLUMNS)
+    dados = dict(zip(EXPORT_COLUMNS, colunas))
+
+    def inteiros(nome, dtype):
+        return np.array([-1 if v is None else v for v in dados[nome]], dtype=dtype)
+
+    preenchimentos = [_preenchimento(texto) for texto in dados["preenchimento"]]
+    largura = max((len(p) for p in preenchimentos), default=0)
+    matriz = np.full((len(preenchimentos), largura), np.nan, dtype=np.float32)
+    for i, p in enumerate(preenchimentos):
+        matriz[i, :len(p)] = p
+
+    saida = io.BytesIO()
+    np.savez_compressed(
+        saida,
+        folha_id=inteiros("folha_id", np.int64),
+        prova_id=np.array(dados["prova_id"], dtype=str),
+        aluno_id=np.array(dados["aluno_id"], dtype=str),
+        upload_hash=np.array(dados["upload_hash"], dtype=str),
+        gabarito_id=np.array([v or "" for v in dados["gabarito_id"]], dtype=str),
+        status=np.array(dados["status"], dtype=str),
+        criado_em=np.array(dados["criado_em"], dtype=np.float64),
+        area=inteiros("area", np.int16),
+        questao=inteiros("questao", np.int16),
+        alternativa_marcada=inteiros("alternativa_marcada", np.int8),
+        alternativa_correta=inteiros("alternativa_correta", np.int8),
+        correto=inteiros("correto", np.int8),
+        preenchimento=matriz,
+    )
+    return saida.getvalue()
+
+
+def _ler_filtros(args) -> Tuple[str, str, Optional[str]]:
+    prova_id, erro = validar_identificador(args.get("prova_id"), "prova_id")
+    if erro:
+        return "", "", erro
+    aluno_id, erro = validar_identificador(args.get("aluno_id"), "aluno_id")
+    return prova_id, aluno_id, erro
+
+
+def listar_resultados_request(args) -> Tuple[Dict[str, Any], int]:
+    """Trata ``GET /api/interno/resultados``."""
+    prova_id, aluno_id, erro = _ler_filtros(args)
+    if erro:
+        return {"status": "bad_request", "message": erro}, 400
+    try:
+        limite = int(args.get("limite", DEFAULT_LIMIT))
+        deslocamento = int(args.get("deslocamento", 0))
+    except ValueError:
+        return {"status": "bad_request", "message": "Os parâmetros 'limite' e 'deslocamento' devem ser inteiros."}, 400
+    if not 0 < limite <= MAX_LIMIT or deslocamento < 0:
+        return {"status": "bad_request", "message": f"'limite' deve estar entre 1 e {MAX_LIMIT} e 'deslocamento' não pode ser negativo."}, 400
+
+    folhas = consultar_resultados(prova_id, aluno_id, limite, deslocamento)
+    return {"status": "success", "total": len(folhas), "folhas": folhas}, 200
+
+
+def exportar_resultados_request(args) -> Tuple[Any, int]:
+    """
+    Trata ``GET /api/interno/resultados/exportar``.
+
+    Returns:
+        ((conteúdo, mimetype, nome do arquivo), 200) ou (dict de erro, status)
+    """
+    prova_id, aluno_id, erro = _ler_filtros(args)
+    if erro:
+        return {"status": "bad_request", "message": erro}, 400
+    formato = (args.get("formato") or "csv").strip().lower()
+    if formato not in EXPORT_FORMATS:
+        return {"status": "bad_request", "message": f"Formato inválido. Use: {', '.join(EXPORT_FORMATS)}"}, 400
+
+    nome = "resultados" + (f"-{prova_id}" if prova_id else "") + (f"-{aluno_id}" if aluno_id else "")
+    nome = "".join(c if c.isalnum() or c in "-_" else "_" for c in nome)
+    if formato == "csv":
+        return (exportar_csv(prova_id, aluno_id), "text/csv; charset=utf-8", f"{nome}.csv"), 200
+    return (exportar_colunar(prova_id, aluno_id), "application/octet-stream", f"{nome}.npz"), 200
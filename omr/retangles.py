@@ -10,7 +10,8 @@ class RectangleDetector:
         self.grouped = []
 
     def detect(self):
-        contours, _ = cv2.findContours(self.thresh.copy(), cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+        # Desde o OpenCV 3.2 o findContours não altera a imagem: dispensa a cópia
+        contours, _ = cv2.findContours(self.thresh, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
         for cnt in contours:
             peri = cv2.arcLength(cnt, True)
             approx = cv2.approxPolyDP(cnt, 0.02 * peri, True)
@@ -30,6 +31,11 @@ class RectangleDetector:
             
         return self.grouped
 
+    def filter_aspect(self, ratio, tolerance):
+        # Descarta retângulos cuja proporção (largura/altura) foge da esperada
+        self.grouped = [r for r in self.grouped if abs((r[2] / float(r[3])) / ratio - 1) <= tolerance]
+        return self.grouped
+
     def get_rois(self, source_img=None, as_thresh=True):
         rois = []
         img = self.thresh if as_thresh or source_img is None else source_img
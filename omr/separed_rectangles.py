@@ -1,37 +1,75 @@
 from .preprocessor import DocumentProcessor
 from .retangles import RectangleDetector
+from .layout import TOLERANCIA_PROPORCAO
 import cv2
 
-def get_retangles(IMAGE_PATH, min_size=100):
+from log_config import get_logger
+
+logger = get_logger("omr.rectangles")
+
+def _detectar(processor, min_size, max_size, proporcao):
+    """Binariza a folha alinhada (``processor.warped``) e recorta os retângulos."""
+    processor.apply_thresholding(blur_ksize=(3, 3), block_size=5, C=3)
+    processor.apply_morphological_closing(kernel_size=4)
+
+    # Detecção de retângulos
+    detector = RectangleDetector(processor.processed_image, min_size=min_size, max_size=max_size)
+    detector.detect()
+    detector.group()
+    if proporcao:
+        detector.filter_aspect(proporcao, TOLERANCIA_PROPORCAO)
+    logger.debug("%d retângulos encontrados", len(detector.grouped))
+
+    # Extrai os ROIs coloridos a partir da imagem corrigida
+    return detector.get_rois(source_img=processor.warped, as_thresh=False)
+
+
+def get_retangles(IMAGE_PATH, min_size=100, max_size=800, target_width=800, proporcao=None,
+                  modo_captura="foto", esperados=None, enxuto=False):
     """
     Detecta retângulos na imagem fornecida e retorna os recortes (ROIs) em memória.
 
     Args:
-        IMAGE_PATH (str): Caminho para a imagem de entrada.
+        IMAGE_PATH (str ou numpy.ndarray): Caminho da imagem de entrada ou a
+            imagem BGR já carregada.
         min_size (int): Tamanho mínimo do retângulo.
+        max_size (int): Tamanho máximo do retângulo.
+        target_width (int): Largura em que a folha é processada.
+        proporcao (float): Se informada, só mantém os retângulos com essa
+            proporção (largura/altura), com tolerância de TOLERANCIA_PROPORCAO.
+        modo_captura (str): ``foto`` (correção de perspectiva), ``scanner``
+            (só uma pequena rotação, ver ``DocumentProcessor.deskew``) ou
+            ``auto`` (scanner se a imagem parecer digitalizada).
+        esperados (int): No modo ``auto``, se o caminho de scanner não achar
+            esse número de retângulos, a folha é refeita como foto.
+        enxuto (bool): Modo enxuto (omr/memory.py): os ROIs são views sobre
+            buffers da thread, válidos até a próxima folha.
 
     Returns:
-        list of numpy.ndarray: Lista de imagens ROI (coloridas) dos retângulos detectados.
+        list of numpy.ndarray: Lista de imagens ROI (coloridas, ou em tons de
+        cinza se a imagem de entrada for) dos retângulos detectados.
     """
-    print(f"[INFO] Processando a imagem: {IMAGE_PATH}")
     # Processamento do documento
-    processor = DocumentProcessor(image_path=IMAGE_PATH)
+    if isinstance(IMAGE_PATH, str):
+        logger.debug("Processando a imagem: %s", IMAGE_PATH)
+        processor = DocumentProcessor(image_path=IMAGE_PATH, target_width=target_width, enxuto=enxuto)
+    else:
+        processor = DocumentProcessor(image=IMAGE_PATH, target_width=target_width, enxuto=enxuto)
     processor.load_and_resize()
-    processor.correct_perspective()
-    processor.apply_thresholding(blur_ksize=(3, 3), block_size=5, C=3)
-    processor.apply_morphological_closing(kernel_size=4)
 
-    # Detecção de retângulos
-    detector = RectangleDetector(processor.processed_image, min_size=min_size)
-    detector.detect()
-    detector.group()
-    print(f"[INFO] {len(detector.grouped)} retângulos encontrados.")
-
-    # Extrai os ROIs coloridos a partir da imagem corrigida
-    color_rois = detector.get_rois(source_img=processor.warped, as_thresh=False)
+    scanner = modo_captura == "scanner" or (modo_captura == "auto" and processor.parece_digitalizada())
+    if not scanner:
+        processor.correct_perspective()
+        return _detectar(processor, min_size, max_size, proporcao)
 
-    # Retorna a lista de ROIs em memória
-    return color_rois
+    processor.deskew(min_size=min_size)
+    rois = _detectar(processor, min_size, max_size, proporcao)
+    if modo_captura == "auto" and esperados and len(rois) != esperados:
+        logger.debug("Caminho de scanner achou %d retângulos (esperado: %d); refazendo com correção de perspectiva.",
+                    len(rois), esperados)
+        processor.correct_perspective()
+        rois = _detectar(processor, min_size, max_size, proporcao)
+    return rois
 
 if __name__ == "__main__":
     rois = get_retangles("prova5.jpeg", min_size=100)
@@ -1,34 +1,79 @@
 import os
 import tempfile
 import json
+import hashlib
 import cv2
 import numpy as np
 from typing import Tuple, Optional, Dict, Any
 
+from log_config import get_logger
+
 from . import get_retangles, OMRGrader, transformar_gabaritos
+from .answer_keys import carregar_gabarito
+from .compact import FORMATO_COMPACTO, compactar_resultado, interpretar_formato
+from .layout import LayoutFolha, interpretar_layout
+from .memory import MODO_ENXUTO, PicoMemoria, decodificar_cinza
+from .results_store import RESULTS_STORE_ENABLED, montar_registro, registrar_folha, validar_identificador
+
+logger = get_logger("omr.service")
 
 # Configurações da API
-UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
 
-# Certifique-se de que a pasta de upload existe
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+# Como a folha foi capturada: foto (correção de perspectiva), scanner (só uma
+# pequena rotação) ou auto (scanner se a imagem parecer digitalizada)
+MODOS_CAPTURA = ("auto", "foto", "scanner")
+MODO_CAPTURA_PADRAO = os.getenv("OMR_MODO_CAPTURA", "foto")
 
 
 def allowed_file(filename: str) -> bool:
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
-def process_omr_image(image_path: str, NUM_ALTERNATIVAS: int = 4, GABARITOS: Optional[list] = None) -> Dict[str, Any]:
+def interpretar_modo_captura(valor: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Valida o campo ``modo_captura`` do formulário.
+
+    Returns:
+        (modo, None) — ``OMR_MODO_CAPTURA`` se o campo não veio — ou (None, mensagem de erro)
+    """
+    modo = (valor or MODO_CAPTURA_PADRAO).strip().lower()
+    if modo not in MODOS_CAPTURA:
+        return None, f"'modo_captura' deve ser {', '.join(MODOS_CAPTURA[:-1])} ou {MODOS_CAPTURA[-1]}."
+    return modo, None
+
+
+def process_omr_image(image_path, NUM_ALTERNATIVAS: int = 4, GABARITOS: Optional[list] = None,
+                      brutos: Optional[Dict[int, Dict[str, Any]]] = None,
+                      layout: Optional[LayoutFolha] = None,
+                      modo_captura: str = "foto",
+                      enxuto: Optional[bool] = None) -> Dict[str, Any]:
     """
     Processa a imagem OMR e retorna os resultados.
-    Apenas retorna resultados se exatamente 2 retângulos forem detectados
-    e todas as bolhas esperadas forem encontradas em cada retângulo.
+    Apenas retorna resultados se forem detectados exatamente os retângulos do
+    layout (2 no padrão) e todas as bolhas esperadas forem encontradas em cada
+    retângulo. Sem ``layout``, usa o padrão com ``NUM_ALTERNATIVAS``.
+
+    ``image_path`` pode ser o caminho da imagem ou a imagem BGR já
+    decodificada (ex.: uma view em memória compartilhada, ver omr/pool.py).
+
+    Se ``brutos`` for informado, recebe o resultado do OMRGrader de cada área
+    (por número da área), com o preenchimento de cada bolha.
+
+    ``modo_captura`` escolhe o alinhamento da folha (ver ``get_retangles``).
+    ``enxuto`` (padrão: ``OMR_MODO_ENXUTO``) usa os buffers reaproveitados
+    de omr/memory.py; a imagem pode estar em tons de cinza em qualquer modo.
     """
+    if enxuto is None:
+        enxuto = MODO_ENXUTO
+    if layout is None:
+        layout = LayoutFolha(alternativas=NUM_ALTERNATIVAS)
+    NUM_ALTERNATIVAS = layout.alternativas
+
     try:
         # Tenta ler a imagem
         try:
-            image = cv2.imread(image_path)
+            image = cv2.imread(image_path) if isinstance(image_path, str) else image_path
             if image is None:
                 return {"status": "no_image", "message": "Não foi possível ler a imagem"}
         except Exception as e:
@@ -36,15 +81,22 @@ def process_omr_image(image_path: str, NUM_ALTERNATIVAS: int = 4, GABARITOS: Opt
 
         # Tenta detectar áreas de resposta
         try:
-            rois_encontrados = get_retangles(image_path, min_size=100)
+            # A imagem já lida segue para a detecção (sem decodificar o arquivo de novo)
+            rois_encontrados = get_retangles(
+                image, min_size=layout.tamanho_min_area, max_size=layout.tamanho_max_area,
+                target_width=layout.largura_folha, proporcao=layout.proporcao_area,
+                modo_captura=modo_captura, esperados=layout.areas, enxuto=enxuto
+            )
         except Exception as e:
             return {"status": "detection_error", "message": f"Erro na detecção de áreas: {str(e)}"}
+        # Daqui em diante só os recortes das áreas são usados
+        image = None
         
-        # Verifica se exatamente 2 retângulos foram encontrados
-        if not rois_encontrados or len(rois_encontrados) != 2:
+        # Verifica se foram encontrados exatamente os retângulos do layout
+        if not rois_encontrados or len(rois_encontrados) != layout.areas:
             return {
                 "status": "invalid_rectangles", 
-                "message": f"Número incorreto de retângulos detectados. Esperado: 2, Encontrado: {len(rois_encontrados) if rois_encontrados else 0}"
+                "message": f"Número incorreto de retângulos detectados. Esperado: {layout.areas}, Encontrado: {len(rois_encontrados) if rois_encontrados else 0}"
             }
         
         resultados = []
@@ -62,13 +114,18 @@ def process_omr_image(image_path: str, NUM_ALTERNATIVAS: int = 4, GABARITOS: Opt
                 grader = OMRGrader(
                     answer_key=gabarito_atual,
                     num_alternativas=NUM_ALTERNATIVAS,
-                    debug_mode=False
+                    debug_mode=False,
+                    tamanho_normalizado=layout.tamanho_normalizado(len(gabarito_atual)),
+                    enxuto=enxuto
                 )
                 
                 # Processa a área
                 resultado = grader.processar_prova(roi_imagem, roi_index=i)
                 
                 if resultado:
+                    if brutos is not None:
+                        brutos[i + 1] = resultado
+
                     # Verifica se detectou todas as bolhas esperadas
                     bolhas_detectadas = resultado["bubble_count"]
                     todas_bolhas_detectadas = (bolhas_detectadas == total_bolhas_esperado)
@@ -157,49 +214,150 @@ def process_omr_image(image_path: str, NUM_ALTERNATIVAS: int = 4, GABARITOS: Opt
         }
 
 
-def process_request(file_storage, gabarito_json_str: Optional[str]) -> Tuple[Dict[str, Any], int]:
+def preparar_gabaritos(gabarito_json_str: Optional[str], gabarito_id: Optional[str],
+                       layout_json_str: Optional[str]) -> Tuple[Optional[list], Optional[LayoutFolha],
+                                                                Optional[Tuple[Dict[str, Any], int]]]:
+    """
+    Valida o layout e o gabarito (JSON ou registrado) de uma correção.
+
+    Returns:
+        (GABARITOS, layout, None) ou (None, None, (resposta de erro, status HTTP))
+    """
+    layout, erro = interpretar_layout(layout_json_str)
+    if erro:
+        return None, None, ({"status": "bad_request", "message": erro}, 400)
+
+    if gabarito_id:
+        # Gabarito registrado em /api/gabaritos: já compilado em arrays
+        gabarito = carregar_gabarito(gabarito_id)
+        if gabarito is None:
+            return None, None, ({"status": "not_found", "message": f"Gabarito '{gabarito_id}' não encontrado."}, 404)
+        if not layout_json_str:
+            # O layout do registro ou, sem ele, as áreas e questões do próprio gabarito
+            layout = gabarito.layout
+        elif layout.alternativas != gabarito.num_alternativas:
+            return None, None, ({"status": "bad_request", "message": f"O gabarito '{gabarito_id}' tem {gabarito.num_alternativas} alternativas por questão e o layout, {layout.alternativas}."}, 400)
+        GABARITOS = gabarito.areas
+    else:
+        if not gabarito_json_str:
+            return None, None, ({"status": "bad_request", "message": "O campo 'gabarito' (ou 'gabarito_id') é obrigatório no formulário."}, 400)
+
+        try:
+            gabarito_recebido = json.loads(gabarito_json_str)
+        except json.JSONDecodeError:
+            return None, None, ({"status": "bad_request", "message": "O gabarito fornecido não é um JSON válido."}, 400)
+        except Exception as e:
+            return None, None, ({"status": "processing_error", "message": f"Erro ao processar o gabarito: {str(e)}"}, 500)
+
+        GABARITOS = transformar_gabaritos(gabarito_recebido, layout.alternativas)
+        if isinstance(GABARITOS, dict):
+            # Letra ou questão inválida no gabarito
+            return None, None, (GABARITOS, 400)
+
+    if layout_json_str and len(GABARITOS) != layout.areas:
+        # Áreas a mais seriam ignoradas e a folha sairia como success
+        return None, None, ({"status": "bad_request", "message": f"O gabarito tem {len(GABARITOS)} área(s) e o layout, {layout.areas}."}, 400)
+    if layout.questoes and [len(g) for g in GABARITOS] != layout.questoes[:len(GABARITOS)]:
+        return None, None, ({"status": "bad_request", "message": f"O gabarito não corresponde às questões por área do layout ({layout.questoes})."}, 400)
+    return GABARITOS, layout, None
+
+
+def registrar_resultado(resultado: Dict[str, Any], brutos: Dict[int, Dict[str, Any]], file_data: bytes,
+                        prova_id: str, aluno_id: str, gabarito_id: Optional[str]) -> None:
+    """Envia a folha corrigida ao armazenamento de resultados (omr/results_store.py)."""
+    if RESULTS_STORE_ENABLED and (prova_id or aluno_id) and "resultados" in resultado:
+        registrar_folha(montar_registro(
+            resultado, brutos, hashlib.sha256(file_data).hexdigest(),
+            prova_id=prova_id, aluno_id=aluno_id, gabarito_id=gabarito_id,
+        ))
+
+
+def _processar_via_arquivo(file_data: bytes, GABARITOS, brutos: Dict[int, Dict[str, Any]],
+                           layout: LayoutFolha, modo_captura: str) -> Dict[str, Any]:
+    """Corrige a folha regravada como JPEG temporário (caminho padrão)."""
+    nparr = np.frombuffer(file_data, np.uint8)
+    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+
+    # Create a temporary file
+    with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp_file:
+        temp_filename = temp_file.name
+        cv2.imwrite(temp_filename, img)
+
+    try:
+        # Process the OMR image
+        return process_omr_image(temp_filename, GABARITOS=GABARITOS, brutos=brutos, layout=layout,
+                                 modo_captura=modo_captura)
+    finally:
+        # Clean up the temporary file
+        try:
+            os.unlink(temp_filename)
+        except Exception:
+            pass
+
+
+def _processar_enxuto(file_data: bytes, GABARITOS, brutos: Dict[int, Dict[str, Any]],
+                      layout: LayoutFolha, modo_captura: str) -> Dict[str, Any]:
+    """Modo enxuto (omr/memory.py): cinza na largura de processamento, sem arquivo temporário."""
+    with PicoMemoria() as memoria:
+        img = decodificar_cinza(file_data, layout.largura_folha)
+        if img is None:
+            resultado = {"status": "no_image", "message": "Não foi possível ler a imagem"}
+        else:
+            resultado = process_omr_image(img, GABARITOS=GABARITOS, brutos=brutos, layout=layout,
+                                          modo_captura=modo_captura, enxuto=True)
+        img = None
+    resumo = memoria.resumo()
+    if resumo is not None:
+        # Sem /proc (fora do Linux) a medição não existe e o campo não aparece
+        resultado["memoria"] = resumo
+    logger.debug("Folha corrigida no modo enxuto: %s", resumo)
+    return resultado
+
+
+def process_request(file_storage, gabarito_json_str: Optional[str],
+                    gabarito_id: Optional[str] = None, prova_id: Optional[str] = None,
+                    aluno_id: Optional[str] = None,
+                    layout_json_str: Optional[str] = None,
+                    formato_resposta: Optional[str] = None,
+                    modo_captura: Optional[str] = None) -> Tuple[Dict[str, Any], int]:
     if not file_storage:
         return {"status": "no_file", "message": "Nenhum arquivo enviado"}, 200
 
     if file_storage.filename == '':
         return {"status": "no_file", "message": "Nenhum arquivo selecionado"}, 200
 
-    if not gabarito_json_str:
-        return {"status": "bad_request", "message": "O campo 'gabarito' é obrigatório no formulário."}, 400
-
-    try:
-        gabarito_recebido = json.loads(gabarito_json_str)
-    except json.JSONDecodeError:
-        return {"status": "bad_request", "message": "O gabarito fornecido não é um JSON válido."}, 400
-    except Exception as e:
-        return {"status": "processing_error", "message": f"Erro ao processar o gabarito: {str(e)}"}, 500
+    GABARITOS, layout, erro = preparar_gabaritos(gabarito_json_str, gabarito_id, layout_json_str)
+    if erro:
+        return erro
+    formato, erro = interpretar_formato(formato_resposta)
+    if erro:
+        return {"status": "bad_request", "message": erro}, 400
+    modo_captura, erro = interpretar_modo_captura(modo_captura)
+    if erro:
+        return {"status": "bad_request", "message": erro}, 400
 
-    GABARITOS = transformar_gabaritos(gabarito_recebido)
+    # Identificação da folha no armazenamento de resultados (omr/results_store.py)
+    prova_id, erro = validar_identificador(prova_id or gabarito_id, "prova_id")
+    if erro:
+        return {"status": "bad_request", "message": erro}, 400
+    aluno_id, erro = validar_identificador(aluno_id, "aluno_id")
+    if erro:
+        return {"status": "bad_request", "message": erro}, 400
 
     if file_storage and allowed_file(file_storage.filename):
         try:
             # Read image file directly from memory
             file_data = file_storage.read()
-            nparr = np.frombuffer(file_data, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-
-            # Create a temporary file
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp_file:
-                temp_filename = temp_file.name
-                cv2.imwrite(temp_filename, img)
-
-            try:
-                # Process the OMR image
-                resultado = process_omr_image(temp_filename, NUM_ALTERNATIVAS=4, GABARITOS=GABARITOS)
-                return resultado, 200
-            finally:
-                # Clean up the temporary file
-                try:
-                    os.unlink(temp_filename)
-                except Exception:
-                    pass
+            brutos = {}
+            if MODO_ENXUTO:
+                resultado = _processar_enxuto(file_data, GABARITOS, brutos, layout, modo_captura)
+            else:
+                resultado = _processar_via_arquivo(file_data, GABARITOS, brutos, layout, modo_captura)
+            registrar_resultado(resultado, brutos, file_data, prova_id, aluno_id, gabarito_id)
+            if formato == FORMATO_COMPACTO:
+                resultado = compactar_resultado(resultado, brutos)
+            return resultado, 200
         except Exception as e:
             return {"status": "processing_error", "message": f"Erro ao processar a imagem: {str(e)}"}, 200
 
     return {"status": "invalid_file_type", "message": f"Tipo de arquivo não permitido. Use: {', '.join(ALLOWED_EXTENSIONS)}"}, 200
-
@@ -0,0 +1,45 @@
+import cv2
+import numpy as np
+
+# Geometria da folha sintética (pixels), na escala em que o pipeline trabalha
+LARGURA_FOLHA = 800
+ALTURA_FOLHA = 1100
+LARGURA_AREA = 320
+ALTURA_AREA = 730
+MARGEM_TOPO = 150
+INICIO_AREAS = (60, 420)
+RAIO_BOLHA = 15
+ESPACO_QUESTOES = 70
+ESPACO_ALTERNATIVAS = 70
+
+
+def gerar_folha_sintetica(respostas_por_area, num_alternativas=4):
+    """
+    Desenha uma folha de respostas mínima que o pipeline do OMR reconhece.
+
+    Usada no aquecimento dos workers (e em testes manuais): duas áreas
+    retangulares com uma bolha preenchida por questão.
+
+    Args:
+        respostas_por_area (list of list of int): Para cada área, o índice da
+            alternativa marcada em cada questão (0 = a). No máximo 10 questões.
+        num_alternativas (int): Bolhas por questão (no máximo 4).
+
+    Returns:
+        tuple: (imagem BGR, gabarito em letras no formato do endpoint)
+    """
+    imagem = np.full((ALTURA_FOLHA, LARGURA_FOLHA, 3), 255, np.uint8)
+    gabarito = []
+
+    for x0, respostas in zip(INICIO_AREAS, respostas_por_area):
+        cv2.rectangle(imagem, (x0, MARGEM_TOPO), (x0 + LARGURA_AREA, MARGEM_TOPO + ALTURA_AREA), (0, 0, 0), 4)
+        for q, marcada in enumerate(respostas):
+            cy = MARGEM_TOPO + 45 + q * ESPACO_QUESTOES
+            for j in range(num_alternativas):
+                centro = (x0 + 55 + j * ESPACO_ALTERNATIVAS, cy)
+                cv2.circle(imagem, centro, RAIO_BOLHA, (0, 0, 0), 2)
+                if j == marcada:
+                    cv2.circle(imagem, centro, RAIO_BOLHA, (0, 0, 0), -1)
+        gabarito.append({str(q + 1): chr(ord('a') + marcada) for q, marcada in enumerate(respostas)})
+
+    return imagem, gabarito
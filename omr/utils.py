@@ -1,27 +1,35 @@
 import pprint
 
-def transformar_gabaritos(gabaritos_em_letras):
+from log_config import get_logger
+
+from .layout import LayoutFolha
+
+logger = get_logger("omr.utils")
+
+def transformar_gabaritos(gabaritos_em_letras, num_alternativas=4):
   """
   Converte uma lista de gabaritos do formato com chaves e valores em string
   para um formato com chaves e valores numéricos, com tratamento de erros.
 
-  Mapeamento de respostas: a=0, b=1, c=2, d=3
+  Mapeamento de respostas: a=0, b=1, c=2, d=3 (e=4, ... conforme num_alternativas)
   Mapeamento de questões: "1" -> 0, "2" -> 1, ..., "10" -> 9
 
   Args:
     gabaritos_em_letras: Uma lista de dicionários com respostas em letras.
+    num_alternativas: Alternativas por questão no layout da folha.
 
   Returns:
     Uma lista de dicionários com os gabaritos convertidos para números.
   """
   # Dicionário que mapeia cada letra para seu número correspondente
-  mapeamento_respostas = {'a': 0, 'b': 1, 'c': 2, 'd': 3}
+  layout = LayoutFolha(alternativas=num_alternativas)
+  mapeamento_respostas = {letra: i for i, letra in enumerate(layout.letras)}
   
   gabaritos_numericos = []
 
   # 1. Tratamento de erro: Verifica se a entrada é uma lista
   if not isinstance(gabaritos_em_letras, list):
-      print("Erro Crítico: O formato de entrada deve ser uma lista de gabaritos.")
+      logger.warning("O formato de entrada deve ser uma lista de gabaritos.")
       return [] # Retorna uma lista vazia em caso de erro crítico
 
   # Itera sobre cada gabarito e seu índice na lista de entrada
@@ -29,7 +37,7 @@ def transformar_gabaritos(gabaritos_em_letras):
     
     # 2. Tratamento de erro: Verifica se cada item da lista é um dicionário
     if not isinstance(gabarito_original, dict):
-        print(f"Aviso: O item de índice {i} não é um gabarito válido (dicionário) e foi ignorado.")
+        logger.warning("O item de índice %d não é um gabarito válido (dicionário) e foi ignorado.", i)
         continue # Pula para o próximo item da lista
 
     novo_gabarito = {}
@@ -52,11 +60,11 @@ def transformar_gabaritos(gabaritos_em_letras):
               "message": f"Chave de questão inválida: '{questao_str}' no gabarito de índice {i}. Deve ser um número."
           }
       
-      # 4. Tratamento de erro: Se a letra da resposta não for a, b, c ou d
+      # 4. Tratamento de erro: Se a letra da resposta não for uma das alternativas do layout
       except KeyError:
             return {
                 "status": "bad_request",
-                "message": f"Resposta inválida: '{resposta_letra}' no gabarito de índice {i}. Deve ser 'a', 'b', 'c' ou 'd'."
+                "message": f"Resposta inválida: '{resposta_letra}' no gabarito de índice {i}. Deve ser {layout.letras_validas()}."
             }
     
     # Adiciona o dicionário de gabarito (mesmo que parcial) à lista final
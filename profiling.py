@@ -0,0 +1,202 @@
+"""
+Perfil de execução sob demanda de uma requisição (OMR ou áudio).
+
+Desligado por padrão. Com ``REQUEST_PROFILING=1`` e ``INTERNAL_API_TOKEN``
+definidos, uma requisição com os cabeçalhos ``X-Internal-Token`` (válido) e
+``X-Profile: cprofile`` ou ``X-Profile: sample`` roda sob o profiler:
+
+- ``cprofile``: determinístico (cProfile); grava um ``.prof`` (pstats).
+- ``sample``: amostragem da pilha da thread da requisição a cada
+  ``PROFILE_SAMPLE_INTERVAL_MS``; grava pilhas colapsadas (``.collapsed``,
+  formato do flamegraph.pl/speedscope).
+
+A resposta ganha ``profile`` (arquivo gravado em ``PROFILE_DIR`` e as funções
+mais caras). Só a thread da requisição é observada; trechos transcritos em
+paralelo pelo áudio aparecem como espera.
+
+Uso local, sem servidor::
+
+    python profiling.py imagem.jpg --modo cprofile --gabarito '[{"1": "a"}, {"1": "b"}]'
+"""
+import argparse
+import cProfile
+import json
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from typing import Optional, Dict, Any, List, Callable
+
+from internal import internal_token_ok, INTERNAL_TOKEN_HEADER
+from log_config import current_request_id
+
+PROFILING_ENABLED = os.getenv("REQUEST_PROFILING", "0").strip().lower() in ("1", "true", "yes", "on")
+PROFILE_DIR = os.getenv("PROFILE_DIR") or os.path.join(tempfile.gettempdir(), "florescer-ia-profiles")
+SAMPLE_INTERVAL_SECONDS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "1")) / 1000.0
+PROFILE_HEADER = "X-Profile"
+PROFILE_MODES = ("cprofile", "sample")
+# Quantas funções/pilhas vão no resumo da resposta
+TOP_ENTRIES = 15
+
+
+def _frame_name(code) -> str:
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class StackSampler:
+    """Amostra a pilha de uma thread em intervalos fixos (pilhas colapsadas)."""
+
+    def __init__(self, thread_id: int, interval: float = SAMPLE_INTERVAL_SECONDS):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def __enter__(self) -> "StackSampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def top(self, limit: int = TOP_ENTRIES) -> List[Dict[str, Any]]:
+        """Funções em que a thread mais esteve (tempo próprio, em amostras)."""
+        leaves: Counter = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        total = sum(leaves.values()) or 1
+        return [
+            {"function": name, "samples": count, "percent": round(100.0 * count / total, 1)}
+            for name, count in leaves.most_common(limit)
+        ]
+
+
+def _cprofile_top(profiler: cProfile.Profile, limit: int = TOP_ENTRIES) -> List[Dict[str, Any]]:
+    """Funções com maior tempo acumulado."""
+    stats = pstats.Stats(profiler)
+    entries = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:limit]
+    return [
+        {
+            "function": f"{os.path.basename(filename)}:{line}({name})",
+            "calls": calls,
+            "tottime": round(tottime, 4),
+            "cumtime": round(cumtime, 4),
+        }
+        for (filename, line, name), (_, calls, tottime, cumtime, _) in entries
+    ]
+
+
+def _output_path(label: str, extension: str) -> str:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    request_id = current_request_id() or f"{os.getpid()}"
+    return os.path.join(PROFILE_DIR, f"{stamp}-{label}-{request_id}.{extension}")
+
+
+def profile_call(mode: str, label: str, fn: Callable, *args, **kwargs):
+    """
+    Executa ``fn`` sob o profiler.
+
+    Returns:
+        (retorno de ``fn``, resumo do perfil com ``mode``, ``file``,
+        ``wall_seconds`` e ``top``)
+    """
+    started = time.perf_counter()
+    if mode == "sample":
+        with StackSampler(threading.get_ident()) as sampler:
+            value = fn(*args, **kwargs)
+        path = _output_path(label, "collapsed")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(sampler.collapsed())
+        top = sampler.top()
+        extra = {"samples": sum(sampler.stacks.values())}
+    else:
+        profiler = cProfile.Profile()
+        value = profiler.runcall(fn, *args, **kwargs)
+        path = _output_path(label, "prof")
+        profiler.dump_stats(path)
+        top = _cprofile_top(profiler)
+        extra = {}
+    return value, {
+        "mode": mode,
+        "file": path,
+        "wall_seconds": round(time.perf_counter() - started, 4),
+        **extra,
+        "top": top,
+    }
+
+
+def requested_profile(headers) -> Optional[str]:
+    """Modo pedido em ``X-Profile``, se o perfil estiver habilitado e o token for válido."""
+    mode = (headers.get(PROFILE_HEADER) or "").strip().lower()
+    if mode not in PROFILE_MODES or not internal_token_ok(headers.get(INTERNAL_TOKEN_HEADER)):
+        return None
+    return mode
+
+
+def call_with_profile(headers, label: str, fn: Callable, *args, **kwargs):
+    """
+    Chama ``fn`` (que devolve ``(resultado, status)``), sob o profiler se pedido.
+
+    Com ``REQUEST_PROFILING`` desligado é só a chamada direta.
+    """
+    if not PROFILING_ENABLED:
+        return fn(*args, **kwargs)
+    mode = requested_profile(headers)
+    if mode is None:
+        return fn(*args, **kwargs)
+    (result, status), profile = profile_call(mode, label, fn, *args, **kwargs)
+    result["profile"] = profile
+    return result, status
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Perfil de process_omr_image numa imagem.")
+    parser.add_argument("imagem", help="Caminho da imagem da prova")
+    parser.add_argument("--modo", choices=PROFILE_MODES, default="cprofile")
+    parser.add_argument("--gabarito", help='Gabarito em JSON, como no endpoint (ex.: \'[{"1": "a"}, {"1": "b"}]\')')
+    parser.add_argument("--questoes", type=int, default=10,
+                        help="Sem --gabarito: questões por área num gabarito fictício (padrão 10)")
+    parser.add_argument("--repeticoes", type=int, default=1, help="Quantas vezes processar a imagem")
+    args = parser.parse_args(argv)
+
+    from omr.service import process_omr_image
+    from omr.utils import transformar_gabaritos
+
+    gabarito = json.loads(args.gabarito) if args.gabarito else [
+        {str(q + 1): "a" for q in range(args.questoes)} for _ in range(2)
+    ]
+    gabaritos = transformar_gabaritos(gabarito)
+
+    def run():
+        for _ in range(args.repeticoes):
+            result = process_omr_image(args.imagem, NUM_ALTERNATIVAS=4, GABARITOS=gabaritos)
+        return result
+
+    result, profile = profile_call(args.modo, "cli-omr", run)
+    print(f"status: {result.get('status')} | {profile['wall_seconds']} s | perfil em {profile['file']}")
+    for entry in profile["top"]:
+        print("  " + "  ".join(f"{key}={value}" for key, value in entry.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
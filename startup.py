@@ -0,0 +1,95 @@
+"""
+Inicialização dos workers: carga dos subsistemas, aquecimento e prontidão.
+
+As rotas importam o OMR (OpenCV/NumPy) e a análise de áudio (cliente da
+OpenAI) só quando são chamadas, então um worker sobe em milissegundos. Com
+``gunicorn --preload`` (``GUNICORN_PRELOAD=1``, ver ``gunicorn.conf.py``) os
+subsistemas são importados uma vez no processo mestre e herdados pelos
+workers no fork. Com ``WARMUP=1`` cada worker processa uma folha sintética
+antes de atender (a primeira chamada ao OpenCV inicializa bibliotecas e
+buffers); ``/pronto`` responde 503 até isso terminar.
+"""
+import importlib
+import os
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, Any, Iterable
+
+from log_config import get_logger
+
+logger = get_logger("startup")
+
+SUBSYSTEMS = {
+    "omr": "omr.service",
+    "omr_batch": "omr.batch_service",
+    "audio": "audio_converter.audio_service",
+    "audio_batch": "audio_converter.batch_service",
+}
+WARMUP_ENABLED = os.getenv("WARMUP", "0").strip().lower() in ("1", "true", "yes", "on")
+
+_warmup_lock = threading.Lock()
+_warmup: Dict[str, Any] = {"status": "pending"}
+
+
+def load_subsystems(names: Iterable[str] = SUBSYSTEMS) -> Dict[str, float]:
+    """Importa os subsistemas pedidos; devolve o tempo de cada um (s)."""
+    timings = {}
+    for name in names:
+        started = time.perf_counter()
+        importlib.import_module(SUBSYSTEMS[name])
+        timings[name] = round(time.perf_counter() - started, 3)
+    logger.info("Subsistemas carregados: %s", timings)
+    return timings
+
+
+def warmup() -> Dict[str, Any]:
+    """
+    Passa uma folha sintética pelo pipeline do OMR (idempotente).
+
+    Returns:
+        ``{"status": "done" | "failed", "seconds", "omr_status"}``
+    """
+    with _warmup_lock:
+        if _warmup["status"] != "pending":
+            return _warmup
+
+        started = time.perf_counter()
+        try:
+            from omr.service import process_omr_image
+            from omr.synthetic import gerar_folha_sintetica
+            from omr.utils import transformar_gabaritos
+            import cv2
+
+            respostas = [[q % 4 for q in range(5)], [(q + 1) % 4 for q in range(5)]]
+            imagem, gabarito = gerar_folha_sintetica(respostas)
+            with tempfile.NamedTemporaryFile(delete=False, suffix=".png") as tmp:
+                caminho = tmp.name
+            try:
+                cv2.imwrite(caminho, imagem)
+                resultado = process_omr_image(caminho, NUM_ALTERNATIVAS=4, GABARITOS=transformar_gabaritos(gabarito))
+            finally:
+                os.unlink(caminho)
+            # Uma folha sintética que não corrige indica problema no pipeline, mas o
+            # worker fica pronto do mesmo jeito (o aquecimento já aconteceu)
+            _warmup.update(status="done", omr_status=resultado.get("status"))
+            if resultado.get("status") != "success":
+                logger.warning("Aquecimento do OMR retornou %s", resultado.get("status"))
+        except Exception:
+            logger.exception("Falha no aquecimento do OMR")
+            _warmup.update(status="failed")
+        _warmup["seconds"] = round(time.perf_counter() - started, 3)
+        logger.info("Aquecimento concluído em %.3f s (%s)", _warmup["seconds"], _warmup["status"])
+        return _warmup
+
+
+def readiness() -> Dict[str, Any]:
+    """Estado do worker para o endpoint de prontidão."""
+    ready = not WARMUP_ENABLED or _warmup["status"] != "pending"
+    return {
+        "status": "ready" if ready else "warming_up",
+        "pid": os.getpid(),
+        "warmup": dict(_warmup) if WARMUP_ENABLED else "disabled",
+        "subsystems": {name: module in sys.modules for name, module in SUBSYSTEMS.items()},
+    }
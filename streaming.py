@@ -0,0 +1,64 @@
+"""
+Respostas em fluxo dos endpoints em lote (NDJSON ou server-sent events).
+
+Com ``stream=ndjson`` (ou ``Accept: application/x-ndjson``) a resposta é um
+objeto JSON por linha; com ``stream=sse`` (ou ``Accept: text/event-stream``),
+um evento SSE por unidade. Cada unidade de trabalho (folha, gravação) sai
+assim que termina, e o ``resumo`` do lote vem por último:
+
+    {"tipo": "resultado", "index": 3, ...}
+    {"tipo": "resultado", "index": 0, ...}
+    {"tipo": "resumo", "status": "success", "summary": {...}}
+
+No SSE o tipo vai na linha ``event:`` e o objeto, em ``data:``. Um erro no
+meio do lote encerra o fluxo com um evento ``erro``.
+"""
+import json
+from typing import Optional, Tuple, Dict, Any, Iterable, Iterator
+
+from log_config import get_logger
+
+logger = get_logger("streaming")
+
+STREAM_MIMETYPES = {
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream",
+}
+# Sem buffer em proxies (nginx) nem cache: cada linha chega ao cliente ao ser escrita
+STREAM_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def requested_stream(value: Optional[str], accept: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Modo de fluxo pedido no campo ``stream`` ou, sem ele, no cabeçalho ``Accept``.
+
+    Returns:
+        (modo ou None para a resposta JSON única, mensagem de erro ou None)
+    """
+    if value:
+        mode = value.strip().lower()
+        if mode not in STREAM_MIMETYPES:
+            return None, f"O campo 'stream' deve ser {' ou '.join(STREAM_MIMETYPES)}."
+        return mode, None
+    accept = (accept or "").lower()
+    for mode, mimetype in STREAM_MIMETYPES.items():
+        if mimetype in accept:
+            return mode, None
+    return None, None
+
+
+def _format(mode: str, tipo: str, dados: Dict[str, Any]) -> str:
+    if mode == "sse":
+        return f"event: {tipo}\ndata: {json.dumps(dados, ensure_ascii=False)}\n\n"
+    return json.dumps({"tipo": tipo, **dados}, ensure_ascii=False) + "\n"
+
+
+def stream_lines(events: Iterable[Tuple[str, Dict[str, Any]]], mode: str) -> Iterator[str]:
+    """Linhas da resposta em fluxo a partir dos eventos ``(tipo, dados)``."""
+    try:
+        for tipo, dados in events:
+            yield _format(mode, tipo, dados)
+    except Exception as e:
+        # O status HTTP já foi enviado: o erro vai como último evento
+        logger.exception("Erro durante a resposta em fluxo")
+        yield _format(mode, "erro", {"status": "processing_error", "message": f"Erro ao processar o lote: {str(e)}"})
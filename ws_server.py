@@ -0,0 +1,46 @@
+"""
+Servidor WebSocket da leitura em tempo real.
+
+    python ws_server.py
+
+Rota: ``ws://<host>:<porta>/api/analisar-audio/stream``. O protocolo está
+descrito em ``audio_converter/stream_service.py``; as origens aceitas são as
+mesmas do Flask (``cors.py``).
+"""
+import asyncio
+import os
+from http import HTTPStatus
+
+from websockets.asyncio.server import serve
+
+from audio_converter.stream_service import handle_stream
+from cors import origin_check
+from log_config import get_logger
+
+logger = get_logger("ws")
+
+STREAM_PATH = "/api/analisar-audio/stream"
+HOST = os.getenv("AUDIO_STREAM_HOST", "0.0.0.0")
+PORT = int(os.getenv("AUDIO_STREAM_PORT", "5002"))
+# Tamanho máximo de cada mensagem de áudio recebida
+MAX_MESSAGE_BYTES = 1024 * 1024
+
+
+def check_request(connection, request):
+    """Recusa caminhos desconhecidos e origens não permitidas antes do handshake."""
+    if request.path != STREAM_PATH:
+        return connection.respond(HTTPStatus.NOT_FOUND, "Not Found\n")
+    if not origin_check(request.headers.get("Origin")):
+        return connection.respond(HTTPStatus.FORBIDDEN, "Origin not allowed\n")
+    return None
+
+
+async def main():
+    async with serve(handle_stream, HOST, PORT, process_request=check_request,
+                     max_size=MAX_MESSAGE_BYTES) as server:
+        logger.info("Leitura em tempo real em ws://%s:%s%s", HOST, PORT, STREAM_PATH)
+        await server.serve_forever()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())